@@ -6,18 +6,38 @@ VERSIÓN ADAPTADA - Compatible con Schema SQL y Workflow n8n
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta, timezone, time
 import json
-from supabase import create_client, Client
+import gzip
+import hashlib
+import asyncio
+from supabase import create_client, Client, ClientOptions
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.elements.lib.form_utils import current_form_id
+from streamlit.elements.lib.utils import compute_and_register_element_id
+from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
 import os
+import pickle
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+from time import sleep
+import uuid
+from collections import OrderedDict, deque
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 import base64
 from io import BytesIO
 from reportlab.lib.pagesizes import letter, A4
-import requests # Importar la librería requests
+import httpx
 import random # Importar random para la función de prueba
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -25,6 +45,11 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 
+try:
+    import zstandard  # Opcional: compresión zstd de los lotes de ingesta
+except ImportError:
+    zstandard = None
+
 
 # ============================================
 # CONFIGURACIÓN INICIAL
@@ -44,8 +69,107 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.e
 # Configuración del Webhook de n8n
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://localhost:5678/webhook-test/fatigue-data-ingestion") # ¡IMPORTANTE! Reemplaza con la URL real de tu webhook de n8n
 
+# Timeouts (segundos) y reintentos para todas las llamadas HTTP salientes
+HTTP_TIMEOUT_CONEXION = 5
+HTTP_TIMEOUT_LECTURA = 20
+HTTP_REINTENTOS = int(os.getenv("HTTP_REINTENTOS", "3"))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAXIMO = 8.0
+HTTP_ESTADOS_REINTENTABLES = {429, 502, 503, 504}
+# Conexiones keep-alive libres que se conservan entre envíos al webhook
+HTTP_MAX_CONEXIONES_LIBRES = int(os.getenv("HTTP_MAX_CONEXIONES_LIBRES", "64"))
+
+def peticion_idempotente(request: httpx.Request) -> bool:
+    """Repetirla no duplica efectos: lecturas, o envíos con Idempotency-Key"""
+    return request.method in ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE') or 'Idempotency-Key' in request.headers
+
+def espera_reintento(intento: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+    """Segundos antes del reintento `intento` (desde 0), o None si ya no quedan.
+
+    Backoff exponencial acotado; un Retry-After numérico del servidor manda.
+    """
+    if intento >= HTTP_REINTENTOS:
+        return None
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    espera = float(retry_after) if retry_after.isdigit() else HTTP_BACKOFF_BASE * (2 ** intento)
+    return min(espera, HTTP_BACKOFF_MAXIMO)
+
+def reintentable(request: httpx.Request, response: Optional[httpx.Response] = None,
+                 error: Optional[Exception] = None) -> bool:
+    """Si vale la pena repetir la petición tras esta respuesta o este error.
+
+    Un fallo al conectar se repite siempre: la petición no llegó a salir. Un
+    429/5xx transitorio o un corte a mitad de respuesta, solo si es idempotente.
+    """
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if error is not None:
+        return isinstance(error, (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)) \
+            and peticion_idempotente(request)
+    return response.status_code in HTTP_ESTADOS_REINTENTABLES and peticion_idempotente(request)
+
+class TransporteConReintentos(httpx.BaseTransport):
+    """Transporte httpx síncrono que aplica reintentable/espera_reintento a cada petición"""
+    
+    def __init__(self, transporte: httpx.BaseTransport):
+        self.transporte = transporte
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        intento = 0
+        while True:
+            try:
+                response = self.transporte.handle_request(request)
+                # El cuerpo se lee aquí: un corte a mitad de respuesta también se reintenta
+                response.read()
+            except httpx.TransportError as e:
+                espera = espera_reintento(intento)
+                if espera is None or not reintentable(request, error=e):
+                    raise
+            else:
+                espera = espera_reintento(intento, response)
+                if espera is None or not reintentable(request, response):
+                    return response
+                response.close()
+            sleep(espera)
+            intento += 1
+    
+    def close(self):
+        self.transporte.close()
+
+def cliente_supabase_vigente(cliente: Client) -> bool:
+    """Chequeo de salud del cliente cacheado: su sesión HTTP sigue abierta y con reintentos.
+
+    Se evalúa en cada rerun, así que no hace llamadas de red; las conexiones
+    caídas las repone el pool de httpx en la siguiente consulta. Si supabase
+    recrea el cliente de PostgREST (p. ej. al cambiar el token), se pierde el
+    transporte con reintentos y el cliente se vuelve a crear.
+    """
+    sesion = cliente.postgrest.session
+    return not sesion.is_closed and isinstance(sesion._transport, TransporteConReintentos)
+
+@st.cache_resource(validate=cliente_supabase_vigente, show_spinner=False)
+def obtener_cliente_supabase(url: str, clave: str) -> Client:
+    """Cliente de Supabase único por proceso, compartido por todas las sesiones.
+
+    Crearlo en cada rerun costaba ~65 ms y abría conexiones nuevas en cada
+    clic; cacheado, las consultas reutilizan el pool keep-alive. Todas las
+    consultas pasan por TransporteConReintentos: las lecturas se reintentan
+    ante fallos transitorios y los inserts/updates solo si no llegaron a
+    conectar, porque PostgREST no los deduplica.
+    """
+    cliente = create_client(
+        url, clave,
+        options=ClientOptions(
+            postgrest_client_timeout=httpx.Timeout(HTTP_TIMEOUT_LECTURA, connect=HTTP_TIMEOUT_CONEXION)
+        )
+    )
+    # httpx no permite envolver el transporte de un cliente ya creado de otra forma
+    sesion = cliente.postgrest.session
+    sesion._transport = TransporteConReintentos(sesion._transport)
+    return cliente
+
 try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase: Client = obtener_cliente_supabase(SUPABASE_URL, SUPABASE_KEY)
 except Exception as e:
     st.error(f"Error conectando a Supabase: {e}")
     st.stop()
@@ -102,32 +226,218 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# ============================================
+# CACHÉ POR TABLA
+# ============================================
+
+# Tabla -> loaders cacheados que leen de ella
+DEPENDENCIAS_CACHE: Dict[str, List] = {}
+
+def depende_de(*tablas: str):
+    """Registra un loader cacheado como dependiente de las tablas indicadas"""
+    def registrar(funcion_cacheada):
+        for tabla in tablas:
+            DEPENDENCIAS_CACHE.setdefault(tabla, []).append(funcion_cacheada)
+        return funcion_cacheada
+    return registrar
+
+def invalidar_cache(*tablas: str):
+    """Descarta solo los loaders cacheados que dependen de las tablas escritas"""
+    for tabla in tablas:
+        for funcion_cacheada in DEPENDENCIAS_CACHE.get(tabla, []):
+            funcion_cacheada.clear()
+
 # ============================================
 # FUNCIONES DE UTILIDAD - ADAPTADAS
 # ============================================
 
-@st.cache_data(ttl=60)
-def get_operator_uuid_by_external_id(external_id):
-    url = f"{SUPABASE_URL}/rest/v1/operadores?select=id&codigo_operador=eq.{external_id}"
-    headers = {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
+def rerun_seccion():
+    """st.rerun del fragmento en curso, o de la app completa si no se está en un rerun de fragmento.
+
+    Un clic dentro de un fragmento normalmente solo vuelve a ejecutar ese
+    fragmento, pero si llega durante una ejecución completa Streamlit no
+    admite scope="fragment".
+    """
+    ctx = get_script_run_ctx()
+    st.rerun(scope="fragment" if ctx is not None and ctx.fragment_ids_this_run else "app")
+
+class PoolWebhook:
+    """Bucle asyncio y conexiones keep-alive al webhook, compartidos por todo el proceso.
+
+    Un hilo en segundo plano corre el bucle donde viven todas las conexiones
+    httpx salientes; el envío masivo, el simulador, el spool y el formulario
+    manual toman conexiones de aquí y las devuelven al terminar, así que el
+    handshake TCP/TLS se paga una vez por conexión y no en cada envío. Cada
+    conexión es un AsyncClient de una sola conexión: el pool compartido de
+    httpx recorre todas sus conexiones en cada petición y se vuelve más lento
+    cuanto mayor es la concurrencia.
+    """
+    
+    def __init__(self, max_libres: int = HTTP_MAX_CONEXIONES_LIBRES):
+        self.max_libres = max_libres
+        self.abiertas = 0
+        self._libres = []  # Solo se toca desde el bucle
+        self.bucle = asyncio.new_event_loop()
+        threading.Thread(target=self.bucle.run_forever, name="bucle-webhook", daemon=True).start()
+    
+    def tomar(self, cantidad: int) -> List[httpx.AsyncClient]:
+        """Presta `cantidad` conexiones, reutilizando las libres (llamar desde el bucle)"""
+        conexiones = [self._libres.pop() for _ in range(min(cantidad, len(self._libres)))]
+        while len(conexiones) < cantidad:
+            conexiones.append(httpx.AsyncClient(
+                timeout=httpx.Timeout(HTTP_TIMEOUT_LECTURA, connect=HTTP_TIMEOUT_CONEXION),
+                limits=httpx.Limits(max_connections=1, max_keepalive_connections=1)
+            ))
+            self.abiertas += 1
+        return conexiones
+    
+    async def devolver(self, conexiones: List[httpx.AsyncClient]):
+        """Devuelve conexiones prestadas; las que exceden el tope de libres se cierran"""
+        for http in conexiones:
+            if len(self._libres) < self.max_libres and not http.is_closed:
+                self._libres.append(http)
+            else:
+                await http.aclose()
+                self.abiertas -= 1
+    
+    def lanzar(self, corrutina):
+        """Programa una corrutina en el bucle sin esperarla (p. ej. el drenador del spool)"""
+        return asyncio.run_coroutine_threadsafe(corrutina, self.bucle)
+    
+    def ejecutar(self, fabrica):
+        """Corre fabrica(en_llamador) en el bucle y espera su resultado en este hilo.
+
+        en_llamador(funcion) envuelve un callback para que, invocado desde el
+        bucle, se ejecute en el hilo que llamó a ejecutar: los callbacks de
+        progreso actualizan elementos de Streamlit y necesitan el contexto de su
+        sesión. Si el hilo llamador se interrumpe (p. ej. un rerun), la
+        corrutina se cancela.
+        """
+        pendientes = queue.SimpleQueue()
+        
+        def en_llamador(funcion):
+            if funcion is None:
+                return None
+            return lambda *args: pendientes.put((funcion, args))
+        
+        futuro = asyncio.run_coroutine_threadsafe(fabrica(en_llamador), self.bucle)
+        try:
+            while True:
+                try:
+                    funcion, args = pendientes.get(timeout=0.05)
+                except queue.Empty:
+                    if futuro.done():
+                        break
+                    continue
+                funcion(*args)
+        except BaseException:
+            futuro.cancel()
+            raise
+        return futuro.result()
+    
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        """POST síncrono con una conexión del pool, para envíos sueltos.
+
+        Se reintenta con la misma política que Supabase (reintentable), así que
+        solo se repite tras un 429/5xx si lleva Idempotency-Key.
+        """
+        async def enviar(en_llamador):
+            [http] = self.tomar(1)
+            try:
+                request = http.build_request('POST', url, **kwargs)
+                intento = 0
+                while True:
+                    try:
+                        response = await http.send(request)
+                    except httpx.TransportError as e:
+                        espera = espera_reintento(intento)
+                        if espera is None or not reintentable(request, error=e):
+                            raise
+                    else:
+                        espera = espera_reintento(intento, response)
+                        if espera is None or not reintentable(request, response):
+                            return response
+                    await asyncio.sleep(espera)
+                    intento += 1
+            finally:
+                await self.devolver([http])
+        return self.ejecutar(enviar)
+
+@st.cache_resource(show_spinner=False)
+def obtener_pool_webhook() -> PoolWebhook:
+    """Pool de conexiones al webhook único por proceso"""
+    return PoolWebhook()
+
+@depende_de('operadores')
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_directorio_operadores() -> Dict:
+    """Directorio de operadores indexado por id y código.
+
+    Es la fuente única para búsquedas de operadores y selectores; se refresca
+    al escribir en operadores.
+    """
+    operadores = []
+    for pagina in obtener_paginado(lambda: consulta('directorio_operadores'), columna_cursor='id'):
+        operadores.extend(pagina)
+    operadores.sort(key=lambda op: (op['nombre'] or '', op['apellido'] or ''))
+    
+    return {
+        'operadores': operadores,
+        'por_id': {op['id']: op for op in operadores},
+        'por_codigo': {op['codigo_operador']: op for op in operadores}
     }
 
-    response = requests.get(url, headers=headers)
+def operadores_activos(directorio: Optional[Dict] = None) -> List[Dict]:
+    """Operadores en estado ACTIVO del directorio, ordenados por nombre"""
+    directorio = directorio or cargar_directorio_operadores()
+    return [op for op in directorio['operadores'] if op['estado'] == 'ACTIVO']
 
-    if response.status_code != 200:
+def get_operator_uuid_by_external_id(external_id):
+    operador = cargar_directorio_operadores()['por_codigo'].get(external_id)
+    if not operador:
         return None
 
-    data = response.json()
-    if not data:
-        return None
+    return operador["id"]  # UUID del operador
 
-    return data[0]["id"]  # UUID del operador
+def generar_datos_simulados(tipo_dispositivo: str, estado: Optional[Dict] = None) -> dict:
+    """Genera datos simulados aleatorios según el tipo de dispositivo.
 
-def generar_datos_simulados(tipo_dispositivo: str) -> dict:
-    """Genera datos simulados aleatorios según el tipo de dispositivo"""
+    Sin estado cada llamada es independiente. Con estado (ver SimuladorFlota)
+    los valores siguen al operador: el sueño previo y la deuda de sueño
+    acumulada, y el avance del turno, bajan la HRV y suben los cabeceos.
+    Los rangos son los mismos en ambos casos.
+    """
+    if estado is not None:
+        horas = estado['horas_turno']
+        deuda = estado['deuda_sueño']
+        fatiga = float(factor_fatiga(horas, deuda))
+        
+        def acotar(valor, minimo, maximo):
+            return min(max(valor, minimo), maximo)
+        
+        def variar(centro, dispersion, minimo, maximo):
+            return acotar(random.gauss(centro, dispersion), minimo, maximo)
+    
     if tipo_dispositivo == 'SMARTWATCH':
+        if estado is not None:
+            sueño = estado['sueño_previo']
+            return {
+                "sleep": {
+                    "duration_hours": round(sueño, 1),
+                    "quality_score": round(variar(95 - 55 * min(deuda, 8.0) / 8.0, 5, 40, 95)),
+                    "deep_minutes": round(acotar(sueño * 13 + random.gauss(0, 8), 30, 120)),
+                    "rem_minutes": round(acotar(sueño * 13 + random.gauss(0, 8), 60, 120)),
+                    "efficiency": round(variar(0.95 - 0.3 * min(deuda, 8.0) / 8.0, 0.03, 0.6, 0.95), 2)
+                },
+                "vitals": {
+                    "heart_rate": round(variar(58 + 40 * fatiga, 4, 55, 100)),
+                    "hrv_rmssd": round(variar(78 - 60 * fatiga, 4, 15.0, 80.0), 1),
+                    "hrv_sdnn": round(variar(96 - 72 * fatiga, 5, 20.0, 100.0), 1),
+                    "spo2": round(variar(98 - 4 * fatiga, 0.8, 90.0, 100.0), 1),
+                    "skin_temp": round(variar(36.3 + 0.6 * fatiga, 0.2, 35.5, 37.5), 1),
+                    "stress_level": round(variar(15 + 70 * fatiga, 6, 10, 90))
+                }
+            }
         return {
             "sleep": {
                 "duration_hours": round(random.uniform(4.0, 9.0), 1),
@@ -146,6 +456,20 @@ def generar_datos_simulados(tipo_dispositivo: str) -> dict:
             }
         }
     elif tipo_dispositivo == 'BANDA_ANTIFATIGA':
+        if estado is not None:
+            return {
+                "posture": {
+                    "trunk_angle": round(variar(5 + 35 * fatiga, 4, 0.0, 45.0), 1),
+                    "head_nods": round(variar(10 * fatiga ** 1.5, 1, 0, 10)),
+                    "micro_sleeps": round(variar(5 * fatiga ** 3, 0.5, 0, 5))
+                },
+                "emg": {
+                    "neck_activity": round(variar(30 + 65 * fatiga, 8, 20, 100))
+                },
+                "movement": {
+                    "inactivity_minutes": round(variar(50 * fatiga, 6, 0, 60))
+                }
+            }
         return {
             "posture": {
                 "trunk_angle": round(random.uniform(0.0, 45.0), 1),
@@ -160,6 +484,18 @@ def generar_datos_simulados(tipo_dispositivo: str) -> dict:
             }
         }
     elif tipo_dispositivo == 'TELEMATICA':
+        if estado is not None:
+            return {
+                "machinery": {"type": estado['maquinaria']},
+                "shift": {
+                    "type": estado['tipo_turno'],
+                    "hours_elapsed": round(acotar(horas, 0.5, 10.0), 1)
+                },
+                "environment": {
+                    "temperature": round(variar(estado['temperatura'], 0.3, 15.0, 40.0), 1),
+                    "humidity": round(variar(55, 10, 20, 90))
+                }
+            }
         return {
             "machinery": {
                 "type": random.choice(["Excavadora", "Camión Minero", "Pala Cargadora", "Bulldozer", "Grúa"])
@@ -175,6 +511,204 @@ def generar_datos_simulados(tipo_dispositivo: str) -> dict:
         }
     return {}
 
+# Tamaño de página de PostgREST (max-rows por defecto en Supabase)
+TAMAÑO_PAGINA_SUPABASE = 1000
+
+def obtener_paginado(construir_consulta, tamaño_pagina: int = TAMAÑO_PAGINA_SUPABASE,
+                     columna_cursor: Optional[str] = None):
+    """Itera los resultados de una consulta por páginas.
+
+    construir_consulta debe devolver una consulta nueva (sin ejecutar) con un
+    orden estable, para que las páginas no se solapen entre sí. Con
+    columna_cursor se pagina por clave (columna > último valor visto) en vez
+    de por offset, lo que mantiene constante el costo de las páginas finales;
+    la columna debe estar incluida en el select.
+    """
+    inicio = 0
+    ultimo = None
+    while True:
+        if columna_cursor:
+            consulta = construir_consulta()
+            if ultimo is not None:
+                consulta = consulta.gt(columna_cursor, ultimo)
+            consulta = consulta.order(columna_cursor).limit(tamaño_pagina)
+        else:
+            consulta = construir_consulta().range(inicio, inicio + tamaño_pagina - 1)
+        filas = consulta.execute().data or []
+        if filas:
+            yield filas
+            ultimo = filas[-1][columna_cursor] if columna_cursor else None
+        if len(filas) < tamaño_pagina:
+            break
+        inicio += tamaño_pagina
+
+def ordenar_embebido(consulta, tabla: str, columna: str, desc: bool = False):
+    """Ordena las filas de un recurso embebido (tabla.order=columna.desc)"""
+    consulta.params = consulta.params.add(
+        f"{tabla}.order", f"{columna}.{'desc' if desc else 'asc'}"
+    )
+    return consulta
+
+# Columnas que pide cada consulta: cada loader declara solo lo que usa
+CONSULTAS: Dict[str, Dict] = {
+    'operadores_ultima_metrica': {
+        'tabla': 'operadores',
+        'columnas': ['id', 'codigo_operador', 'nombre', 'apellido', 'turno_asignado', 'estado',
+                     'metricas_procesadas(indice_fatiga, clasificacion_riesgo, timestamp)']
+    },
+    'directorio_operadores': {
+        'tabla': 'operadores',
+        'columnas': ['id', 'codigo_operador', 'nombre', 'apellido', 'estado', 'turno_asignado']
+    },
+    'alertas_por_operador': {
+        'tabla': 'alertas',
+        'columnas': ['id_operador']
+    },
+    'alertas_activas': {
+        'tabla': 'alertas',
+        'columnas': ['id', 'id_operador', 'tipo_alerta', 'nivel_alerta', 'titulo', 'descripcion',
+                     'indice_fatiga_actual', 'estado', 'timestamp',
+                     'operadores(nombre, apellido, codigo_operador)']
+    },
+    'tendencia_fatiga': {
+        'tabla': 'metricas_procesadas',
+        'columnas': ['timestamp', 'indice_fatiga', 'id_operador']
+    },
+    'metricas_operador': {
+        'tabla': 'metricas_procesadas',
+        'columnas': ['id', 'timestamp', 'indice_fatiga', 'clasificacion_riesgo', 'anomalia_detectada',
+                     'hrv_rmssd', 'spo2', 'frecuencia_cardiaca', 'nivel_estres', 'calidad_sueño',
+                     'horas_turno_actual']
+    },
+    'turnos_activos': {
+        'tabla': 'turnos',
+        'columnas': ['id', 'id_operador', 'tipo_turno', 'fecha_inicio', 'maquinaria_asignada', 'ubicacion',
+                     'operadores(nombre, apellido, codigo_operador)']
+    },
+    'operadores_mantenedor': {
+        'tabla': 'operadores',
+        'columnas': ['id', 'codigo_operador', 'nombre', 'apellido', 'documento_identidad', 'fecha_nacimiento',
+                     'turno_asignado', 'nivel_experiencia', 'tipo_licencia', 'area_trabajo', 'email',
+                     'telefono', 'perfil_riesgo', 'estado', 'created_at']
+    },
+    'dispositivos_mantenedor': {
+        'tabla': 'dispositivos',
+        'columnas': ['id', 'id_dispositivo_externo', 'tipo_dispositivo', 'marca', 'modelo', 'version_firmware',
+                     'frecuencia_muestreo', 'nivel_bateria', 'estado', 'id_operador_asignado',
+                     'ultima_sincronizacion', 'created_at', 'operadores(nombre, apellido, codigo_operador)']
+    },
+    'configuracion_sistema': {
+        'tabla': 'configuracion_sistema',
+        'columnas': ['id', 'clave', 'valor', 'tipo_dato', 'descripcion', 'modificable']
+    },
+    'metricas_reporte': {
+        'tabla': 'metricas_procesadas',
+        'columnas': ['id', 'id_operador', 'indice_fatiga', 'clasificacion_riesgo']
+    },
+    'alertas_reporte': {
+        'tabla': 'alertas',
+        'columnas': ['id', 'nivel_alerta']
+    },
+    'metricas_recalculo': {
+        'tabla': 'metricas_procesadas',
+        'columnas': ['id', 'timestamp', 'indice_fatiga', 'clasificacion_riesgo', 'hrv_rmssd', 'spo2',
+                     'frecuencia_cardiaca', 'nivel_estres', 'calidad_sueño', 'horas_turno_actual']
+    },
+    'paridad_n8n': {
+        'tabla': 'metricas_procesadas',
+        'columnas': ['id', 'id_operador', 'timestamp', 'indice_fatiga', 'clasificacion_riesgo', 'anomalia_detectada']
+    }
+}
+
+def consulta(nombre: str):
+    """Inicia un select que pide solo las columnas declaradas en CONSULTAS"""
+    especificacion = CONSULTAS[nombre]
+    return supabase.table(especificacion['tabla']).select(', '.join(especificacion['columnas']))
+
+# Consultas simultáneas máximas contra Supabase, compartidas por todas las sesiones
+MAX_CONSULTAS_PARALELAS = 8
+
+@st.cache_resource
+def obtener_pool_consultas() -> ThreadPoolExecutor:
+    """Pool de hilos acotado para lanzar consultas independientes en paralelo"""
+    return ThreadPoolExecutor(max_workers=MAX_CONSULTAS_PARALELAS, thread_name_prefix="consultas")
+
+def cargar_en_paralelo(cargas: Dict) -> Dict:
+    """Ejecuta loaders independientes en paralelo y devuelve sus resultados por nombre.
+
+    La latencia total es la de la consulta más lenta, no la suma de todas.
+    Los hilos heredan el contexto de la sesión para que st.cache_data y los
+    mensajes de error sigan funcionando. No anidar: un loader ejecutado aquí
+    no debe volver a llamar a cargar_en_paralelo.
+    """
+    ctx = get_script_run_ctx()
+    
+    def con_contexto(funcion):
+        def ejecutar():
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return funcion()
+        return ejecutar
+    
+    pool = obtener_pool_consultas()
+    futuros = {nombre: pool.submit(con_contexto(funcion)) for nombre, funcion in cargas.items()}
+    return {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+def cargar_ultima_metrica_operadores() -> pd.DataFrame:
+    """Carga operadores activos junto a su última métrica en bloque.
+
+    Usa un recurso embebido limitado a 1 fila por operador, de modo que el
+    número de consultas no crece con el tamaño de la flota.
+    """
+    operadores = []
+    ultimas_metricas = {}
+    for pagina in obtener_paginado(lambda: ordenar_embebido(
+        consulta('operadores_ultima_metrica')
+            .eq('estado', 'ACTIVO')
+            .order('id')
+            .limit(1, foreign_table='metricas_procesadas'),
+        'metricas_procesadas', 'timestamp', desc=True
+    )):
+        for op in pagina:
+            metricas = op.pop('metricas_procesadas', None) or []
+            if metricas:
+                ultimas_metricas[op['id']] = metricas[0]
+            operadores.append(op)
+
+    if not operadores:
+        return pd.DataFrame()
+
+    df_ops = pd.DataFrame(operadores)
+    df_ops['nombre_completo'] = df_ops['nombre'] + ' ' + df_ops['apellido']
+
+    # Índice por id de operador para el cruce local
+    df_metrics = pd.DataFrame.from_dict(
+        ultimas_metricas, orient='index',
+        columns=['indice_fatiga', 'clasificacion_riesgo', 'timestamp']
+    )
+    df_metrics['id_operador'] = df_metrics.index
+    df_result = df_ops.join(df_metrics, on='id')
+    df_result['indice_fatiga_actual'] = df_result['indice_fatiga']
+    df_result['ultima_medicion'] = df_result['timestamp']
+
+    # Contar alertas activas por operador
+    conteo_alertas = {}
+    for pagina in obtener_paginado(lambda: consulta('alertas_por_operador')
+        .eq('estado', 'ACTIVA')
+        .order('id')):
+        for alerta in pagina:
+            conteo_alertas[alerta['id_operador']] = conteo_alertas.get(alerta['id_operador'], 0) + 1
+    df_result['alertas_activas'] = df_result['id'].map(conteo_alertas).fillna(0)
+
+    return df_result
+
+# TTL corto: el estado de la flota se comparte entre paneles y sesiones
+TTL_ESTADO_FLOTA = 15
+
+# Auto-refresco (segundos) de las secciones en vivo: KPIs y alertas del supervisor
+INTERVALO_REFRESCO_S = int(os.getenv("INTERVALO_REFRESCO_S", "30"))
+
+@depende_de('operadores', 'metricas_procesadas', 'alertas', 'turnos')
+@st.cache_data(ttl=TTL_ESTADO_FLOTA, show_spinner=False)
 def cargar_operadores_activos():
     """Carga operadores activos con su última métrica - ADAPTADO"""
     try:
@@ -191,74 +725,26 @@ def cargar_operadores_activos():
             return df
         return pd.DataFrame()
     except Exception as e:
-        # Si la vista no existe, usar consulta directa
+        # Si la vista no existe, usar consulta directa en bloque
         try:
-            # Obtener operadores activos
-            response_ops = supabase.table('operadores')\
-                .select('*')\
-                .eq('estado', 'ACTIVO')\
-                .execute()
-            
-            if not response_ops.data:
-                return pd.DataFrame()
-            
-            df_ops = pd.DataFrame(response_ops.data)
-            df_ops['nombre_completo'] = df_ops['nombre'] + ' ' + df_ops['apellido']
-            
-            # Obtener última métrica para cada operador
-            metricas_list = []
-            for op_id in df_ops['id']:
-                response_metric = supabase.table('metricas_procesadas')\
-                    .select('indice_fatiga, clasificacion_riesgo, timestamp')\
-                    .eq('id_operador', op_id)\
-                    .order('timestamp', desc=True)\
-                    .limit(1)\
-                    .execute()
-                
-                if response_metric.data:
-                    metric = response_metric.data[0]
-                    metric['id_operador'] = op_id
-                    metricas_list.append(metric)
-            
-            if metricas_list:
-                df_metrics = pd.DataFrame(metricas_list)
-                df_result = df_ops.merge(df_metrics, left_on='id', right_on='id_operador', how='left')
-                df_result['indice_fatiga_actual'] = df_result['indice_fatiga']
-                df_result['ultima_medicion'] = df_result['timestamp']
-                
-                # Contar alertas activas
-                response_alerts = supabase.table('alertas')\
-                    .select('id_operador')\
-                    .eq('estado', 'ACTIVA')\
-                    .execute()
-                
-                if response_alerts.data:
-                    df_alerts = pd.DataFrame(response_alerts.data)
-                    alert_counts = df_alerts['id_operador'].value_counts()
-                    df_result['alertas_activas'] = df_result['id'].map(alert_counts).fillna(0)
-                else:
-                    df_result['alertas_activas'] = 0
-                
-                return df_result
-            
-            return df_ops
+            return cargar_ultima_metrica_operadores()
         except Exception as e2:
             st.error(f"Error al cargar operadores: {e2}")
             return pd.DataFrame()
 
+@depende_de('alertas', 'operadores')
 @st.cache_data(ttl=30)
 def cargar_alertas_activas():
-    """Carga alertas activas del sistema - ADAPTADO"""
+    """Carga todas las alertas activas del sistema, de la más reciente a la más antigua - ADAPTADO"""
     try:
-        response = supabase.table('alertas')\
-            .select('*, operadores(nombre, apellido, codigo_operador)')\
-            .eq('estado', 'ACTIVA')\
-            .order('timestamp', desc=True)\
-            .limit(100)\
-            .execute()
+        registros = []
+        for pagina in obtener_paginado(
+            lambda: consulta('alertas_activas').eq('estado', 'ACTIVA'), columna_cursor='id'
+        ):
+            registros.extend(pagina)
         
-        if response.data:
-            df = pd.DataFrame(response.data)
+        if registros:
+            df = pd.DataFrame(registros).sort_values('timestamp', ascending=False, ignore_index=True)
             # Extraer nombre del operador del objeto anidado
             if 'operadores' in df.columns:
                 df['operador_nombre'] = df['operadores'].apply(
@@ -273,32 +759,254 @@ def cargar_alertas_activas():
         st.error(f"Error al cargar alertas: {e}")
         return pd.DataFrame()
 
+# Una hora se da por cerrada pasado este margen, para recoger datos rezagados
+MARGEN_CIERRE_HORA = timedelta(minutes=5)
+
+@st.cache_resource
+def obtener_rollup_horario():
+    """Acumulado horario de fatiga compartido por todas las sesiones.
+
+    No depende de invalidar_cache: refrescar la vista no descarta horas
+    cerradas. Cuando la app escribe en metricas_procesadas,
+    registrar_escritura_metricas marca como pendientes solo las horas que
+    tocan las filas escritas, y se releen una a una.
+    """
+    return {
+        'horas': {},          # {hora: {turno: {'suma', 'conteo', 'minimo', 'maximo'}}}
+        'cerrado_hasta': None,
+        'pendientes': set(),  # horas cerradas que hay que volver a leer
+        'lock': threading.Lock()
+    }
+
+def acumular_por_hora(df: pd.DataFrame) -> Dict:
+    """Agrega filas crudas (timestamp, indice_fatiga, turno) por hora y turno"""
+    acumulado = {}
+    if df.empty:
+        return acumulado
+    agrupado = df.groupby(['hora', 'turno'])['indice_fatiga'].agg(['sum', 'count', 'min', 'max'])
+    for (hora, turno), fila in agrupado.iterrows():
+        acumulado.setdefault(hora, {})[turno] = {
+            'suma': float(fila['sum']),
+            'conteo': int(fila['count']),
+            'minimo': float(fila['min']),
+            'maximo': float(fila['max'])
+        }
+    return acumulado
+
+@depende_de('metricas_procesadas')
+@st.cache_data(ttl=TTL_ESTADO_FLOTA, show_spinner=False)
+def cargar_filas_tendencia(desde: str, hasta: Optional[str] = None) -> pd.DataFrame:
+    """Filas crudas (timestamp, indice_fatiga, id_operador) desde el instante indicado.
+
+    El TTL corto evita que cada rerun de cada sesión vuelva a leer la hora en curso.
+    """
+    def construir():
+        query = consulta('tendencia_fatiga').gte('timestamp', desde)
+        if hasta is not None:
+            query = query.lt('timestamp', hasta)
+        return query.order('timestamp').order('id')
+    
+    filas = []
+    for pagina in obtener_paginado(construir):
+        filas.extend(pagina)
+    return pd.DataFrame(filas, columns=['timestamp', 'indice_fatiga', 'id_operador'])
+
+def cargar_tendencia_horaria(horas: int = 24) -> pd.DataFrame:
+    """Tendencia horaria de fatiga (promedio, conteo, mínimo, máximo) por turno.
+
+    Las horas cerradas se guardan en el rollup y no se vuelven a consultar,
+    salvo las marcadas como pendientes por una escritura de la app; la hora en
+    curso se recalcula desde metricas_procesadas.
+    """
+    rollup = obtener_rollup_horario()
+    ahora = pd.Timestamp.now(tz='UTC')
+    inicio_ventana = (ahora - timedelta(hours=horas)).floor('h')
+    cierre = (ahora - MARGEN_CIERRE_HORA).floor('h')
+    
+    turnos_operador = {
+        op_id: op['turno_asignado'] for op_id, op in cargar_directorio_operadores()['por_id'].items()
+    }
+    
+    with rollup['lock']:
+        # Expirar horas fuera de la ventana
+        for hora in [h for h in rollup['horas'] if h < inicio_ventana]:
+            del rollup['horas'][hora]
+        
+        desde = inicio_ventana
+        if rollup['cerrado_hasta'] is not None and rollup['cerrado_hasta'] > inicio_ventana:
+            desde = rollup['cerrado_hasta']
+        rollup['pendientes'] = {hora for hora in rollup['pendientes'] if hora >= inicio_ventana}
+        # Las pendientes desde `desde` se leen igual con las horas abiertas
+        pendientes = sorted(hora for hora in rollup['pendientes'] if hora < desde)
+    
+    # Las consultas van fuera del lock: otras sesiones no esperan por la red
+    partes = [cargar_filas_tendencia(desde.isoformat())]
+    partes += [
+        cargar_filas_tendencia(hora.isoformat(), (hora + timedelta(hours=1)).isoformat())
+        for hora in pendientes
+    ]
+    df = pd.concat(partes, ignore_index=True).dropna(subset=['indice_fatiga'])
+    df['hora'] = pd.to_datetime(df['timestamp'], utc=True, format='ISO8601').dt.floor('h')
+    df['turno'] = df['id_operador'].map(turnos_operador).fillna('SIN TURNO')
+    
+    # Las horas leídas vienen completas, así que consolidarlas es idempotente
+    # aunque otra sesión haya avanzado el cierre mientras tanto
+    cerradas = acumular_por_hora(df[df['hora'] < cierre])
+    horas_abiertas = acumular_por_hora(df[df['hora'] >= cierre])
+    
+    with rollup['lock']:
+        for hora in pendientes:
+            rollup['horas'].pop(hora, None)
+        rollup['pendientes'] -= {hora for hora in rollup['pendientes'] if hora >= desde}
+        rollup['pendientes'] -= set(pendientes)
+        rollup['horas'].update(cerradas)
+        if rollup['cerrado_hasta'] is None or rollup['cerrado_hasta'] < cierre:
+            rollup['cerrado_hasta'] = cierre
+        
+        registros = [
+            {'hora': hora, 'turno': turno, **valores}
+            for hora, por_turno in {**rollup['horas'], **horas_abiertas}.items()
+            for turno, valores in por_turno.items()
+        ]
+    
+    if not registros:
+        return pd.DataFrame(columns=['hora', 'turno', 'suma', 'conteo', 'minimo', 'maximo', 'promedio'])
+    df_rollup = pd.DataFrame(registros).sort_values('hora')
+    df_rollup['promedio'] = df_rollup['suma'] / df_rollup['conteo']
+    return df_rollup
+
+def resumir_tendencia(df_rollup: pd.DataFrame) -> pd.DataFrame:
+    """Combina los turnos de cada hora en un único promedio ponderado"""
+    por_hora = df_rollup.groupby('hora').agg(
+        suma=('suma', 'sum'), conteo=('conteo', 'sum'),
+        minimo=('minimo', 'min'), maximo=('maximo', 'max')
+    ).reset_index()
+    por_hora['indice_fatiga'] = por_hora['suma'] / por_hora['conteo']
+    return por_hora
+
+# Límites de los buffers de series temporales por operador
+MAX_BUFFERS_OPERADOR = 200
+MAX_FILAS_BUFFER_OPERADOR = 20000
+
+def a_utc(valor) -> pd.Timestamp:
+    """Convierte un timestamp (con o sin zona horaria) a UTC"""
+    ts = pd.Timestamp(valor)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+@st.cache_resource
+def obtener_buffers_operador():
+    """Buffers circulares de métricas por (operador, horas), con desalojo LRU.
+
+    Cuando la app escribe en metricas_procesadas se descartan solo los de los
+    operadores escritos (registrar_escritura_metricas), para recoger inserts
+    con timestamps anteriores al último visto.
+    """
+    return {'buffers': OrderedDict(), 'lock': threading.Lock()}
+
+def registrar_escritura_metricas(df: pd.DataFrame):
+    """Ajusta el rollup horario y los buffers a filas que la app escribió en metricas_procesadas.
+
+    Marca como pendientes las horas que tocan las filas y descarta los
+    buffers de sus operadores; el resto de lo acumulado se conserva.
+    """
+    if df.empty:
+        return
+    instantes = pd.to_datetime(pd.Series(df['timestamp']), utc=True, format='ISO8601', errors='coerce').dropna()
+    rollup = obtener_rollup_horario()
+    with rollup['lock']:
+        rollup['pendientes'].update(instantes.dt.floor('h').unique())
+    
+    operadores = set(pd.Series(df['id_operador']).dropna().astype(str))
+    registro = obtener_buffers_operador()
+    with registro['lock']:
+        for clave in [clave for clave in registro['buffers'] if clave[0] in operadores]:
+            del registro['buffers'][clave]
+
+def obtener_buffer_operador(operator_id: str, horas: int) -> Dict:
+    """Devuelve (o crea) el buffer de un operador y lo marca como reciente"""
+    registro = obtener_buffers_operador()
+    clave = (operator_id, horas)
+    with registro['lock']:
+        buffer = registro['buffers'].pop(clave, None)
+        if buffer is None:
+            buffer = {
+                'filas': deque(maxlen=MAX_FILAS_BUFFER_OPERADOR),  # (timestamp UTC, fila)
+                'ultimo_ts': None,
+                'ids_ultimo_ts': set(),
+                'truncado': False,  # el tope descartó filas que seguían dentro de la ventana
+                'lock': threading.Lock()
+            }
+        registro['buffers'][clave] = buffer
+        while len(registro['buffers']) > MAX_BUFFERS_OPERADOR:
+            registro['buffers'].popitem(last=False)
+    return buffer
+
 def cargar_metricas_operador(operator_id: str, horas: int = 24):
-    """Carga métricas históricas de un operador - ADAPTADO"""
+    """Carga métricas históricas de un operador - ADAPTADO
+
+    Cada llamada solo consulta las filas posteriores al último timestamp visto
+    y descarta del buffer las que ya salieron de la ventana.
+    """
     try:
-        fecha_inicio = (datetime.now() - timedelta(hours=horas)).isoformat()
-        response = supabase.table('metricas_procesadas')\
-            .select('*')\
-            .eq('id_operador', operator_id)\
-            .gte('timestamp', fecha_inicio)\
-            .order('timestamp', desc=False)\
-            .execute()
+        buffer = obtener_buffer_operador(operator_id, horas)
         
-        if response.data:
-            df = pd.DataFrame(response.data)
-            # Convertir timestamp a datetime
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+        with buffer['lock']:
+            limite = pd.Timestamp.now(tz='UTC') - timedelta(hours=horas)
+            if buffer['ultimo_ts'] is not None and a_utc(buffer['ultimo_ts']) >= limite:
+                desde = buffer['ultimo_ts']
+            else:
+                # Buffer vacío u obsoleto: todo lo que tenía ya salió de la ventana
+                desde = limite.isoformat()
+                buffer['ids_ultimo_ts'] = set()
+            
+            nuevas = []
+            for pagina in obtener_paginado(lambda: consulta('metricas_operador')
+                .eq('id_operador', operator_id)
+                .gte('timestamp', desde)
+                .order('timestamp')
+                .order('id')):
+                nuevas.extend(f for f in pagina if f['id'] not in buffer['ids_ultimo_ts'])
+            
+            if nuevas:
+                for fila in nuevas:
+                    if len(buffer['filas']) == buffer['filas'].maxlen and buffer['filas'][0][0] >= limite:
+                        buffer['truncado'] = True
+                    buffer['filas'].append((a_utc(fila['timestamp']), fila))
+                nuevo_ts = nuevas[-1]['timestamp']
+                ids_nuevo_ts = {f['id'] for f in nuevas if f['timestamp'] == nuevo_ts}
+                if nuevo_ts == buffer['ultimo_ts']:
+                    ids_nuevo_ts |= buffer['ids_ultimo_ts']
+                buffer['ultimo_ts'] = nuevo_ts
+                buffer['ids_ultimo_ts'] = ids_nuevo_ts
+            
+            # Expirar filas fuera de la ventana
+            while buffer['filas'] and buffer['filas'][0][0] < limite:
+                buffer['filas'].popleft()
+                buffer['truncado'] = False
+            
+            filas = [fila for _, fila in buffer['filas']]
+            truncado = buffer['truncado']
+        
+        if truncado:
+            st.warning(f"⚠️ Se muestran solo las últimas {MAX_FILAS_BUFFER_OPERADOR:,} lecturas de las "
+                       f"últimas {horas} h; las más antiguas de la ventana no se incluyen.")
+        
+        if filas:
+            df = pd.DataFrame(filas)
+            # Convertir timestamp a datetime (PostgREST omite la fracción de segundo si es cero)
+            df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True, format='ISO8601')
             return df
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Error al cargar métricas: {e}")
         return pd.DataFrame()
 
+@depende_de('turnos', 'operadores')
+@st.cache_data(ttl=30)
 def cargar_turnos_activos():
     """Carga turnos actualmente en curso - ADAPTADO"""
     try:
-        response = supabase.table('turnos')\
-            .select('*, operadores(nombre, apellido, codigo_operador)')\
+        response = consulta('turnos_activos')\
             .eq('estado', 'EN_CURSO')\
             .execute()
         
@@ -315,6 +1023,43 @@ def cargar_turnos_activos():
         st.error(f"Error al cargar turnos: {e}")
         return pd.DataFrame()
 
+@depende_de('operadores')
+@st.cache_data(ttl=300)
+def cargar_operadores(estado: str = "TODOS", turno: str = "TODOS", experiencia: str = "TODOS"):
+    """Carga el listado de operadores para el mantenedor"""
+    query = consulta('operadores_mantenedor')
+    
+    if estado != "TODOS":
+        query = query.eq('estado', estado)
+    if turno != "TODOS":
+        query = query.eq('turno_asignado', turno)
+    if experiencia != "TODOS":
+        query = query.eq('nivel_experiencia', experiencia)
+    
+    response = query.order('created_at', desc=True).execute()
+    return pd.DataFrame(response.data) if response.data else pd.DataFrame()
+
+@depende_de('dispositivos', 'operadores')
+@st.cache_data(ttl=300)
+def cargar_dispositivos(tipo: str = "TODOS", estado: str = "TODOS"):
+    """Carga el listado de dispositivos con su operador asignado"""
+    query = consulta('dispositivos_mantenedor')
+    
+    if tipo != "TODOS":
+        query = query.eq('tipo_dispositivo', tipo)
+    if estado != "TODOS":
+        query = query.eq('estado', estado)
+    
+    response = query.order('created_at', desc=True).execute()
+    return pd.DataFrame(response.data) if response.data else pd.DataFrame()
+
+@depende_de('configuracion_sistema')
+@st.cache_data(ttl=300)
+def cargar_configuracion_sistema():
+    """Carga los parámetros del sistema"""
+    response = consulta('configuracion_sistema').execute()
+    return pd.DataFrame(response.data) if response.data else pd.DataFrame()
+
 def color_riesgo(clasificacion: str) -> str:
     """Retorna color según clasificación de riesgo"""
     colores = {
@@ -325,8 +1070,8 @@ def color_riesgo(clasificacion: str) -> str:
     }
     return colores.get(clasificacion, '#808080')
 
-def gestionar_alerta(alert_id: str, accion: str, notas: str = ""):
-    """Gestiona el estado de una alerta - ADAPTADO"""
+def gestionar_alerta(alert_id, accion: str, notas: str = ""):
+    """Gestiona el estado de una alerta, o de varias si alert_id es una lista - ADAPTADO"""
     try:
         nuevo_estado = {
             'ignorar': 'IGNORADA',
@@ -350,16 +1095,177 @@ def gestionar_alerta(alert_id: str, accion: str, notas: str = ""):
         if notas:
             update_data['notas'] = notas
             
-        supabase.table('alertas').update(update_data).eq('id', alert_id).execute()
-        st.success(f"✅ Alerta {accion}da exitosamente")
-        st.rerun()
+        ids = [alert_id] if isinstance(alert_id, str) else list(alert_id)
+        supabase.table('alertas').update(update_data).in_('id', ids).execute()
+        invalidar_cache('alertas')
+        st.success(f"✅ {len(ids)} alerta(s) {accion}da(s) exitosamente")
+        rerun_seccion()
     except Exception as e:
         st.error(f"Error al gestionar alerta: {e}")
 
+# ============================================
+# CACHÉ DE FIGURAS
+# ============================================
+
+# Tope de la caché de figuras, medido sobre el JSON serializado de cada figura
+FIGURAS_CACHE_MAX_MB = int(os.getenv("FIGURAS_CACHE_MAX_MB", "64"))
+FIGURAS_CACHE_MAX_ENTRADAS = int(os.getenv("FIGURAS_CACHE_MAX_ENTRADAS", "512"))
+
+def huella_contenido(valor) -> bytes:
+    """Huella barata del contenido de un argumento de un constructor de figuras.
+
+    DataFrames y Series se resumen con el hash vectorizado de pandas por fila
+    (índice incluido) más columnas y dtypes; el resto de valores, con su repr.
+    """
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        try:
+            filas = pd.util.hash_pandas_object(valor, index=True)
+        except TypeError:
+            # Celdas no hasheables (listas, dicts): se hashea su texto
+            filas = pd.util.hash_pandas_object(valor.astype(str), index=True)
+        if isinstance(valor, pd.DataFrame):
+            esquema = (type(valor).__name__, list(valor.columns), [str(t) for t in valor.dtypes])
+        else:
+            esquema = (type(valor).__name__, valor.name, str(valor.dtype))
+        return repr(esquema).encode('utf-8') + filas.to_numpy().tobytes()
+    return repr(valor).encode('utf-8')
+
+class CacheFiguras:
+    """Caché LRU de figuras Plotly ya construidas, junto con su JSON serializado.
+
+    Las entradas se indexan por constructor + huella de sus argumentos, así que
+    datos nuevos dan una clave nueva y no hace falta invalidar. El JSON se
+    genera una sola vez al guardar y mostrar_figura lo reutiliza en cada
+    render. El tamaño se acota por bytes de JSON y por número de entradas; al
+    pasarse se descartan las menos usadas. Las figuras devueltas se comparten
+    entre sesiones y no deben modificarse.
+    """
+    
+    def __init__(self, max_bytes: int = FIGURAS_CACHE_MAX_MB * 1024 * 1024,
+                 max_entradas: int = FIGURAS_CACHE_MAX_ENTRADAS):
+        self.max_bytes = max_bytes
+        self.max_entradas = max_entradas
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartadas = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave: str) -> Optional[go.Figure]:
+        """Devuelve la figura si la clave está en caché, o None"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+    
+    def spec(self, clave: Optional[str]) -> Optional[str]:
+        """JSON serializado de la figura, o None si ya no está en caché"""
+        with self._lock:
+            entrada = self._entradas.get(clave) if clave else None
+            return entrada[1] if entrada is not None else None
+    
+    def guardar(self, clave: str, figura: go.Figure) -> go.Figure:
+        """Guarda la figura y su JSON; descarta las menos usadas si se pasa del tope"""
+        # Mismo JSON que genera st.plotly_chart (to_dict + to_json sin validar)
+        json_figura = pio.to_json(figura.to_dict(), validate=False)
+        if len(json_figura) > self.max_bytes:
+            return figura
+        figura._clave_cache = clave
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[1])
+            self._entradas[clave] = (figura, json_figura)
+            self.bytes += len(json_figura)
+            while self.bytes > self.max_bytes or len(self._entradas) > self.max_entradas:
+                _, (_, json_descartado) = self._entradas.popitem(last=False)
+                self.bytes -= len(json_descartado)
+                self.descartadas += 1
+        return figura
+    
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+    
+    def instantanea(self) -> Dict:
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self.bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'descartadas': self.descartadas
+            }
+
+@st.cache_resource
+def obtener_cache_figuras() -> CacheFiguras:
+    """Caché de figuras compartida por todas las sesiones del proceso"""
+    return CacheFiguras()
+
+def figura_memoizada(constructor):
+    """Memoiza un constructor de figuras por el contenido de sus argumentos"""
+    @wraps(constructor)
+    def construir(*args, **kwargs):
+        huella = hashlib.blake2b(constructor.__qualname__.encode('utf-8'), digest_size=16)
+        for valor in args:
+            huella.update(huella_contenido(valor))
+            huella.update(b'\x00')
+        for nombre in sorted(kwargs):
+            huella.update(nombre.encode('utf-8') + b'=')
+            huella.update(huella_contenido(kwargs[nombre]))
+            huella.update(b'\x00')
+        clave = huella.hexdigest()
+        cache = obtener_cache_figuras()
+        figura = cache.obtener(clave)
+        if figura is None:
+            figura = cache.guardar(clave, constructor(*args, **kwargs))
+        return figura
+    return construir
+
+def mostrar_figura(figura: go.Figure, use_container_width: bool = True):
+    """st.plotly_chart que reutiliza el JSON guardado por figura_memoizada.
+
+    st.plotly_chart vuelve a ejecutar to_dict + to_json en cada render aunque
+    la figura no haya cambiado (75 ms el dashboard de métricas con 1.440
+    lecturas, ~1 s con 20.000). Aquí se arma el mismo elemento con el JSON de
+    la caché; las figuras que no vienen de la caché van por st.plotly_chart.
+    Depende de internos de Streamlit 1.40 (versión fijada en requirements.txt).
+    """
+    spec = obtener_cache_figuras().spec(getattr(figura, '_clave_cache', None))
+    if spec is None:
+        return st.plotly_chart(figura, use_container_width=use_container_width)
+    
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.use_container_width = use_container_width
+    proto.theme = "streamlit"
+    proto.form_id = current_form_id(dg)
+    proto.spec = spec
+    proto.config = json.dumps({'showLink': False, 'linkText': False})
+    proto.id = compute_and_register_element_id(
+        "plotly_chart",
+        user_key=None,
+        form_id=proto.form_id,
+        plotly_spec=spec,
+        plotly_config=proto.config,
+        selection_mode=("points", "box", "lasso"),
+        is_selection_activated=False,
+        theme="streamlit",
+        use_container_width=use_container_width,
+    )
+    return dg._enqueue("plotly_chart", proto)
+
 # ============================================
 # FUNCIONES DE VISUALIZACIÓN
 # ============================================
 
+@figura_memoizada
 def crear_gauge_fatiga(valor: float, titulo: str = "Índice de Fatiga"):
     """Crea un gauge chart para mostrar índice de fatiga"""
     fig = go.Figure(go.Indicator(
@@ -397,6 +1303,7 @@ def crear_gauge_fatiga(valor: float, titulo: str = "Índice de Fatiga"):
     
     return fig
 
+@figura_memoizada
 def crear_mapa_flota(df_operadores: pd.DataFrame):
     """Crea visualización de mapa de flota"""
     if df_operadores.empty:
@@ -438,6 +1345,7 @@ def crear_mapa_flota(df_operadores: pd.DataFrame):
     
     return fig
 
+@figura_memoizada
 def crear_serie_temporal_fatiga(df_metricas: pd.DataFrame):
     """Crea gráfico de serie temporal de fatiga"""
     if df_metricas.empty:
@@ -486,6 +1394,7 @@ def crear_serie_temporal_fatiga(df_metricas: pd.DataFrame):
     
     return fig
 
+@figura_memoizada
 def crear_dashboard_metricas(df_metricas: pd.DataFrame):
     """Crea dashboard multi-métrica"""
     if df_metricas.empty or len(df_metricas) < 2:
@@ -552,10 +1461,207 @@ def crear_dashboard_metricas(df_metricas: pd.DataFrame):
     
     return fig
 
+@figura_memoizada
+def crear_dona_riesgo(riesgo_counts: pd.DataFrame):
+    """Crea gráfico de dona con la distribución de niveles de riesgo"""
+    colores_riesgo = {'BAJO': '#4CAF50', 'MEDIO': '#FFC107', 'ALTO': '#FF9800', 'CRITICO': '#F44336'}
+    
+    fig = px.pie(
+        riesgo_counts, 
+        values='Cantidad', 
+        names='Nivel',
+        hole=0.5,
+        color='Nivel',
+        color_discrete_map=colores_riesgo
+    )
+    fig.update_layout(
+        height=350,
+        margin=dict(t=30, b=30, l=30, r=30),
+        legend=dict(orientation="h", yanchor="bottom", y=-0.2)
+    )
+    fig.update_traces(textposition='inside', textinfo='percent+value')
+    
+    return fig
+
+@figura_memoizada
+def crear_barras_turno(fatiga_turno: pd.DataFrame):
+    """Crea gráfico de barras de fatiga promedio por turno"""
+    fig = px.bar(
+        fatiga_turno,
+        x='Turno',
+        y='Índice Promedio',
+        color='Turno',
+        text='Índice Promedio',
+        color_discrete_sequence=['#1f77b4', '#ff7f0e', '#2ca02c', '#9467bd']
+    )
+    fig.update_traces(texttemplate='%{text:.1f}', textposition='outside')
+    fig.update_layout(
+        height=350,
+        margin=dict(t=30, b=30),
+        showlegend=False,
+        yaxis=dict(range=[0, 100], title="Índice de Fatiga")
+    )
+    # Agregar líneas de umbral
+    fig.add_hline(y=70, line_dash="dash", line_color="orange", annotation_text="Alto")
+    fig.add_hline(y=85, line_dash="dash", line_color="red", annotation_text="Crítico")
+    
+    return fig
+
+@figura_memoizada
+def crear_top_fatiga(df_top: pd.DataFrame):
+    """Crea gráfico de barras horizontales de los operadores con mayor fatiga"""
+    # Asignar colores según riesgo
+    colores_riesgo = {'BAJO': '#4CAF50', 'MEDIO': '#FFC107', 'ALTO': '#FF9800', 'CRITICO': '#F44336'}
+    colores = df_top['clasificacion_riesgo'].map(colores_riesgo).fillna('#808080')
+    
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        y=df_top['nombre_completo'],
+        x=df_top['indice_fatiga_actual'],
+        orientation='h',
+        marker_color=colores,
+        text=df_top['indice_fatiga_actual'].apply(lambda x: f"{x:.1f}"),
+        textposition='outside'
+    ))
+    fig.update_layout(
+        height=350,
+        margin=dict(t=30, b=30, l=150),
+        xaxis=dict(range=[0, 110], title="Índice de Fatiga"),
+        yaxis=dict(autorange="reversed")
+    )
+    fig.add_vline(x=70, line_dash="dash", line_color="orange")
+    fig.add_vline(x=85, line_dash="dash", line_color="red")
+    
+    return fig
+
+@figura_memoizada
+def crear_alertas_por_tipo(alertas_tipo: pd.DataFrame):
+    """Crea gráfico de barras horizontales con la cantidad de alertas por tipo"""
+    fig = px.bar(
+        alertas_tipo,
+        y='Tipo_Display',
+        x='Cantidad',
+        orientation='h',
+        color='Cantidad',
+        color_continuous_scale='Reds',
+        text='Cantidad'
+    )
+    fig.update_traces(textposition='outside')
+    fig.update_layout(
+        height=350,
+        margin=dict(t=30, b=30, l=150),
+        showlegend=False,
+        coloraxis_showscale=False,
+        yaxis=dict(title=""),
+        xaxis=dict(title="Cantidad de Alertas")
+    )
+    
+    return fig
+
+@figura_memoizada
+def crear_tendencia_fatiga(tendencia_hora: pd.DataFrame, df_rollup: pd.DataFrame):
+    """Crea gráfico de tendencia horaria de fatiga, global y por turno"""
+    fig = go.Figure()
+    
+    # Área de fondo para zonas de riesgo
+    fig.add_hrect(y0=0, y1=40, fillcolor="rgba(76, 175, 80, 0.1)", line_width=0)
+    fig.add_hrect(y0=40, y1=70, fillcolor="rgba(255, 193, 7, 0.1)", line_width=0)
+    fig.add_hrect(y0=70, y1=85, fillcolor="rgba(255, 152, 0, 0.1)", line_width=0)
+    fig.add_hrect(y0=85, y1=100, fillcolor="rgba(244, 67, 54, 0.1)", line_width=0)
+    
+    # Línea de tendencia
+    fig.add_trace(go.Scatter(
+        x=tendencia_hora['hora'],
+        y=tendencia_hora['indice_fatiga'],
+        mode='lines+markers',
+        name='Índice Promedio',
+        line=dict(color='#1f77b4', width=3),
+        marker=dict(size=8),
+        fill='tozeroy',
+        fillcolor='rgba(31, 119, 180, 0.2)',
+        customdata=tendencia_hora[['minimo', 'maximo', 'conteo']].values,
+        hovertemplate='%{y:.1f} (mín %{customdata[0]:.1f} / máx %{customdata[1]:.1f}, '
+                      '%{customdata[2]} mediciones)<extra></extra>'
+    ))
+    
+    # Promedio por turno
+    for turno, df_turno_hora in df_rollup.groupby('turno'):
+        fig.add_trace(go.Scatter(
+            x=df_turno_hora['hora'],
+            y=df_turno_hora['promedio'],
+            mode='lines',
+            name=f"Turno {turno}",
+            line=dict(width=1, dash='dot')
+        ))
+    
+    fig.update_layout(
+        height=350,
+        margin=dict(t=30, b=30),
+        xaxis=dict(title="Hora", tickformat="%H:%M"),
+        yaxis=dict(range=[0, 100], title="Índice de Fatiga Promedio"),
+        hovermode='x unified'
+    )
+    
+    # Líneas de umbral
+    fig.add_hline(y=70, line_dash="dash", line_color="orange", annotation_text="Umbral Alto")
+    fig.add_hline(y=85, line_dash="dash", line_color="red", annotation_text="Umbral Crítico")
+    
+    return fig
+
 # ============================================
 # FUNCIONES DE REPORTES - ADAPTADAS
 # ============================================
 
+def acumular_metricas_periodo(inicio_iso: str, fin_iso: str) -> Dict:
+    """Recorre las métricas del periodo por páginas y acumula el resumen.
+
+    Solo se conservan contadores, de modo que la memoria no depende de la
+    duración del periodo.
+    """
+    resumen = {
+        'total_mediciones': 0,
+        'suma_indice': 0.0,
+        'mediciones_con_indice': 0,
+        'indice_maximo': None,
+        'operadores': set(),
+        'distribucion_riesgo': {}
+    }
+    for pagina in obtener_paginado(
+        lambda: consulta('metricas_reporte')
+            .gte('timestamp', inicio_iso)
+            .lte('timestamp', fin_iso),
+        columna_cursor='id'
+    ):
+        for fila in pagina:
+            resumen['total_mediciones'] += 1
+            indice = fila.get('indice_fatiga')
+            if indice is not None:
+                resumen['suma_indice'] += indice
+                resumen['mediciones_con_indice'] += 1
+                if resumen['indice_maximo'] is None or indice > resumen['indice_maximo']:
+                    resumen['indice_maximo'] = indice
+            if fila.get('id_operador') is not None:
+                resumen['operadores'].add(fila['id_operador'])
+            riesgo = fila.get('clasificacion_riesgo')
+            if riesgo is not None:
+                resumen['distribucion_riesgo'][riesgo] = resumen['distribucion_riesgo'].get(riesgo, 0) + 1
+    return resumen
+
+def acumular_alertas_periodo(inicio_iso: str, fin_iso: str) -> Dict:
+    """Cuenta las alertas del periodo por nivel, recorriéndolas por páginas"""
+    por_nivel = {}
+    total = 0
+    for pagina in obtener_paginado(
+        lambda: consulta('alertas_reporte')
+            .gte('timestamp', inicio_iso)
+            .lte('timestamp', fin_iso),
+        columna_cursor='id'
+    ):
+        total += len(pagina)
+        for fila in pagina:
+            por_nivel[fila.get('nivel_alerta')] = por_nivel.get(fila.get('nivel_alerta'), 0) + 1
+    return {'total': total, 'por_nivel': por_nivel}
+
 def generar_reporte_pdf(periodo_inicio: datetime, periodo_fin: datetime, 
                         tipo_reporte: str = "SEMANAL") -> BytesIO:
     """Genera reporte PDF con estadísticas del periodo"""
@@ -592,37 +1698,26 @@ def generar_reporte_pdf(periodo_inicio: datetime, periodo_fin: datetime,
     riesgo_data = []
 
     try:
-        # Métricas del periodo
-        response_metricas = (
-            supabase.table('metricas_procesadas')
-            .select('*')
-            .gte('timestamp', periodo_inicio_dt.isoformat())
-            .lte('timestamp', periodo_fin_dt.isoformat())
-            .execute()
-        )
-        
-        df_metricas = pd.DataFrame(response_metricas.data) if response_metricas.data else pd.DataFrame()
-        
-        # Alertas del periodo
-        response_alertas = (
-            supabase.table('alertas')
-            .select('*')
-            .gte('timestamp', periodo_inicio_dt.isoformat())
-            .lte('timestamp', periodo_fin_dt.isoformat())
-            .execute()
-        )
-        
-        df_alertas = pd.DataFrame(response_alertas.data) if response_alertas.data else pd.DataFrame()
+        # Métricas y alertas del periodo
+        datos_periodo = cargar_en_paralelo({
+            'metricas': lambda: acumular_metricas_periodo(periodo_inicio_dt.isoformat(), periodo_fin_dt.isoformat()),
+            'alertas': lambda: acumular_alertas_periodo(periodo_inicio_dt.isoformat(), periodo_fin_dt.isoformat())
+        })
+        metricas = datos_periodo['metricas']
+        alertas = datos_periodo['alertas']
         
         # Resumen Ejecutivo
         story.append(Paragraph("RESUMEN EJECUTIVO", styles['Heading2']))
         story.append(Spacer(1, 0.2*inch))
         
-        if not df_metricas.empty:
-            total_mediciones = len(df_metricas)
-            indice_promedio = df_metricas['indice_fatiga'].mean()
-            indice_maximo = df_metricas['indice_fatiga'].max()
-            operadores_monitoreados = df_metricas['id_operador'].nunique()
+        if metricas['total_mediciones']:
+            total_mediciones = metricas['total_mediciones']
+            indice_promedio = (
+                metricas['suma_indice'] / metricas['mediciones_con_indice']
+                if metricas['mediciones_con_indice'] else float('nan')
+            )
+            indice_maximo = metricas['indice_maximo'] if metricas['indice_maximo'] is not None else float('nan')
+            operadores_monitoreados = len(metricas['operadores'])
             
             resumen_data = [
                 ['Métrica', 'Valor'],
@@ -630,8 +1725,8 @@ def generar_reporte_pdf(periodo_inicio: datetime, periodo_fin: datetime,
                 ['Operadores Monitoreados', str(operadores_monitoreados)],
                 ['Índice de Fatiga Promedio', f'{indice_promedio:.1f}/100'],
                 ['Índice de Fatiga Máximo', f'{indice_maximo:.1f}/100'],
-                ['Total de Alertas', str(len(df_alertas))],
-                ['Alertas Críticas', str(len(df_alertas[df_alertas['nivel_alerta'] == 'CRITICO']))],
+                ['Total de Alertas', str(alertas['total'])],
+                ['Alertas Críticas', str(alertas['por_nivel'].get('CRITICO', 0))],
             ]
             
             resumen_table = Table(resumen_data, colWidths=[3*inch, 2*inch])
@@ -653,10 +1748,10 @@ def generar_reporte_pdf(periodo_inicio: datetime, periodo_fin: datetime,
             story.append(Paragraph("DISTRIBUCIÓN DE NIVELES DE RIESGO", styles['Heading2']))
             story.append(Spacer(1, 0.2*inch))
             
-            dist_riesgo = df_metricas['clasificacion_riesgo'].value_counts()
+            dist_riesgo = metricas['distribucion_riesgo']
             riesgo_data = [['Nivel de Riesgo', 'Cantidad', 'Porcentaje']]
             for nivel in ['BAJO', 'MEDIO', 'ALTO', 'CRITICO']:
-                if nivel in dist_riesgo.index:
+                if nivel in dist_riesgo:
                     cantidad = dist_riesgo[nivel]
                     porcentaje = (cantidad / total_mediciones) * 100
                     riesgo_data.append([nivel, str(cantidad), f'{porcentaje:.1f}%'])
@@ -733,18 +1828,1951 @@ def generar_reporte_pdf(periodo_inicio: datetime, periodo_fin: datetime,
     return buffer, nombre_archivo
 
 # ============================================
-# PANEL PRINCIPAL - GERENTE DE SEGURIDAD
+# FUNCIONES DE INGESTA MASIVA
 # ============================================
 
-def panel_gerente():
-    st.markdown('<p class="main-header">🛡️ Panel de Control - Gerente de Seguridad</p>', 
-                unsafe_allow_html=True)
+# Campos de cada tipo de dispositivo: (mínimo, máximo, tipo) o lista de valores permitidos.
+# Los rangos son los mismos que acepta el formulario de ingesta manual.
+ESQUEMAS_PAYLOAD = {
+    'SMARTWATCH': {
+        'sleep.duration_hours': (0.0, 24.0, float),
+        'sleep.quality_score': (0, 100, int),
+        'sleep.deep_minutes': (0, 480, int),
+        'sleep.rem_minutes': (0, 480, int),
+        'sleep.efficiency': (0.0, 1.0, float),
+        'vitals.heart_rate': (30, 200, int),
+        'vitals.hrv_rmssd': (0.0, 200.0, float),
+        'vitals.hrv_sdnn': (0.0, 200.0, float),
+        'vitals.spo2': (85.0, 100.0, float),
+        'vitals.skin_temp': (30.0, 42.0, float),
+        'vitals.stress_level': (0, 100, int)
+    },
+    'BANDA_ANTIFATIGA': {
+        'posture.trunk_angle': (0.0, 90.0, float),
+        'posture.head_nods': (0, 100, int),
+        'posture.micro_sleeps': (0, 50, int),
+        'emg.neck_activity': (0, 100, int),
+        'movement.inactivity_minutes': (0, 480, int)
+    },
+    'TELEMATICA': {
+        'machinery.type': ["Excavadora", "Camión Minero", "Pala Cargadora", "Bulldozer", "Grúa", "Otro"],
+        'shift.type': ["DIA", "NOCHE", "ROTATIVO"],
+        'shift.hours_elapsed': (0.0, 24.0, float),
+        'environment.temperature': (-20.0, 60.0, float),
+        'environment.humidity': (0, 100, int)
+    }
+}
+
+COLUMNAS_LECTURA = ['device_type', 'device_external_id', 'operator_external_id', 'timestamp']
+
+# Lecturas completadas entre actualizaciones de progreso
+TAMAÑO_LOTE_INGESTA = 500
+
+# Cliente asíncrono del webhook: peticiones en vuelo y política de reintentos
+INGESTA_CONCURRENCIA = int(os.getenv("INGESTA_CONCURRENCIA", "32"))
+INGESTA_MAX_REINTENTOS = 4
+INGESTA_BACKOFF_BASE = 0.5
+INGESTA_BACKOFF_MAXIMO = 30.0
+
+# Sobres de lecturas agrupadas (opcionales): columnar y comprimido, ver codificar_lote.
+# Sin URL explícita no se envían sobres: el webhook de lecturas sueltas no los entiende
+N8N_WEBHOOK_LOTES_URL = os.getenv("N8N_WEBHOOK_LOTES_URL")
+FORMATO_LOTE = "fatiga.lecturas.columnar/1"
+TIPO_CONTENIDO_LOTE = "application/vnd.fatiga.lote+json"
+LECTURAS_POR_LOTE = 500
+COMPRESIONES_LOTE = ['gzip', 'zstd'] if zstandard is not None else ['gzip']
+
+def leer_archivo_lecturas(archivo) -> pd.DataFrame:
+    """Lee un archivo CSV, JSONL o Parquet de lecturas en formato plano.
+
+    Los objetos anidados del payload (sleep, vitals, ...) se aplanan con
+    notación de punto, p. ej. 'sleep.duration_hours'.
+    """
+    nombre = archivo.name.lower()
+    if nombre.endswith('.csv'):
+        df = pd.read_csv(archivo)
+    elif nombre.endswith(('.jsonl', '.ndjson')):
+        df = pd.json_normalize(pd.read_json(archivo, lines=True, dtype=False).to_dict('records'))
+    elif nombre.endswith('.parquet'):
+        df = pd.read_parquet(archivo)
+    else:
+        raise ValueError("Formato no soportado. Use CSV, JSONL o Parquet.")
+    return df.reset_index(drop=True)
+
+def validar_lecturas(df: pd.DataFrame, directorio: Dict):
+    """Valida las lecturas por columnas completas contra ESQUEMAS_PAYLOAD.
+
+    Devuelve (df_validas, df_errores); df_validas incluye operator_id resuelto
+    desde el directorio y df_errores tiene una fila por (fila, campo, error).
+    """
+    faltantes = [c for c in COLUMNAS_LECTURA if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
     
-    # KPIs principales
-    col1, col2, col3, col4 = st.columns(4)
+    errores = []
+    
+    def registrar(mascara: pd.Series, campo: str, mensaje: str):
+        if mascara.any():
+            errores.append(pd.DataFrame({'fila': df.index[mascara] + 1, 'campo': campo, 'error': mensaje}))
+    
+    df = df.copy()
+    registrar(~df['device_type'].isin(list(ESQUEMAS_PAYLOAD)), 'device_type', "Tipo de dispositivo desconocido")
+    registrar(df['device_external_id'].isna(), 'device_external_id', "Falta el ID del dispositivo")
+    
+    timestamps = pd.to_datetime(df['timestamp'], errors='coerce', format='ISO8601', utc=True)
+    registrar(timestamps.isna(), 'timestamp', "Timestamp inválido")
+    if pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = df['timestamp'].map(lambda ts: ts.isoformat() if pd.notna(ts) else None)
+    
+    ids_por_codigo = {codigo: op['id'] for codigo, op in directorio['por_codigo'].items()}
+    df['operator_external_id'] = df['operator_external_id'].astype(str)
+    df['operator_id'] = df['operator_external_id'].map(ids_por_codigo)
+    registrar(df['operator_id'].isna(), 'operator_external_id', "Operador no encontrado")
+    
+    for tipo, esquema in ESQUEMAS_PAYLOAD.items():
+        del_tipo = df['device_type'] == tipo
+        if not del_tipo.any():
+            continue
+        for campo, regla in esquema.items():
+            if campo not in df.columns:
+                registrar(del_tipo, campo, "Campo requerido ausente")
+                continue
+            if isinstance(regla, list):
+                registrar(del_tipo & ~df[campo].isin(regla), campo, f"Valor no permitido (use {', '.join(regla)})")
+                continue
+            minimo, maximo, _ = regla
+            valores = pd.to_numeric(df[campo], errors='coerce')
+            registrar(del_tipo & valores.isna(), campo, "Valor vacío o no numérico")
+            registrar(del_tipo & ((valores < minimo) | (valores > maximo)), campo,
+                      f"Fuera de rango [{minimo}, {maximo}]")
+    
+    df_errores = pd.concat(errores, ignore_index=True) if errores else \
+        pd.DataFrame(columns=['fila', 'campo', 'error'])
+    filas_con_error = set(df_errores['fila'] - 1)
+    df_validas = df[~df.index.isin(filas_con_error)]
+    return df_validas, df_errores.sort_values('fila', kind='stable')
+
+@depende_de('operadores')
+@st.cache_data(ttl=300, max_entries=2, show_spinner="Validando archivo...")
+def leer_y_validar_archivo(nombre: str, contenido: bytes, _directorio: Dict):
+    """Lee y valida un archivo subido; cacheado sobre su nombre y contenido.
+
+    Los reruns de la pestaña (mover un slider, cambiar la ruta) reutilizan el
+    resultado en vez de volver a leer y validar todo el archivo; el TTL es el
+    del directorio de operadores contra el que se valida. Devuelve
+    (df_lecturas, df_validas, df_errores).
+    """
+    archivo = BytesIO(contenido)
+    archivo.name = nombre
+    df_lecturas = leer_archivo_lecturas(archivo)
+    df_validas, df_errores = validar_lecturas(df_lecturas, _directorio)
+    return df_lecturas, df_validas, df_errores
+
+# Deduplicación: claves vistas en la última ventana, con un tope de memoria
+INGESTA_VENTANA_DEDUP_S = int(os.getenv("INGESTA_VENTANA_DEDUP_S", "3600"))
+INGESTA_MAX_CLAVES_DEDUP = int(os.getenv("INGESTA_MAX_CLAVES_DEDUP", "1000000"))
+
+def clave_evento(payload: Dict, nonce: Optional[str] = None) -> str:
+    """Clave determinística de una lectura: dispositivo + operador + instante.
+
+    El timestamp se normaliza a UTC para que '...Z' y '...+00:00' den la misma
+    clave; los timestamps sin zona se toman tal cual. nonce distingue lecturas
+    que comparten esos tres datos (p. ej. dos envíos del formulario manual).
+    """
+    instante = str(payload.get('timestamp'))
+    try:
+        fecha = datetime.fromisoformat(instante)
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc)
+        instante = fecha.isoformat(timespec='microseconds')
+    except ValueError:
+        pass
+    base = f"{payload.get('device_external_id')}|{payload.get('operator_external_id')}|{instante}"
+    if nonce:
+        base += f"|{nonce}"
+    return hashlib.blake2b(base.encode('utf-8'), digest_size=16).hexdigest()
+
+def con_clave_evento(payload: Dict, nonce: Optional[str] = None) -> Dict:
+    """Agrega event_id al payload (n8n puede usarlo para descartar repetidas)"""
+    payload['event_id'] = clave_evento(payload, nonce)
+    return payload
+
+class CacheClavesRecientes:
+    """Conjunto acotado de claves de evento recientes para descartar repetidas.
+
+    Guarda dos generaciones de claves; la actual pasa a ser la anterior cada
+    media ventana o al llenar la mitad del tope, y la anterior se descarta.
+    Así una clave se recuerda entre media ventana y una ventana completa, sin
+    falsos positivos y con memoria acotada. Se guardan los primeros 64 bits
+    de la clave.
+    """
+    
+    def __init__(self, ventana_s: int = INGESTA_VENTANA_DEDUP_S, max_claves: int = INGESTA_MAX_CLAVES_DEDUP):
+        self.ventana_s = ventana_s
+        self.max_claves = max_claves
+        self.duplicadas = 0
+        self._actual = set()
+        self._anterior = set()
+        self._inicio = datetime.now().timestamp()
+        self._lock = threading.Lock()
+    
+    def _rotar(self):
+        ahora = datetime.now().timestamp()
+        if ahora - self._inicio >= self.ventana_s / 2 or len(self._actual) >= self.max_claves // 2:
+            self._anterior = self._actual if ahora - self._inicio < self.ventana_s else set()
+            self._actual = set()
+            self._inicio = ahora
+    
+    def registrar(self, clave: str) -> bool:
+        """Registra la clave; devuelve False si ya se había visto en la ventana"""
+        valor = int(clave[:16], 16)
+        with self._lock:
+            self._rotar()
+            if valor in self._actual or valor in self._anterior:
+                self.duplicadas += 1
+                return False
+            self._actual.add(valor)
+            return True
+    
+    def olvidar(self, clave: str):
+        """Quita una clave, p. ej. si su envío fue rechazado y se puede corregir y reenviar"""
+        valor = int(clave[:16], 16)
+        with self._lock:
+            self._actual.discard(valor)
+            self._anterior.discard(valor)
+    
+    def __len__(self):
+        return len(self._actual) + len(self._anterior)
+
+@st.cache_resource
+def obtener_cache_claves() -> CacheClavesRecientes:
+    """Caché de claves recientes compartida por todas las sesiones del proceso"""
+    return CacheClavesRecientes()
+
+def filtrar_duplicadas(payloads: List):
+    """Separa (fila, payload) nuevos de los ya vistos; devuelve (nuevos, filas_duplicadas)"""
+    cache = obtener_cache_claves()
+    nuevos = []
+    duplicadas = []
+    for fila, payload in payloads:
+        if cache.registrar(payload.get('event_id') or clave_evento(payload)):
+            nuevos.append((fila, payload))
+        else:
+            duplicadas.append(fila)
+    return nuevos, duplicadas
+
+def construir_payloads(df_validas: pd.DataFrame) -> List[Dict]:
+    """Arma el payload anidado del webhook para cada lectura validada"""
+    payloads = []
+    for tipo, df_tipo in df_validas.groupby('device_type', sort=False):
+        esquema = ESQUEMAS_PAYLOAD[tipo]
+        campos = list(esquema)
+        df_tipo = df_tipo.copy()
+        for campo, regla in esquema.items():
+            if not isinstance(regla, list):
+                df_tipo[campo] = pd.to_numeric(df_tipo[campo]).astype(regla[2])
+        for fila, registro in zip(df_tipo.index, df_tipo[COLUMNAS_LECTURA + ['operator_id'] + campos].to_dict('records')):
+            payload = {
+                "device_type": tipo,
+                "device_external_id": str(registro['device_external_id']),
+                "operator_external_id": registro['operator_external_id'],
+                "operator_id": registro['operator_id'],
+                "timestamp": str(registro['timestamp'])
+            }
+            for campo in campos:
+                grupo, clave = campo.split('.', 1)
+                payload.setdefault(grupo, {})[clave] = registro[campo]
+            payloads.append((fila, con_clave_evento(payload)))
+    payloads.sort(key=lambda item: item[0])
+    return payloads
+
+def codificar_lote(payloads: List[Dict], compresion: str = 'gzip'):
+    """Empaqueta varias lecturas en un sobre columnar comprimido.
+
+    Las lecturas se agrupan por tipo de dispositivo y cada campo (en notación
+    de punto) se guarda una sola vez como lista de valores; 'orden' conserva
+    la posición original. Devuelve (cuerpo, encabezados) listos para el POST.
+    """
+    grupos = {}
+    for orden, payload in enumerate(payloads):
+        grupo = grupos.setdefault(payload['device_type'], {'orden': [], 'filas': []})
+        plano = {}
+        for clave, valor in payload.items():
+            if isinstance(valor, dict):
+                for subclave, subvalor in valor.items():
+                    plano[f"{clave}.{subclave}"] = subvalor
+            elif clave != 'device_type':
+                plano[clave] = valor
+        grupo['orden'].append(orden)
+        grupo['filas'].append(plano)
+    
+    sobre = {'formato': FORMATO_LOTE, 'n': len(payloads), 'grupos': []}
+    for tipo, grupo in grupos.items():
+        columnas = list(dict.fromkeys(clave for fila in grupo['filas'] for clave in fila))
+        sobre['grupos'].append({
+            'device_type': tipo,
+            'orden': grupo['orden'],
+            'columnas': {columna: [fila.get(columna) for fila in grupo['filas']] for columna in columnas}
+        })
+    cuerpo = json.dumps(sobre, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+    
+    if compresion == 'zstd':
+        if zstandard is None:
+            raise ValueError("La compresión zstd requiere el paquete 'zstandard'")
+        cuerpo = zstandard.ZstdCompressor(level=3).compress(cuerpo)
+    elif compresion == 'gzip':
+        cuerpo = gzip.compress(cuerpo, compresslevel=6)
+    encabezados = {'Content-Type': TIPO_CONTENIDO_LOTE}
+    if compresion:
+        encabezados['Content-Encoding'] = compresion
+    return cuerpo, encabezados
+
+def decodificar_lote(cuerpo: bytes, codificacion: Optional[str] = None) -> List[Dict]:
+    """Inverso de codificar_lote: devuelve las lecturas en su orden y forma originales"""
+    if codificacion == 'zstd':
+        if zstandard is None:
+            raise ValueError("La compresión zstd requiere el paquete 'zstandard'")
+        cuerpo = zstandard.ZstdDecompressor().decompress(cuerpo)
+    elif codificacion == 'gzip':
+        cuerpo = gzip.decompress(cuerpo)
+    sobre = json.loads(cuerpo)
+    if sobre.get('formato') != FORMATO_LOTE:
+        raise ValueError(f"Formato de lote desconocido: {sobre.get('formato')}")
+    
+    lecturas = [None] * sobre['n']
+    for grupo in sobre['grupos']:
+        columnas = grupo['columnas']
+        for i, orden in enumerate(grupo['orden']):
+            payload = {'device_type': grupo['device_type']}
+            for columna, valores in columnas.items():
+                if '.' in columna:
+                    clave, subclave = columna.split('.', 1)
+                    payload.setdefault(clave, {})[subclave] = valores[i]
+                else:
+                    payload[columna] = valores[i]
+            lecturas[orden] = payload
+    return lecturas
+
+# Histogramas de la instrumentación: límites superiores de cada bucket en escala
+# logarítmica (latencias de 1 ms a ~65 s, tamaños de 64 B a 16 MB)
+LIMITES_LATENCIA_MS = [2 ** (i / 2) for i in range(33)]
+LIMITES_TAMAÑO_BYTES = [2 ** i for i in range(6, 25)]
+VENTANA_RENDIMIENTO_S = 60
+
+class Histograma:
+    """Histograma de buckets fijos; los percentiles se interpolan dentro del bucket"""
+    
+    def __init__(self, limites: List[float]):
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1)
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+    
+    def registrar(self, valor: float):
+        indice = int(np.searchsorted(self.limites, valor))
+        self.conteos[indice] += 1
+        self.total += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+    
+    def percentil(self, p: float) -> Optional[float]:
+        if not self.total:
+            return None
+        objetivo = self.total * p / 100
+        acumulado = 0
+        for indice, conteo in enumerate(self.conteos):
+            if conteo and acumulado + conteo >= objetivo:
+                inferior = self.limites[indice - 1] if indice > 0 else 0.0
+                superior = self.limites[indice] if indice < len(self.limites) else self.maximo
+                valor = inferior + (superior - inferior) * (objetivo - acumulado) / conteo
+                return round(min(valor, self.maximo), 2)
+            acumulado += conteo
+        return round(self.maximo, 2)
+    
+    def resumen(self) -> Dict:
+        return {
+            'n': self.total,
+            'media': round(self.suma / self.total, 2) if self.total else None,
+            'p50': self.percentil(50),
+            'p95': self.percentil(95),
+            'p99': self.percentil(99),
+            'max': round(self.maximo, 2),
+            'buckets': [
+                {'hasta': self.limites[i] if i < len(self.limites) else None, 'n': conteo}
+                for i, conteo in enumerate(self.conteos) if conteo
+            ]
+        }
+
+class MetricasIngesta:
+    """Instrumentación del cliente del webhook, compartida por todo el proceso.
+
+    Cada intento HTTP registra su latencia (envío -> respuesta), el tamaño del
+    cuerpo y el código de estado (o el tipo de error de conexión). La espera en
+    cola es el tiempo entre enviar() y que un trabajador toma la lectura:
+    separarla de la latencia indica si el límite lo pone n8n o el cliente.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+    
+    def reiniciar(self):
+        with self._lock:
+            self.desde = datetime.now(timezone.utc)
+            self.latencia_ms = Histograma(LIMITES_LATENCIA_MS)
+            self.espera_cola_ms = Histograma(LIMITES_LATENCIA_MS)
+            self.tamaño_bytes = Histograma(LIMITES_TAMAÑO_BYTES)
+            self.estados: Dict[str, int] = {}
+            self.lecturas = 0
+            self.reintentos = 0
+            self.ocupacion_ms = 0.0  # tiempo total de trabajadores con una petición en curso
+            self.trabajadores = 0
+            self._por_segundo = deque()  # [segundo, peticiones, lecturas, bytes]
+    
+    def registrar_peticion(self, latencia_ms: float, tamaño: int, estado, lecturas: int = 1,
+                           reintento: bool = False):
+        """estado es el código HTTP o el nombre de la excepción de conexión"""
+        segundo = int(datetime.now(timezone.utc).timestamp())
+        with self._lock:
+            self.latencia_ms.registrar(latencia_ms)
+            self.tamaño_bytes.registrar(tamaño)
+            self.estados[str(estado)] = self.estados.get(str(estado), 0) + 1
+            self.ocupacion_ms += latencia_ms
+            if reintento:
+                self.reintentos += 1
+            else:
+                self.lecturas += lecturas
+            if not self._por_segundo or self._por_segundo[-1][0] != segundo:
+                self._por_segundo.append([segundo, 0, 0, 0])
+                while self._por_segundo[0][0] <= segundo - VENTANA_RENDIMIENTO_S:
+                    self._por_segundo.popleft()
+            actual = self._por_segundo[-1]
+            actual[1] += 1
+            actual[2] += 0 if reintento else lecturas
+            actual[3] += tamaño
+    
+    def registrar_espera(self, espera_ms: float):
+        with self._lock:
+            self.espera_cola_ms.registrar(espera_ms)
+    
+    def registrar_trabajadores(self, cantidad: int):
+        """Concurrencia del último cliente abierto, para estimar la ocupación"""
+        with self._lock:
+            self.trabajadores = cantidad
+    
+    def rendimiento(self) -> Dict:
+        """Peticiones, lecturas y bytes por segundo en la ventana móvil"""
+        ahora = int(datetime.now(timezone.utc).timestamp())
+        with self._lock:
+            recientes = [s for s in self._por_segundo if s[0] > ahora - VENTANA_RENDIMIENTO_S]
+            inicio = int(self.desde.timestamp())
+        segundos = max(1, min(VENTANA_RENDIMIENTO_S, ahora - inicio + 1))
+        return {
+            'ventana_s': segundos,
+            'peticiones_s': round(sum(s[1] for s in recientes) / segundos, 2),
+            'lecturas_s': round(sum(s[2] for s in recientes) / segundos, 2),
+            'bytes_s': round(sum(s[3] for s in recientes) / segundos, 1)
+        }
+    
+    def diagnostico(self) -> str:
+        """Lectura rápida de dónde está el cuello de botella"""
+        with self._lock:
+            peticiones = self.latencia_ms.total
+            rechazos = sum(n for estado, n in self.estados.items() if estado == '429' or estado.startswith('5'))
+            sin_conexion = sum(n for estado, n in self.estados.items() if not estado.isdigit())
+            latencia = self.latencia_ms.percentil(50) or 0.0
+            espera = self.espera_cola_ms.percentil(50) or 0.0
+            latencia_p99 = self.latencia_ms.percentil(99) or 0.0
+        if not peticiones:
+            return "Sin peticiones registradas todavía."
+        if rechazos / peticiones > 0.02:
+            return (f"n8n: {rechazos / peticiones:.1%} de las peticiones recibió 429/5xx. "
+                    "n8n no da abasto; bajar la concurrencia o agrupar lecturas en lotes.")
+        if sin_conexion / peticiones > 0.02:
+            return f"Red: {sin_conexion / peticiones:.1%} de las peticiones falló al conectar con n8n."
+        if espera > latencia:
+            if latencia_p99 > 5 * latencia:
+                return (f"n8n: las lecturas esperan en cola (p50 {espera:.0f} ms) y la latencia tiene una "
+                        f"cola larga (p99 {latencia_p99:.0f} ms vs p50 {latencia:.0f} ms); n8n se atrasa "
+                        "con la carga actual.")
+            return (f"Cliente: las lecturas esperan en cola (p50 {espera:.0f} ms) más de lo que tarda "
+                    f"n8n en responder (p50 {latencia:.0f} ms); subir la concurrencia o agrupar lecturas.")
+        return (f"Productor: la cola casi no espera (p50 {espera:.0f} ms) y n8n responde en "
+                f"{latencia:.0f} ms (p50); el límite está en preparar las lecturas, no en el envío.")
+    
+    def instantanea(self) -> Dict:
+        """Estado completo serializable a JSON"""
+        ahora = datetime.now(timezone.utc)
+        rendimiento = self.rendimiento()
+        diagnostico = self.diagnostico()
+        with self._lock:
+            transcurrido_ms = max((ahora - self.desde).total_seconds() * 1000, 1.0)
+            return {
+                'desde': self.desde.isoformat(),
+                'generado': ahora.isoformat(),
+                'peticiones': self.latencia_ms.total,
+                'lecturas': self.lecturas,
+                'reintentos': self.reintentos,
+                'estados': dict(sorted(self.estados.items())),
+                'latencia_ms': self.latencia_ms.resumen(),
+                'espera_cola_ms': self.espera_cola_ms.resumen(),
+                'tamaño_bytes': self.tamaño_bytes.resumen(),
+                'bytes_totales': int(self.tamaño_bytes.suma),
+                'rendimiento': rendimiento,
+                'ocupacion_trabajadores': (
+                    round(self.ocupacion_ms / (self.trabajadores * transcurrido_ms), 3)
+                    if self.trabajadores else None
+                ),
+                'diagnostico': diagnostico
+            }
+
+@st.cache_resource(show_spinner=False)
+def obtener_metricas_ingesta() -> MetricasIngesta:
+    """Métricas del webhook compartidas por sesiones, envíos masivos y el spool"""
+    return MetricasIngesta()
+
+class ClienteIngestaAsync:
+    """Cliente asíncrono del webhook de n8n con concurrencia acotada y contrapresión.
+
+    Mantiene hasta `concurrencia` peticiones en vuelo. enviar() espera cuando la
+    cola interna está llena, así el productor se frena si n8n se atrasa. Las
+    respuestas 429 y 5xx, y los errores de conexión, se reintentan con backoff
+    exponencial respetando Retry-After. Cada intento queda registrado en
+    `metricas` (por defecto las del proceso, ver MetricasIngesta).
+
+    Corre en el bucle de PoolWebhook y toma sus conexiones de ahí.
+
+    Uso:
+        async def enviar_todas(en_llamador):
+            async with ClienteIngestaAsync(al_completar=callback) as cliente:
+                await cliente.enviar(payload, referencia)
+        obtener_pool_webhook().ejecutar(enviar_todas)
+    """
+    
+    def __init__(self, url: str = None, concurrencia: int = None, tamaño_cola: int = None,
+                 max_reintentos: int = None, al_completar=None,
+                 metricas: Optional[MetricasIngesta] = None):
+        self.url = url or N8N_WEBHOOK_URL
+        self.concurrencia = concurrencia or INGESTA_CONCURRENCIA
+        self.tamaño_cola = tamaño_cola or self.concurrencia * 4
+        self.max_reintentos = INGESTA_MAX_REINTENTOS if max_reintentos is None else max_reintentos
+        self.al_completar = al_completar  # al_completar(referencia, error o None)
+        self.metricas = metricas or obtener_metricas_ingesta()
+        self.en_vuelo = 0
+        self.enviadas = 0
+        self.fallidas = 0
+        self._cola = None
+        self._trabajadores = []
+        self._conexiones = []
+    
+    @property
+    def profundidad_cola(self) -> int:
+        """Lecturas esperando turno de envío"""
+        return self._cola.qsize() if self._cola else 0
+    
+    async def __aenter__(self):
+        pool = obtener_pool_webhook()
+        if asyncio.get_running_loop() is not pool.bucle:
+            raise RuntimeError("ClienteIngestaAsync debe correr en el bucle del pool (PoolWebhook.ejecutar)")
+        self._cola = asyncio.Queue(maxsize=self.tamaño_cola)
+        # Una conexión keep-alive del pool del proceso por trabajador
+        self._conexiones = pool.tomar(self.concurrencia)
+        self._trabajadores = [asyncio.create_task(self._trabajar(http)) for http in self._conexiones]
+        self.metricas.registrar_trabajadores(self.concurrencia)
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.cerrar()
+    
+    async def enviar(self, payload, referencia=None, encabezados: Optional[Dict] = None,
+                     lecturas: int = 1):
+        """Encola una lectura (o un sobre ya codificado, en bytes, con `lecturas` lecturas);
+        espera si la cola está llena"""
+        await self._cola.put((referencia, payload, encabezados, lecturas, asyncio.get_running_loop().time()))
+    
+    async def esperar(self):
+        """Espera a que se entregue (o falle) todo lo encolado"""
+        await self._cola.join()
+    
+    async def cerrar(self):
+        """Espera a que se vacíe la cola y libera las conexiones"""
+        if self._cola is not None:
+            await self._cola.join()
+        for trabajador in self._trabajadores:
+            trabajador.cancel()
+        await asyncio.gather(*self._trabajadores, return_exceptions=True)
+        self._trabajadores = []
+        await obtener_pool_webhook().devolver(self._conexiones)
+        self._conexiones = []
+    
+    async def _trabajar(self, http: httpx.AsyncClient):
+        while True:
+            referencia, payload, encabezados, lecturas, encolado = await self._cola.get()
+            self.metricas.registrar_espera((asyncio.get_running_loop().time() - encolado) * 1000)
+            self.en_vuelo += 1
+            try:
+                error = await self._entregar(http, payload, encabezados, lecturas)
+            except Exception as e:
+                error = f"Error inesperado: {e}"
+            finally:
+                self.en_vuelo -= 1
+            if error:
+                self.fallidas += 1
+            else:
+                self.enviadas += 1
+            if self.al_completar:
+                self.al_completar(referencia, error)
+            self._cola.task_done()
+    
+    async def _entregar(self, http: httpx.AsyncClient, payload,
+                        encabezados: Optional[Dict] = None, lecturas: int = 1) -> Optional[str]:
+        """Envía una lectura con reintentos; devuelve None o el mensaje de error"""
+        error = None
+        # Se serializa una sola vez: el mismo cuerpo sirve para medir y para los reintentos
+        cuerpo = payload
+        if not isinstance(payload, bytes):
+            cuerpo = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            encabezados = {'Content-Type': 'application/json', **(encabezados or {})}
+        reloj = asyncio.get_running_loop().time
+        for intento in range(self.max_reintentos + 1):
+            espera = INGESTA_BACKOFF_BASE * (2 ** intento)
+            inicio = reloj()
+            estado = None
+            try:
+                response = await http.post(self.url, content=cuerpo, headers=encabezados)
+                estado = response.status_code
+                if response.is_success:
+                    return None
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code != 429 and response.status_code < 500:
+                    return error
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    espera = float(retry_after)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                estado = type(e).__name__
+                error = f"Error de conexión: {e}"
+            except httpx.HTTPError as e:
+                # El servidor pudo haber recibido la lectura: no se reintenta
+                estado = type(e).__name__
+                return f"Error de conexión: {type(e).__name__} {e}"
+            finally:
+                if estado is not None:
+                    self.metricas.registrar_peticion(
+                        (reloj() - inicio) * 1000, len(cuerpo), estado, lecturas, reintento=intento > 0
+                    )
+            if intento < self.max_reintentos:
+                await asyncio.sleep(min(espera, INGESTA_BACKOFF_MAXIMO))
+        return error
+
+def enviar_lecturas_webhook(payloads: List, al_progresar=None,
+                            tamaño_lote: int = TAMAÑO_LOTE_INGESTA,
+                            concurrencia: int = None, lecturas_por_peticion: int = 1,
+                            compresion: str = 'gzip') -> pd.DataFrame:
+    """Envía (fila, payload) al webhook de n8n con el cliente asíncrono.
+
+    Con lecturas_por_peticion > 1 las lecturas viajan agrupadas en sobres
+    comprimidos (ver codificar_lote) a N8N_WEBHOOK_LOTES_URL; si un sobre
+    falla, fallan todas sus filas. Sin N8N_WEBHOOK_LOTES_URL se envía una
+    lectura por petición.
+    al_progresar(enviadas, total, profundidad_cola) se llama cada
+    `tamaño_lote` lecturas completadas. Devuelve un DataFrame con las filas
+    que fallaron (fila, campo, error).
+    """
+    if not N8N_WEBHOOK_LOTES_URL:
+        lecturas_por_peticion = 1
+    fallidas = []
+    total = len(payloads)
+    grupos = [payloads[i:i + lecturas_por_peticion] for i in range(0, total, lecturas_por_peticion)]
+    
+    async def enviar_todas(en_llamador):
+        completadas = 0
+        avisadas = 0
+        progreso = en_llamador(al_progresar)
+        
+        def al_completar(indice, error):
+            nonlocal completadas, avisadas
+            grupo = grupos[indice]
+            completadas += len(grupo)
+            if error:
+                fallidas.extend({'fila': fila + 1, 'campo': 'webhook', 'error': error} for fila, _ in grupo)
+            if progreso and (completadas - avisadas >= tamaño_lote or completadas == total):
+                avisadas = completadas
+                progreso(completadas, total, cliente.profundidad_cola)
+        
+        url = N8N_WEBHOOK_LOTES_URL if lecturas_por_peticion > 1 else N8N_WEBHOOK_URL
+        async with ClienteIngestaAsync(url=url, concurrencia=concurrencia, al_completar=al_completar) as cliente:
+            for indice, grupo in enumerate(grupos):
+                if lecturas_por_peticion > 1:
+                    cuerpo, encabezados = codificar_lote([payload for _, payload in grupo], compresion)
+                    await cliente.enviar(cuerpo, indice, encabezados, lecturas=len(grupo))
+                else:
+                    payload = grupo[0][1]
+                    encabezados = {'Idempotency-Key': payload['event_id']} if 'event_id' in payload else None
+                    await cliente.enviar(payload, indice, encabezados)
+    
+    obtener_pool_webhook().ejecutar(enviar_todas)
+    return pd.DataFrame(fallidas, columns=['fila', 'campo', 'error'])
+
+def error_definitivo(error: str) -> bool:
+    """Solo un 429, un 5xx o un error de conexión se resuelven reintentando; el resto es un rechazo"""
+    return error.startswith('HTTP ') and not error.startswith(('HTTP 429', 'HTTP 5'))
+
+# ============================================
+# SPOOL DE INGESTA
+# ============================================
+
+# Lecturas no entregadas a n8n: segmentos JSONL de solo escritura al final
+SPOOL_DIRECTORIO = os.getenv("SPOOL_DIRECTORIO", "spool_ingesta")
+SPOOL_TAMAÑO_SEGMENTO = 4 * 1024 * 1024
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_MB", "256")) * 1024 * 1024
+SPOOL_MAX_EDAD_HORAS = int(os.getenv("SPOOL_MAX_EDAD_HORAS", "72"))
+SPOOL_LOTE = 200
+SPOOL_INTERVALO_S = 5.0
+
+class SpoolIngesta:
+    """Cola persistente en disco para lecturas que no llegaron al webhook.
+
+    Las lecturas se agregan al final del segmento activo (segmento_NNNNNNNN.jsonl)
+    con una clave de idempotencia (su event_id, o una aleatoria si no lo trae). Un hilo drenador las reenvía de a una y
+    en el orden del segmento, con la clave en el encabezado Idempotency-Key, y
+    guarda el avance en cursor.json; los segmentos ya entregados se borran.
+    Cada lectura se intenta una sola vez: ante el primer fallo reintentable el
+    drenador anota el error y espera con su propio backoff antes de seguir desde
+    esa lectura, así que una lectura puede llegar dos veces pero nunca se pierde
+    dentro de los límites de tamaño y antigüedad. Las rechazadas (ver
+    error_definitivo) van a rechazadas.jsonl.
+    """
+    
+    def __init__(self, directorio: str = SPOOL_DIRECTORIO, url: str = None):
+        self.directorio = directorio
+        self.url = url or N8N_WEBHOOK_URL
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._resultados = {}
+        self.metricas = {
+            'pendientes': 0, 'entregadas': 0, 'rechazadas': 0, 'expiradas': 0, 'descartadas': 0,
+            'estado': 'detenido', 'ultimo_error': None, 'ultima_entrega': None
+        }
+        
+        segmentos = self._segmentos()
+        self._segmento_escritura = segmentos[-1] if segmentos else 1
+        self._cursor = (segmentos[0] if segmentos else 1, 0)
+        ruta_cursor = os.path.join(directorio, 'cursor.json')
+        if os.path.exists(ruta_cursor):
+            with open(ruta_cursor, encoding='utf-8') as archivo:
+                guardado = json.load(archivo)
+            self._cursor = max(self._cursor, (guardado['segmento'], guardado['offset']))
+        self.metricas['pendientes'] = sum(
+            self._contar_lineas(segmento, self._cursor[1] if segmento == self._cursor[0] else 0)
+            for segmento in segmentos if segmento >= self._cursor[0]
+        )
+    
+    # --- Archivos ---
+    
+    def _ruta(self, segmento: int) -> str:
+        return os.path.join(self.directorio, f"segmento_{segmento:08d}.jsonl")
+    
+    def _segmentos(self) -> List[int]:
+        return sorted(
+            int(nombre[9:17]) for nombre in os.listdir(self.directorio)
+            if nombre.startswith('segmento_') and nombre.endswith('.jsonl')
+        )
+    
+    def _contar_lineas(self, segmento: int, desde: int = 0) -> int:
+        with open(self._ruta(segmento), 'rb') as archivo:
+            archivo.seek(desde)
+            return sum(1 for _ in archivo)
+    
+    def _guardar_cursor(self):
+        ruta = os.path.join(self.directorio, 'cursor.json')
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+            json.dump({'segmento': self._cursor[0], 'offset': self._cursor[1]}, archivo)
+        os.replace(ruta + '.tmp', ruta)
+    
+    def tamaño_bytes(self) -> int:
+        return sum(os.path.getsize(self._ruta(segmento)) for segmento in self._segmentos())
+    
+    # --- Escritura ---
+    
+    def agregar(self, payloads: List[Dict]) -> List[str]:
+        """Persiste lecturas no entregadas y despierta al drenador; devuelve sus claves"""
+        claves = [payload.get('event_id') or str(uuid.uuid4()) for payload in payloads]
+        encolado = datetime.now(timezone.utc).timestamp()
+        lineas = ''.join(
+            json.dumps({'clave': clave, 'encolado': encolado, 'payload': payload}, ensure_ascii=False, default=str) + '\n'
+            for clave, payload in zip(claves, payloads)
+        )
+        with self._lock:
+            ruta = self._ruta(self._segmento_escritura)
+            if os.path.exists(ruta) and os.path.getsize(ruta) >= SPOOL_TAMAÑO_SEGMENTO:
+                self._segmento_escritura += 1
+                ruta = self._ruta(self._segmento_escritura)
+            with open(ruta, 'a', encoding='utf-8') as archivo:
+                archivo.write(lineas)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            self.metricas['pendientes'] += len(payloads)
+            self._aplicar_limite_tamaño()
+        self._despertar.set()
+        return claves
+    
+    def _aplicar_limite_tamaño(self):
+        """Sobre el límite se descartan los segmentos más antiguos (nunca el activo)"""
+        while self._cursor[0] < self._segmento_escritura and self.tamaño_bytes() > SPOOL_MAX_BYTES:
+            segmento, offset = self._cursor
+            if os.path.exists(self._ruta(segmento)):
+                perdidas = self._contar_lineas(segmento, offset)
+                os.remove(self._ruta(segmento))
+                self.metricas['descartadas'] += perdidas
+                self.metricas['pendientes'] -= perdidas
+            self._cursor = (segmento + 1, 0)
+            self._guardar_cursor()
+    
+    # --- Lectura y drenado ---
+    
+    def _leer_lote(self, maximo: int) -> List:
+        """Siguientes lecturas desde el cursor: [(posición tras la línea, entrada o None)].
+
+        Las ilegibles vienen como None para que el cursor las pase.
+        """
+        lote = []
+        with self._lock:
+            segmento, offset = self._cursor
+            while len(lote) < maximo and segmento <= self._segmento_escritura:
+                ruta = self._ruta(segmento)
+                if not os.path.exists(ruta):
+                    segmento, offset = segmento + 1, 0
+                    continue
+                with open(ruta, 'rb') as archivo:
+                    archivo.seek(offset)
+                    while len(lote) < maximo:
+                        linea = archivo.readline()
+                        if not linea.endswith(b'\n'):
+                            # Fin del segmento, o una escritura cortada por una caída
+                            if linea and segmento < self._segmento_escritura:
+                                offset += len(linea)
+                                lote.append(((segmento, offset), None))
+                            break
+                        offset += len(linea)
+                        try:
+                            entrada = json.loads(linea)
+                        except ValueError:
+                            entrada = None
+                        lote.append(((segmento, offset), entrada))
+                if len(lote) < maximo:
+                    if segmento == self._segmento_escritura:
+                        break
+                    segmento, offset = segmento + 1, 0
+        return lote
+    
+    def _confirmar(self, posicion, procesadas: int):
+        """Avanza el cursor tras un lote entregado y borra los segmentos ya consumidos"""
+        with self._lock:
+            if posicion <= self._cursor:
+                return  # El segmento se descartó por tamaño mientras se enviaba
+            for segmento in range(self._cursor[0], posicion[0]):
+                if os.path.exists(self._ruta(segmento)):
+                    os.remove(self._ruta(segmento))
+            self._cursor = posicion
+            self._guardar_cursor()
+            self.metricas['pendientes'] = max(0, self.metricas['pendientes'] - procesadas)
+    
+    def _rechazar(self, entrada: Dict, error: str):
+        with open(os.path.join(self.directorio, 'rechazadas.jsonl'), 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps({**entrada, 'error': error}, ensure_ascii=False) + '\n')
+        self.metricas['rechazadas'] += 1
+    
+    def antiguedad_s(self) -> Optional[float]:
+        """Segundos desde que se encoló la lectura pendiente más antigua"""
+        entradas = [entrada for _, entrada in self._leer_lote(10) if entrada is not None]
+        if not entradas:
+            return None
+        return datetime.now(timezone.utc).timestamp() - entradas[0]['encolado']
+    
+    def drenar_ahora(self):
+        self._despertar.set()
+    
+    def iniciar(self):
+        obtener_pool_webhook().lanzar(self._drenar())
+    
+    async def _drenar(self):
+        espera = SPOOL_INTERVALO_S
+        # Una conexión y sin reintentos del cliente: se conserva el orden y solo
+        # el backoff del drenador decide cuándo volver a intentar
+        async with ClienteIngestaAsync(
+            url=self.url, concurrencia=1, max_reintentos=0,
+            al_completar=lambda indice, error: self._resultados.__setitem__(indice, error)
+        ) as cliente:
+            while True:
+                if self.metricas['estado'] != 'reintentando':
+                    self.metricas['estado'] = 'esperando'
+                # Sondeo corto en vez de un hilo auxiliar, que no sobrevive al cierre del intérprete
+                limite = asyncio.get_running_loop().time() + espera
+                while not self._despertar.is_set() and asyncio.get_running_loop().time() < limite:
+                    await asyncio.sleep(0.2)
+                self._despertar.clear()
+                
+                while True:
+                    lote = self._leer_lote(SPOOL_LOTE)
+                    if not lote:
+                        espera = SPOOL_INTERVALO_S
+                        break
+                    self.metricas['estado'] = 'drenando'
+                    limite_edad = datetime.now(timezone.utc).timestamp() - SPOOL_MAX_EDAD_HORAS * 3600
+                    
+                    # El cursor avanza hasta la primera lectura que haya que reintentar
+                    avance = None
+                    procesadas = 0
+                    fallo = None
+                    for indice, (posicion, entrada) in enumerate(lote):
+                        if entrada is not None and entrada['encolado'] < limite_edad:
+                            self.metricas['expiradas'] += 1
+                        elif entrada is not None:
+                            self._resultados = {}
+                            await cliente.enviar(entrada['payload'], indice, {'Idempotency-Key': entrada['clave']})
+                            await cliente.esperar()
+                            error = self._resultados.get(indice)
+                            if error and not error_definitivo(error):
+                                fallo = error
+                                break
+                            if error:
+                                self._rechazar(entrada, error)
+                            else:
+                                self.metricas['entregadas'] += 1
+                        avance = posicion
+                        procesadas += 1
+                    if avance:
+                        self._confirmar(avance, procesadas)
+                        self.metricas['ultima_entrega'] = datetime.now().isoformat(timespec='seconds')
+                    if fallo:
+                        self.metricas['ultimo_error'] = fallo
+                        self.metricas['estado'] = 'reintentando'
+                        espera = min(espera * 2, INGESTA_BACKOFF_MAXIMO * 4)
+                        break
+
+@st.cache_resource
+def obtener_spool() -> SpoolIngesta:
+    """Spool de ingesta del proceso, con su drenador en segundo plano"""
+    spool = SpoolIngesta()
+    spool.iniciar()
+    return spool
+
+# ============================================
+# SIMULADOR DE FLOTA
+# ============================================
+
+# Horas de un turno simulado; al terminar, el operador duerme y empieza el siguiente
+DURACION_TURNO_SIMULADO = 10.0
+# Fracción de la deuda de sueño que se arrastra de un turno al siguiente
+ARRASTRE_DEUDA_SUEÑO = 0.7
+SUEÑO_NECESARIO_HORAS = 8.0
+
+def factor_fatiga(horas_turno, deuda_sueño):
+    """Carga de fatiga entre 0 (descansado, inicio de turno) y 1 (final de turno con deuda alta).
+
+    Acepta escalares o arrays.
+    """
+    return np.minimum(1.0, 0.6 * horas_turno / DURACION_TURNO_SIMULADO + 0.4 * np.minimum(deuda_sueño, 10.0) / 10.0)
+
+SIMULADOR_PUERTO_STUB = int(os.getenv("SIMULADOR_PUERTO_STUB", "8787"))
+SIMULADOR_DIRECTORIO = os.getenv("SIMULADOR_DIRECTORIO", "simulaciones")
+
+class SimuladorFlota:
+    """Flota simulada de operadores con dispositivos que reportan periódicamente.
+
+    Cada operador lleva su propio estado entre lecturas: horas en el turno,
+    sueño previo y deuda de sueño acumulada. Al cerrar un turno se sortea el
+    descanso y la deuda se arrastra al siguiente, de modo que las series son
+    continuas en el tiempo en lugar de valores sueltos.
+
+    mezcla indica la fracción de operadores que porta cada tipo de dispositivo.
+    aceleracion es cuántos segundos simulados avanza cada segundo real, para
+    recorrer turnos completos en pocos minutos.
+    """
+    
+    def __init__(self, n_operadores: int, mezcla: Dict[str, float], frecuencia_hz: float = 1.0,
+                 aceleracion: float = 1.0, codigos: Optional[List[str]] = None,
+                 inicio: Optional[datetime] = None):
+        self.frecuencia_hz = frecuencia_hz
+        self.aceleracion = aceleracion
+        self.instante = inicio or datetime.now()
+        codigos = list(codigos or [])[:n_operadores]
+        codigos += [f"SIM-{i:05d}" for i in range(len(codigos) + 1, n_operadores + 1)]
+        
+        self.operadores = []
+        for codigo in codigos:
+            estado = {
+                'codigo': codigo,
+                'tipo_turno': random.choice(["DIA", "NOCHE", "ROTATIVO"]),
+                'maquinaria': random.choice(["Excavadora", "Camión Minero", "Pala Cargadora", "Bulldozer", "Grúa"]),
+                'temperatura': random.uniform(15.0, 40.0),
+                'deuda_sueño': random.uniform(0.0, 4.0),
+                # Turnos desfasados para que la flota no esté toda en la misma hora
+                'horas_turno': random.uniform(0.0, DURACION_TURNO_SIMULADO)
+            }
+            self._dormir(estado)
+            self.operadores.append(estado)
+        
+        self.dispositivos = []
+        for tipo, fraccion in mezcla.items():
+            portadores = random.sample(range(n_operadores), round(n_operadores * fraccion))
+            for indice in sorted(portadores):
+                self.dispositivos.append((tipo, f"SIM-{tipo[:4]}-{indice + 1:05d}", self.operadores[indice]))
+    
+    def _dormir(self, estado: Dict):
+        """Sortea el descanso previo al turno y actualiza la deuda de sueño"""
+        # Quien arrastra deuda tiende a recuperar algo, pero rara vez toda
+        sueño = min(max(random.gauss(6.8 + 0.15 * estado['deuda_sueño'], 1.0), 4.0), 9.0)
+        estado['sueño_previo'] = sueño
+        estado['deuda_sueño'] = max(0.0, ARRASTRE_DEUDA_SUEÑO * estado['deuda_sueño'] + SUEÑO_NECESARIO_HORAS - sueño)
+    
+    @property
+    def lecturas_por_tick(self) -> int:
+        return len(self.dispositivos)
+    
+    def tick(self) -> List[Dict]:
+        """Avanza un intervalo de muestreo y devuelve una lectura por dispositivo"""
+        segundos = self.aceleracion / self.frecuencia_hz
+        self.instante += timedelta(seconds=segundos)
+        for estado in self.operadores:
+            estado['horas_turno'] += segundos / 3600
+            if estado['horas_turno'] >= DURACION_TURNO_SIMULADO:
+                estado['horas_turno'] -= DURACION_TURNO_SIMULADO
+                self._dormir(estado)
+        
+        timestamp = self.instante.isoformat()
+        return [
+            con_clave_evento({
+                "device_type": tipo,
+                "device_external_id": dispositivo,
+                "operator_external_id": estado['codigo'],
+                "timestamp": timestamp,
+                **generar_datos_simulados(tipo, estado)
+            })
+            for tipo, dispositivo, estado in self.dispositivos
+        ]
+
+@st.cache_resource
+def obtener_stub_local() -> Dict:
+    """Endpoint HTTP local que acepta lecturas (sueltas o en sobres) y solo las cuenta.
+
+    Sirve para medir el techo del cliente y del simulador sin n8n de por medio.
+    Se levanta una vez por proceso.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    contadores = {'peticiones': 0, 'recibidas': 0, 'bytes': 0}
+    lock = threading.Lock()
+    
+    class ManejadorStub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def do_POST(self):
+            largo = int(self.headers.get('Content-Length', 0))
+            cuerpo = self.rfile.read(largo)
+            lecturas = 1
+            if self.headers.get('Content-Type') == TIPO_CONTENIDO_LOTE:
+                try:
+                    lecturas = len(decodificar_lote(cuerpo, self.headers.get('Content-Encoding')))
+                except (ValueError, OSError) as e:
+                    mensaje = str(e).encode('utf-8')
+                    self.send_response(400)
+                    self.send_header('Content-Length', str(len(mensaje)))
+                    self.end_headers()
+                    self.wfile.write(mensaje)
+                    return
+            with lock:
+                contadores['peticiones'] += 1
+                contadores['recibidas'] += lecturas
+                contadores['bytes'] += largo
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', '11')
+            self.end_headers()
+            self.wfile.write(b'{"ok":true}')
+        
+        def log_message(self, *args):
+            pass
+    
+    ThreadingHTTPServer.request_queue_size = 256
+    servidor = ThreadingHTTPServer(('127.0.0.1', SIMULADOR_PUERTO_STUB), ManejadorStub)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return {'url': f"http://127.0.0.1:{SIMULADOR_PUERTO_STUB}/", 'contadores': contadores}
+
+def _emitir_simulacion(simulador: SimuladorFlota, destino: str, duracion_s: float,
+                       url: Optional[str], ruta_archivo: Optional[str],
+                       concurrencia: Optional[int], al_progresar,
+                       lecturas_por_peticion: int = 1, compresion: str = 'gzip') -> Dict:
+    """Emite la flota en este proceso; ver ejecutar_simulacion"""
+    estadisticas = {
+        'ticks': 0, 'generadas': 0, 'enviadas': 0, 'fallidas': 0,
+        'atraso_s': 0.0, 'atraso_max_s': 0.0, 'en_cola': 0, 'lecturas_por_s': 0.0,
+        'ultimo_error': None
+    }
+    intervalo = 1.0 / simulador.frecuencia_hz
+    
+    def al_completar(lecturas, error):
+        if error:
+            estadisticas['fallidas'] += lecturas
+            estadisticas['ultimo_error'] = error
+        else:
+            estadisticas['enviadas'] += lecturas
+    
+    async def emitir(publicar, progreso, cliente=None):
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        while loop.time() - inicio < duracion_s:
+            programado = inicio + estadisticas['ticks'] * intervalo
+            espera = programado - loop.time()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            lecturas = simulador.tick()
+            if lecturas_por_peticion > 1 and cliente is not None:
+                for desde in range(0, len(lecturas), lecturas_por_peticion):
+                    grupo = lecturas[desde:desde + lecturas_por_peticion]
+                    cuerpo, encabezados = codificar_lote(grupo, compresion)
+                    await cliente.enviar(cuerpo, len(grupo), encabezados, lecturas=len(grupo))
+            else:
+                for lectura in lecturas:
+                    await publicar(lectura)
+            estadisticas['ticks'] += 1
+            estadisticas['generadas'] += simulador.lecturas_por_tick
+            ahora = loop.time()
+            estadisticas['atraso_s'] = max(0.0, ahora - (inicio + estadisticas['ticks'] * intervalo))
+            estadisticas['atraso_max_s'] = max(estadisticas['atraso_max_s'], estadisticas['atraso_s'])
+            estadisticas['lecturas_por_s'] = estadisticas['generadas'] / max(ahora - inicio, 1e-6)
+            estadisticas['en_cola'] = cliente.profundidad_cola if cliente else 0
+            if progreso:
+                progreso(dict(estadisticas))
+    
+    if destino == 'archivo':
+        async def escribir_archivo():
+            with open(ruta_archivo, 'w', encoding='utf-8') as archivo:
+                async def escribir(lectura):
+                    archivo.write(json.dumps(lectura, ensure_ascii=False) + '\n')
+                    estadisticas['enviadas'] += 1
+                await emitir(escribir, al_progresar)
+        asyncio.run(escribir_archivo())
+        return estadisticas
+    
+    async def enviar_http(en_llamador):
+        async with ClienteIngestaAsync(url=url, concurrencia=concurrencia, al_completar=al_completar) as cliente:
+            await emitir(lambda lectura: cliente.enviar(lectura, 1), en_llamador(al_progresar), cliente)
+    
+    obtener_pool_webhook().ejecutar(enviar_http)
+    return estadisticas
+
+# Procesos hijos del simulador: intérpretes nuevos que cargan esta app como módulo.
+# No se usa fork: el servidor de Streamlit tiene hilos y locks tomados que el hijo heredaría.
+CODIGO_PROCESO_SIMULADOR = """
+import importlib.util, pickle, sys
+spec = importlib.util.spec_from_file_location('app_simulador', sys.argv[1])
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)
+app._emitir_fragmento_simulacion(pickle.load(sys.stdin.buffer))
+"""
+PREFIJO_REPORTE_SIMULADOR = "@@simulador "
+
+def _emitir_fragmento_simulacion(trabajo: Dict):
+    """Punto de entrada de un proceso hijo del simulador; ver ejecutar_simulacion.
+
+    Reporta por stdout una línea JSON por tick y una final con fin=True.
+    """
+    simulador = SimuladorFlota.__new__(SimuladorFlota)
+    simulador.__dict__.update(trabajo['estado'])
+    
+    def reportar(estadisticas, fin=False):
+        sys.stdout.write(PREFIJO_REPORTE_SIMULADOR + json.dumps({'fin': fin, 'estadisticas': estadisticas}) + '\n')
+        sys.stdout.flush()
+    
+    final = _emitir_simulacion(
+        simulador, trabajo['destino'], trabajo['duracion_s'], trabajo['url'], None,
+        trabajo['concurrencia'], reportar, trabajo['lecturas_por_peticion'], trabajo['compresion']
+    )
+    reportar(final, fin=True)
+
+def _sumar_estadisticas(por_proceso: Dict, procesos: int) -> Dict:
+    """Estadísticas agregadas de los procesos que ya reportaron"""
+    estadisticas = list(por_proceso.values())
+    total = {
+        'procesos': procesos,
+        'ticks': min((e['ticks'] for e in estadisticas), default=0),
+        'atraso_s': max((e['atraso_s'] for e in estadisticas), default=0.0),
+        'atraso_max_s': max((e['atraso_max_s'] for e in estadisticas), default=0.0),
+        'ultimo_error': next((e['ultimo_error'] for e in estadisticas if e['ultimo_error']), None)
+    }
+    for clave in ('generadas', 'enviadas', 'fallidas', 'en_cola', 'lecturas_por_s'):
+        total[clave] = sum(e[clave] for e in estadisticas)
+    return total
+
+def ejecutar_simulacion(simulador: SimuladorFlota, destino: str, duracion_s: float,
+                        url: Optional[str] = None, ruta_archivo: Optional[str] = None,
+                        concurrencia: int = None, procesos: int = 1, al_progresar=None,
+                        lecturas_por_peticion: int = 1, compresion: str = 'gzip') -> Dict:
+    """Emite la flota a ritmo real durante duracion_s segundos.
+
+    destino es 'webhook' / 'stub' (POST a url) o 'archivo' (JSONL en
+    ruta_archivo, legible por la ingesta masiva). Si el destino no da abasto,
+    la contrapresión del cliente frena los ticks y el atraso respecto del
+    reloj crece: ese atraso es la medida de saturación.
+
+    Con lecturas_por_peticion > 1 cada tick se envía en sobres comprimidos
+    (codificar_lote) en lugar de una petición por lectura.
+
+    Un proceso envía del orden de mil peticiones/s por HTTP; con procesos > 1
+    los dispositivos se reparten entre procesos hijos (intérpretes nuevos,
+    ver CODIGO_PROCESO_SIMULADOR), cada uno con su propio cliente, y las
+    estadísticas se suman. Si un hijo termina sin reportar, se devuelve lo
+    acumulado con 'procesos_caidos' y el motivo en 'ultimo_error'.
+    al_progresar(estadisticas) se llama una vez por tick.
+    """
+    if procesos <= 1 or destino == 'archivo':
+        return _emitir_simulacion(simulador, destino, duracion_s, url, ruta_archivo, concurrencia, al_progresar,
+                                  lecturas_por_peticion, compresion)
+    
+    eventos = queue.SimpleQueue()
+    
+    def leer_reportes(indice, salida):
+        for linea in salida:
+            linea = linea.decode('utf-8', 'replace')
+            if linea.startswith(PREFIJO_REPORTE_SIMULADOR):
+                eventos.put((indice, json.loads(linea[len(PREFIJO_REPORTE_SIMULADOR):])))
+        eventos.put((indice, None))  # El hijo cerró su salida
+    
+    hijos = []
+    for indice in range(procesos):
+        errores = tempfile.TemporaryFile()
+        hijo = subprocess.Popen(
+            [sys.executable, '-c', CODIGO_PROCESO_SIMULADOR, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errores
+        )
+        threading.Thread(target=leer_reportes, args=(indice, hijo.stdout), daemon=True).start()
+        hijos.append((hijo, errores))
+    for indice, (hijo, _) in enumerate(hijos):
+        estado = {**vars(simulador), 'dispositivos': simulador.dispositivos[indice::procesos]}
+        try:
+            hijo.stdin.write(pickle.dumps({
+                'estado': estado, 'destino': destino, 'duracion_s': duracion_s, 'url': url,
+                'concurrencia': concurrencia, 'lecturas_por_peticion': lecturas_por_peticion,
+                'compresion': compresion
+            }))
+            hijo.stdin.close()
+        except OSError:
+            pass  # El hijo ya murió: se detecta al cerrarse su salida
+    
+    por_proceso = {}
+    terminados = set()
+    caidos = set()
+    total = _sumar_estadisticas(por_proceso, procesos)
+    while len(terminados) + len(caidos) < procesos:
+        try:
+            indice, evento = eventos.get(timeout=duracion_s + HTTP_TIMEOUT_LECTURA * 2)
+        except queue.Empty:
+            caidos |= set(range(procesos)) - terminados
+            break
+        if evento is None:
+            if indice not in terminados:
+                caidos.add(indice)
+            continue
+        por_proceso[indice] = evento['estadisticas']
+        if evento['fin']:
+            terminados.add(indice)
+        total = _sumar_estadisticas(por_proceso, procesos)
+        if al_progresar and not evento['fin']:
+            al_progresar(total)
+    
+    motivos = []
+    for indice, (hijo, errores) in enumerate(hijos):
+        try:
+            hijo.wait(timeout=HTTP_TIMEOUT_LECTURA)
+        except subprocess.TimeoutExpired:
+            hijo.kill()
+            hijo.wait()
+        if indice in caidos:
+            errores.seek(0)
+            lineas = [l for l in errores.read().decode('utf-8', 'replace').splitlines() if l.strip()]
+            motivos.append(f"proceso {indice + 1} (código {hijo.returncode}): {lineas[-1] if lineas else 'sin salida'}")
+        errores.close()
+    
+    total['procesos_caidos'] = len(caidos)
+    if caidos:
+        total['ultimo_error'] = f"{len(caidos)} de {procesos} procesos terminaron sin reportar: " + "; ".join(motivos)
+    return total
+
+# ============================================
+# GENERADOR DE DATOS SINTÉTICOS
+# ============================================
+
+NIVELES_RIESGO = ['BAJO', 'MEDIO', 'ALTO', 'CRITICO']
+# Límite inferior de MEDIO, ALTO y CRITICO sobre el índice de fatiga
+UMBRALES_RIESGO = [40, 70, 85]
+
+# Hora de inicio de cada tipo de turno; ROTATIVO alterna DIA y NOCHE por semana
+HORA_INICIO_TURNO = {'DIA': 8, 'NOCHE': 20}
+MAQUINARIAS_SIMULADAS = ["Excavadora", "Camión Minero", "Pala Cargadora", "Bulldozer", "Grúa"]
+
+# Alertas derivadas de cada lectura: (tipo_alerta, nivel_alerta, título); una por tipo y turno
+ALERTAS_SINTETICAS = [
+    ('FATIGA_CRITICA', 'CRITICO', 'Fatiga crítica detectada'),
+    ('FATIGA_ALTA', 'URGENTE', 'Fatiga alta detectada'),
+    ('HRV_BAJO', 'ATENCION', 'Variabilidad cardíaca baja'),
+    ('SPO2_BAJO', 'ATENCION', 'Saturación de oxígeno baja'),
+    ('ANOMALIA_DETECTADA', 'INFO', 'Anomalía en las lecturas')
+]
+
+# Filas por insert multi-fila contra Supabase
+TAMAÑO_LOTE_INSERCION = 1000
+
+# Código de los operadores a los que se asigna el histórico insertado en Supabase
+PREFIJO_OPERADOR_SINTETICO = "SINT-"
+
+def clasificar_riesgo(indice, umbrales: Optional[List[float]] = None) -> pd.Categorical:
+    """Clasificación de riesgo de uno o varios índices de fatiga (sin índice queda sin clase)"""
+    valores = np.atleast_1d(_columna_numerica(indice) if not np.isscalar(indice) and indice is not None
+                            else np.asarray(indice, dtype=float))
+    codigos = np.searchsorted(umbrales or UMBRALES_RIESGO, valores, side='right')
+    codigos[np.isnan(valores)] = -1
+    return pd.Categorical.from_codes(codigos, categories=NIVELES_RIESGO)
+
+def condiciones_alerta(df_metricas: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Máscara de lecturas que disparan cada tipo de ALERTAS_SINTETICAS"""
+    def columna(nombre):
+        return _columna_numerica(df_metricas[nombre]) if nombre in df_metricas.columns else np.full(len(df_metricas), np.nan)
+    
+    clasificacion = np.asarray(df_metricas['clasificacion_riesgo'], dtype=object)
+    return {
+        'FATIGA_CRITICA': clasificacion == 'CRITICO',
+        'FATIGA_ALTA': clasificacion == 'ALTO',
+        'HRV_BAJO': columna('hrv_rmssd') < 20,
+        'SPO2_BAJO': columna('spo2') < 92,
+        'ANOMALIA_DETECTADA': np.asarray(df_metricas['anomalia_detectada'], dtype=bool)
+    }
+
+def generar_dataset_sintetico(ids_operadores: List[str], dias: int = 30, intervalo_s: int = 60,
+                              semilla: int = 0, fin: Optional[datetime] = None,
+                              cerrado: bool = False) -> Dict[str, pd.DataFrame]:
+    """Genera turnos, metricas_procesadas y alertas para un histórico completo.
+
+    Sigue el mismo modelo que SimuladorFlota (deuda de sueño que se arrastra
+    entre turnos, fatiga que crece con las horas del turno) pero calcula
+    columnas enteras con NumPy. El índice, la clasificación y la anomalía
+    salen de puntuar_columnas, igual que en la ingesta directa. Con la misma
+    semilla y fin devuelve los mismos datos. Los rangos coinciden con
+    generar_datos_simulados.
+
+    Con cerrado=True solo incluye turnos ya terminados y ninguna alerta queda
+    ACTIVA, para que el histórico no aparezca como turnos o alertas en vivo.
+    """
+    rng = np.random.default_rng(semilla)
+    fin = pd.Timestamp(fin or datetime.now(timezone.utc))
+    fin = fin.tz_localize('UTC') if fin.tzinfo is None else fin.tz_convert('UTC')
+    n_operadores = len(ids_operadores)
+    
+    # --- Turnos: operador x día ---
+    dia_inicial = (fin - pd.Timedelta(days=dias)).normalize()
+    dias_turno = dia_inicial + pd.to_timedelta(np.arange(dias + 1), unit='D')
+    regimen = rng.choice(['DIA', 'NOCHE', 'ROTATIVO'], n_operadores)
+    semana_par = (np.arange(dias + 1) // 7) % 2 == 0
+    es_noche = np.where(regimen[:, None] == 'ROTATIVO', ~semana_par[None, :], regimen[:, None] == 'NOCHE')
+    inicio_turno = (
+        dias_turno.values[None, :]
+        + np.where(es_noche, HORA_INICIO_TURNO['NOCHE'], HORA_INICIO_TURNO['DIA']).astype('timedelta64[h]')
+    )
+    
+    # Deuda de sueño: recurrencia por día, vectorizada sobre operadores
+    sueño = np.empty((n_operadores, dias + 1))
+    deuda = np.empty((n_operadores, dias + 1))
+    deuda_actual = rng.uniform(0.0, 4.0, n_operadores)
+    for d in range(dias + 1):
+        sueño[:, d] = np.clip(rng.normal(6.8 + 0.15 * deuda_actual, 1.0), 4.0, 9.0)
+        deuda_actual = np.maximum(0.0, ARRASTRE_DEUDA_SUEÑO * deuda_actual + SUEÑO_NECESARIO_HORAS - sueño[:, d])
+        deuda[:, d] = deuda_actual
+    
+    fin_turno = inicio_turno + np.timedelta64(int(DURACION_TURNO_SIMULADO * 3600), 's')
+    vigente = inicio_turno <= fin.to_datetime64()
+    if cerrado:
+        vigente &= fin_turno <= fin.to_datetime64()
+    op_turno = np.broadcast_to(np.arange(n_operadores)[:, None], vigente.shape)[vigente]
+    inicio_turno = inicio_turno[vigente]
+    en_curso = fin_turno[vigente] > fin.to_datetime64()
+    sueño, deuda = sueño[vigente], deuda[vigente]
+    n_turnos = len(op_turno)
+    
+    df_turnos = pd.DataFrame({
+        'id_operador': pd.Categorical.from_codes(op_turno, categories=ids_operadores),
+        'tipo_turno': np.where(es_noche[vigente], 'NOCHE', 'DIA'),
+        'fecha_inicio': pd.DatetimeIndex(inicio_turno).tz_localize('UTC'),
+        'maquinaria_asignada': rng.choice(MAQUINARIAS_SIMULADAS, n_turnos),
+        'ubicacion': None,
+        'estado': np.where(en_curso, 'EN_CURSO', 'FINALIZADO')
+    })
+    
+    # --- Métricas: turno x muestra, aplanado ---
+    muestras = int(DURACION_TURNO_SIMULADO * 3600 // intervalo_s)
+    segundos = np.arange(muestras) * intervalo_s
+    fila_turno = np.repeat(np.arange(n_turnos), muestras)
+    segundos = np.tile(segundos, n_turnos)
+    timestamp = inicio_turno[fila_turno] + segundos.astype('timedelta64[s]')
+    dentro = timestamp <= fin.to_datetime64()
+    fila_turno, segundos, timestamp = fila_turno[dentro], segundos[dentro], timestamp[dentro]
+    n = len(fila_turno)
+    
+    horas = (segundos / 3600).astype(np.float32)
+    deuda_fila = deuda[fila_turno]
+    fatiga = factor_fatiga(horas, deuda_fila).astype(np.float32)
+    
+    def variar(centro, dispersion, minimo, maximo, decimales=1):
+        # Se calcula en float32 y se redondea en float64 para que 75.4 no viaje como 75.40000152
+        valores = np.clip(centro + rng.standard_normal(n, dtype=np.float32) * dispersion, minimo, maximo)
+        return valores.astype(np.float64).round(decimales) if decimales else valores.round().astype(np.int16)
+    
+    calidad_turno = np.clip(rng.normal(95 - 55 * np.minimum(deuda, 8.0) / 8.0, 5), 40, 95).round().astype(np.int16)
+    columnas = {
+        'hrv_rmssd': variar(78 - 60 * fatiga, 4, 15.0, 80.0),
+        'spo2': variar(98 - 4 * fatiga, 0.8, 90.0, 100.0),
+        'frecuencia_cardiaca': variar(58 + 40 * fatiga, 4, 55, 100, 0),
+        'nivel_estres': variar(15 + 70 * fatiga, 6, 10, 90, 0),
+        'calidad_sueño': calidad_turno[fila_turno],
+        'horas_turno_actual': horas.astype(np.float64).round(2)
+    }
+    # Señales que puntúan pero no se guardan en metricas_procesadas
+    puntuacion = puntuar_columnas({
+        **columnas,
+        'sleep.duration_hours': sueño[fila_turno].round(1),
+        'vitals.skin_temp': variar(36.3 + 0.6 * fatiga, 0.2, 35.5, 37.5),
+        'posture.head_nods': variar(10 * fatiga ** 1.5, 1, 0, 10, 0),
+        'posture.micro_sleeps': variar(5 * fatiga ** 3, 0.5, 0, 5, 0),
+        'movement.inactivity_minutes': variar(50 * fatiga, 6, 0, 60, 0)
+    })
+    df_metricas = pd.DataFrame({
+        'id_operador': pd.Categorical.from_codes(op_turno[fila_turno], categories=ids_operadores),
+        'timestamp': pd.DatetimeIndex(timestamp).tz_localize('UTC'),
+        'indice_fatiga': puntuacion['indice_fatiga'].values,
+        'clasificacion_riesgo': puntuacion['clasificacion_riesgo'].values,
+        'anomalia_detectada': puntuacion['anomalia_detectada'].values,
+        **columnas
+    })
+    del puntuacion
+    
+    # --- Alertas: primera lectura de cada turno que cumple cada condición ---
+    condiciones = condiciones_alerta(df_metricas)
+    partes = []
+    for tipo, nivel, titulo in ALERTAS_SINTETICAS:
+        filas = np.flatnonzero(condiciones[tipo])
+        _, primeras = np.unique(fila_turno[filas], return_index=True)
+        filas = filas[primeras]
+        partes.append(pd.DataFrame({
+            'fila': filas, 'tipo_alerta': tipo, 'nivel_alerta': nivel, 'titulo': titulo
+        }))
+    df_alertas = pd.concat(partes, ignore_index=True).sort_values('fila', kind='stable')
+    filas = df_alertas.pop('fila').values
+    df_alertas['id_operador'] = df_metricas['id_operador'].values[filas]
+    df_alertas['indice_fatiga_actual'] = df_metricas['indice_fatiga'].values[filas]
+    df_alertas['descripcion'] = (
+        'Índice de fatiga ' + df_alertas['indice_fatiga_actual'].round(1).astype(str)
+        + ' a las ' + pd.Series(horas[filas]).round(1).astype(str).values + ' h de turno'
+    )
+    df_alertas['timestamp'] = df_metricas['timestamp'].array[filas]
+    # Las alertas del último día siguen activas; las anteriores ya se gestionaron
+    recientes = (df_alertas['timestamp'] > fin - pd.Timedelta(days=1)) & (not cerrado)
+    df_alertas['estado'] = np.where(
+        recientes, 'ACTIVA',
+        rng.choice(['RESUELTA', 'RECONOCIDA', 'IGNORADA'], len(df_alertas), p=[0.7, 0.1, 0.2])
+    )
+    
+    return {
+        'turnos': df_turnos,
+        'metricas_procesadas': df_metricas,
+        'alertas': df_alertas.reset_index(drop=True)
+    }
+
+def exportar_dataset(tablas: Dict[str, pd.DataFrame], formato: str, directorio: str) -> List[str]:
+    """Escribe cada tabla como Parquet o CSV y devuelve las rutas"""
+    os.makedirs(directorio, exist_ok=True)
+    rutas = []
+    for nombre, df in tablas.items():
+        ruta = os.path.join(directorio, f"{nombre}.{formato}")
+        if formato == 'parquet':
+            df.to_parquet(ruta, index=False)
+        else:
+            df.to_csv(ruta, index=False)
+        rutas.append(ruta)
+    return rutas
+
+def insertar_por_lotes(tabla: str, df: pd.DataFrame, tamaño_lote: int = TAMAÑO_LOTE_INSERCION,
+                       al_progresar=None) -> int:
+    """Inserta un DataFrame en Supabase con inserts multi-fila.
+
+    al_progresar(insertadas, total) se llama después de cada lote.
+    """
+    df = df.copy()
+    for columna in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[columna]):
+            df[columna] = df[columna].map(lambda valor: valor.isoformat() if pd.notna(valor) else None)
+        elif isinstance(df[columna].dtype, pd.CategoricalDtype):
+            df[columna] = df[columna].astype(object)
+    df = df.astype(object).where(pd.notna(df), None)
+    
+    total = len(df)
+    for inicio in range(0, total, tamaño_lote):
+        registros = df.iloc[inicio:inicio + tamaño_lote].to_dict('records')
+        supabase.table(tabla).insert(registros, returning='minimal').execute()
+        if al_progresar:
+            al_progresar(min(inicio + tamaño_lote, total), total)
+    return total
+
+def insertar_dataset(tablas: Dict[str, pd.DataFrame], al_progresar=None):
+    """Inserta las tablas del dataset sintético e invalida las cachés afectadas.
+
+    al_progresar(tabla, insertadas, total).
+    """
+    try:
+        for tabla, df in tablas.items():
+            insertar_por_lotes(
+                tabla, df,
+                al_progresar=(lambda hechas, total, tabla=tabla: al_progresar(tabla, hechas, total)) if al_progresar else None
+            )
+    finally:
+        invalidar_cache(*tablas)
+        if 'metricas_procesadas' in tablas:
+            registrar_escritura_metricas(tablas['metricas_procesadas'])
+
+def asegurar_operadores_sinteticos(cantidad: int) -> List[str]:
+    """Ids de los operadores SINT-00001 .. SINT-{cantidad}, creando los que falten.
+
+    El histórico que se inserta en Supabase se asigna solo a estos operadores,
+    nunca a los reales. Se crean INACTIVOS para que no aparezcan en la flota
+    ni en el panel del supervisor.
+    """
+    codigos = [f"{PREFIJO_OPERADOR_SINTETICO}{i:05d}" for i in range(1, cantidad + 1)]
+    por_codigo = cargar_directorio_operadores()['por_codigo']
+    activos = [codigo for codigo in codigos if codigo in por_codigo and por_codigo[codigo]['estado'] == 'ACTIVO']
+    if activos:
+        raise ValueError(f"El código {activos[0]} pertenece a un operador activo; no se usa para datos sintéticos")
+    
+    faltantes = [codigo for codigo in codigos if codigo not in por_codigo]
+    if faltantes:
+        try:
+            insertar_por_lotes('operadores', pd.DataFrame({
+                'codigo_operador': faltantes,
+                'nombre': 'Operador',
+                'apellido': [f"Sintético {codigo[len(PREFIJO_OPERADOR_SINTETICO):]}" for codigo in faltantes],
+                'documento_identidad': faltantes,
+                'turno_asignado': 'ROTATIVO',
+                'nivel_experiencia': 'INTERMEDIO',
+                'area_trabajo': 'SINTÉTICO',
+                'estado': 'INACTIVO'
+            }))
+        finally:
+            invalidar_cache('operadores')
+        por_codigo = cargar_directorio_operadores()['por_codigo']
+    return [por_codigo[codigo]['id'] for codigo in codigos]
+
+# ============================================
+# PUNTUACIÓN LOCAL E INGESTA DIRECTA
+# ============================================
+
+# Componentes del índice de fatiga: campo del payload -> (peso, valor sin riesgo, valor de riesgo máximo).
+# El riesgo del componente va de 0 a 100 en forma lineal entre ambos valores; el índice es el
+# promedio ponderado de los componentes presentes en la lectura, así cada tipo de dispositivo
+# se puntúa con lo que mide. Los pesos y rangos son una reconstrucción local, no una copia del
+# workflow de n8n: verificar_paridad_n8n compara ambos y la inserción directa exige que coincidan.
+COMPONENTES_INDICE_FATIGA = {
+    'sleep.duration_hours': (0.15, 8.0, 4.0),
+    'sleep.quality_score': (0.10, 95, 40),
+    'vitals.hrv_rmssd': (0.20, 70.0, 15.0),
+    'vitals.stress_level': (0.10, 10, 90),
+    'vitals.spo2': (0.05, 98.0, 90.0),
+    'posture.head_nods': (0.20, 0, 10),
+    'posture.micro_sleeps': (0.25, 0, 5),
+    'movement.inactivity_minutes': (0.05, 0, 60),
+    'shift.hours_elapsed': (0.15, 0.0, 12.0)
+}
+
+# Una lectura es anómala si algún campo cae fuera de su rango fisiológico esperado
+LIMITES_ANOMALIA = {
+    'vitals.heart_rate': (45, 110),
+    'vitals.spo2': (92.0, 100.0),
+    'vitals.skin_temp': (35.0, 38.0),
+    'posture.micro_sleeps': (0, 2)
+}
+
+# Columnas de metricas_procesadas que vienen directo del payload
+COLUMNAS_METRICA_PAYLOAD = {
+    'hrv_rmssd': 'vitals.hrv_rmssd',
+    'spo2': 'vitals.spo2',
+    'frecuencia_cardiaca': 'vitals.heart_rate',
+    'nivel_estres': 'vitals.stress_level',
+    'calidad_sueño': 'sleep.quality_score',
+    'horas_turno_actual': 'shift.hours_elapsed'
+}
+
+def _columna_numerica(valores) -> np.ndarray:
+    """Columna como float64, con NaN donde falta el valor"""
+    if isinstance(valores, np.ndarray) and valores.dtype.kind in 'fiub':
+        return valores.astype(np.float64, copy=False)
+    return pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+def puntuar_columnas(columnas, umbrales: Optional[List[float]] = None) -> pd.DataFrame:
+    """Motor de puntuación de fatiga sobre columnas completas.
+
+    columnas es un DataFrame o dict de arrays con los campos del payload en
+    notación de punto ('vitals.hrv_rmssd', 'posture.head_nods', ...) o con los
+    nombres de metricas_procesadas ('hrv_rmssd', 'calidad_sueño', ...). Los
+    componentes ausentes, o NaN en una fila, no cuentan para esa fila.
+    Devuelve indice_fatiga, clasificacion_riesgo y anomalia_detectada, una
+    fila por fila de entrada. umbrales permite probar otros cortes de riesgo.
+    """
+    campos_columna = {campo: columna for columna, campo in COLUMNAS_METRICA_PAYLOAD.items()}
+    
+    def obtener(campo):
+        for nombre in (campo, campos_columna.get(campo)):
+            if nombre is not None and nombre in columnas:
+                return _columna_numerica(columnas[nombre])
+        return None
+    
+    suma = None
+    pesos = None
+    for campo, (peso, sin_riesgo, riesgo_maximo) in COMPONENTES_INDICE_FATIGA.items():
+        valores = obtener(campo)
+        if valores is None:
+            continue
+        if suma is None:
+            suma = np.zeros(len(valores))
+            pesos = np.zeros(len(valores))
+        riesgo = (valores - sin_riesgo) / (riesgo_maximo - sin_riesgo)
+        np.clip(riesgo, 0.0, 1.0, out=riesgo)
+        riesgo *= peso * 100
+        presente = ~np.isnan(valores)
+        if presente.all():
+            suma += riesgo
+            pesos += peso
+        else:
+            suma += np.where(presente, riesgo, 0.0)
+            pesos += presente * peso
+    if suma is None:
+        raise ValueError("Ninguna columna corresponde a un componente del índice de fatiga")
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        indice = np.round(suma / pesos, 1)
+    
+    anomalia = np.zeros(len(suma), dtype=bool)
+    for campo, (minimo, maximo) in LIMITES_ANOMALIA.items():
+        valores = obtener(campo)
+        if valores is not None:
+            anomalia |= (valores < minimo) | (valores > maximo)
+    
+    indice_columnas = columnas.index if isinstance(columnas, pd.DataFrame) else None
+    return pd.DataFrame({
+        'indice_fatiga': indice,
+        'clasificacion_riesgo': clasificar_riesgo(indice, umbrales),
+        'anomalia_detectada': anomalia
+    }, index=indice_columnas)
+
+def puntuar_lectura(payload: Dict) -> Dict:
+    """Índice de fatiga, clasificación de riesgo y anomalía de una sola lectura"""
+    fila = puntuar_columnas(pd.json_normalize([payload])).iloc[0]
+    return {
+        'indice_fatiga': None if pd.isna(fila['indice_fatiga']) else float(fila['indice_fatiga']),
+        'clasificacion_riesgo': None if pd.isna(fila['clasificacion_riesgo']) else fila['clasificacion_riesgo'],
+        'anomalia_detectada': bool(fila['anomalia_detectada'])
+    }
+
+def construir_filas_metricas(payloads: List[Dict]) -> pd.DataFrame:
+    """Filas de metricas_procesadas para varias lecturas, iguales a las que escribe n8n"""
+    df = pd.json_normalize(payloads)
+    if 'operator_id' not in df.columns:
+        df['operator_id'] = None
+    sin_id = df['operator_id'].isna()
+    if sin_id.any():
+        df.loc[sin_id, 'operator_id'] = df.loc[sin_id, 'operator_external_id'].map(get_operator_uuid_by_external_id)
+    
+    puntuacion = puntuar_columnas(df)
+    filas = pd.DataFrame({
+        'id_operador': df['operator_id'],
+        'timestamp': df['timestamp'].astype(str),
+        'indice_fatiga': puntuacion['indice_fatiga'],
+        'clasificacion_riesgo': puntuacion['clasificacion_riesgo'].astype(object),
+        'anomalia_detectada': puntuacion['anomalia_detectada']
+    })
+    tipos = {
+        campo: regla[2]
+        for esquema in ESQUEMAS_PAYLOAD.values() for campo, regla in esquema.items()
+        if not isinstance(regla, list)
+    }
+    for columna, campo in COLUMNAS_METRICA_PAYLOAD.items():
+        valores = pd.to_numeric(df[campo], errors='coerce') if campo in df.columns else pd.Series(np.nan, index=df.index)
+        # Enteros con huecos: Int64 para no enviar 69.0 a una columna integer
+        filas[columna] = valores.round().astype('Int64') if tipos.get(campo) is int else valores
+    return filas
+
+# ============================================
+# RECÁLCULO DE RIESGO
+# ============================================
+
+def cargar_metricas_recalculo(dias: int = 30) -> pd.DataFrame:
+    """Métricas del período con las columnas que usa el motor de puntuación"""
+    desde = (datetime.now(timezone.utc) - timedelta(days=dias)).isoformat()
+    registros = []
+    for pagina in obtener_paginado(
+        lambda: consulta('metricas_recalculo').gte('timestamp', desde), columna_cursor='id'
+    ):
+        registros.extend(pagina)
+    return pd.DataFrame(registros, columns=CONSULTAS['metricas_recalculo']['columnas'])
+
+def comparar_umbrales(df_metricas: pd.DataFrame, umbrales: List[float], recalcular_indice: bool = False) -> pd.DataFrame:
+    """Matriz de transición entre la clasificación actual y la propuesta.
+
+    Sin recalcular_indice se reclasifica el índice guardado con los nuevos
+    umbrales y se compara con la clasificación guardada. Con recalcular_indice
+    el índice se vuelve a calcular con el motor local a partir de las pocas
+    columnas que guarda metricas_procesadas, lo que es solo una aproximación
+    del índice de n8n; para no mezclar esa diferencia con la de los umbrales,
+    la línea base es ese mismo índice recalculado clasificado con
+    UMBRALES_RIESGO.
+    """
+    if recalcular_indice:
+        indice = puntuar_columnas(df_metricas)['indice_fatiga']
+        actual = clasificar_riesgo(indice)
+    else:
+        indice = df_metricas['indice_fatiga']
+        actual = pd.Categorical(df_metricas['clasificacion_riesgo'], categories=NIVELES_RIESGO)
+    propuesta = pd.Series(clasificar_riesgo(indice, umbrales), index=df_metricas.index)
+    return pd.crosstab(
+        pd.Series(actual, name='Actual', index=df_metricas.index),
+        pd.Series(propuesta.values, name='Propuesta', index=df_metricas.index)
+    ).reindex(index=NIVELES_RIESGO, columns=NIVELES_RIESGO, fill_value=0)
+
+# La inserción directa exige una verificación de paridad reciente, sobre una muestra
+# suficiente y hecha con la misma configuración del motor local
+PARIDAD_MIN_LECTURAS = int(os.getenv("PARIDAD_MIN_LECTURAS", "200"))
+PARIDAD_COBERTURA_MINIMA = float(os.getenv("PARIDAD_COBERTURA_MINIMA", "0.95"))
+PARIDAD_VIGENCIA_HORAS = int(os.getenv("PARIDAD_VIGENCIA_HORAS", "24"))
+
+def huella_motor_puntuacion() -> str:
+    """Huella de la configuración del motor local: componentes, límites de anomalía y umbrales"""
+    base = repr((sorted(COMPONENTES_INDICE_FATIGA.items()), sorted(LIMITES_ANOMALIA.items()), UMBRALES_RIESGO))
+    return hashlib.blake2b(base.encode('utf-8'), digest_size=8).hexdigest()
+
+@st.cache_resource
+def obtener_paridades_n8n() -> Dict:
+    """Verificaciones de paridad que pasaron, por huella del motor, compartidas por todas las sesiones"""
+    return {}
+
+def paridad_vigente() -> Optional[Dict]:
+    """Verificación que habilita la inserción directa con la configuración actual, o None si no hay o venció"""
+    registro = obtener_paridades_n8n().get(huella_motor_puntuacion())
+    if registro and datetime.now() - registro['momento'] < timedelta(hours=PARIDAD_VIGENCIA_HORAS):
+        return registro
+    return None
+
+def registrar_paridad_n8n(df_paridad: pd.DataFrame):
+    """Habilita la inserción directa si la verificación alcanza; devuelve (paso, motivo).
+
+    Pide al menos PARIDAD_MIN_LECTURAS lecturas, que n8n tenga al menos
+    PARIDAD_COBERTURA_MINIMA de ellas y que todas las encontradas coincidan.
+    El resultado vale para la huella actual del motor durante
+    PARIDAD_VIGENCIA_HORAS.
+    """
+    total = len(df_paridad)
+    encontradas = int(df_paridad['encontrada'].sum())
+    difieren = encontradas - int(df_paridad['coincide'].sum())
+    if total < PARIDAD_MIN_LECTURAS:
+        return False, f"La muestra tiene {total:,} lecturas; se necesitan al menos {PARIDAD_MIN_LECTURAS:,}"
+    if encontradas < PARIDAD_COBERTURA_MINIMA * total:
+        return False, (f"n8n tiene {encontradas:,} de {total:,} lecturas; se necesita al menos "
+                       f"el {PARIDAD_COBERTURA_MINIMA:.0%}")
+    if difieren:
+        return False, f"{difieren:,} lecturas difieren entre la puntuación local y n8n"
+    obtener_paridades_n8n()[huella_motor_puntuacion()] = {'lecturas': encontradas, 'momento': datetime.now()}
+    return True, None
+
+def construir_filas_alertas(df_metricas: pd.DataFrame, ya_alertadas: set) -> pd.DataFrame:
+    """Alertas ACTIVA que n8n crearía para estas filas de metricas_procesadas.
+
+    Una por operador y tipo: la primera lectura que cumple la condición. Se
+    omiten los pares (id_operador, tipo_alerta) de ya_alertadas, que se
+    actualiza con los nuevos.
+    """
+    condiciones = condiciones_alerta(df_metricas)
+    registros = []
+    for tipo, nivel, titulo in ALERTAS_SINTETICAS:
+        for fila in np.flatnonzero(condiciones[tipo]):
+            lectura = df_metricas.iloc[fila]
+            clave = (lectura['id_operador'], tipo)
+            if pd.isna(lectura['id_operador']) or clave in ya_alertadas:
+                continue
+            ya_alertadas.add(clave)
+            indice = None if pd.isna(lectura['indice_fatiga']) else float(lectura['indice_fatiga'])
+            registros.append({
+                'id_operador': lectura['id_operador'],
+                'tipo_alerta': tipo,
+                'nivel_alerta': nivel,
+                'titulo': titulo,
+                'descripcion': f"Índice de fatiga {indice:.1f}" if indice is not None else titulo,
+                'indice_fatiga_actual': indice,
+                'timestamp': lectura['timestamp'],
+                'estado': 'ACTIVA'
+            })
+    return pd.DataFrame(registros, columns=['id_operador', 'tipo_alerta', 'nivel_alerta', 'titulo', 'descripcion',
+                                            'indice_fatiga_actual', 'timestamp', 'estado'])
+
+def ingerir_directo(payloads: List, al_progresar=None,
+                    tamaño_lote: int = TAMAÑO_LOTE_INSERCION) -> pd.DataFrame:
+    """Puntúa (fila, payload) localmente y los inserta en metricas_procesadas sin pasar por n8n.
+
+    Solo se permite con una verificación de paridad vigente (paridad_vigente). Las
+    lecturas repetidas deben filtrarse antes con filtrar_duplicadas. Crea
+    también las alertas que crearía n8n, sin repetir las que siguen activas.
+
+    Devuelve un DataFrame con las filas que fallaron (fila, campo, error), con
+    la misma forma que enviar_lecturas_webhook. Un lote rechazado marca todas
+    sus filas.
+    """
+    if paridad_vigente() is None:
+        raise RuntimeError("La inserción directa requiere una verificación de paridad con n8n vigente")
+    
+    filas = [fila for fila, _ in payloads]
+    df = construir_filas_metricas([payload for _, payload in payloads])
+    df_activas = cargar_alertas_activas()
+    ya_alertadas = set(zip(df_activas['id_operador'], df_activas['tipo_alerta'])) if not df_activas.empty else set()
+    fallidas = []
+    total = len(df)
+    try:
+        for inicio in range(0, total, tamaño_lote):
+            lote = df.iloc[inicio:inicio + tamaño_lote]
+            try:
+                # Alertas primero: si las métricas fallan, al reenviar el lote no se repiten
+                df_alertas = construir_filas_alertas(lote, ya_alertadas)
+                if not df_alertas.empty:
+                    insertar_por_lotes('alertas', df_alertas, tamaño_lote)
+                insertar_por_lotes('metricas_procesadas', lote, tamaño_lote)
+            except Exception as e:
+                fallidas.extend(
+                    {'fila': fila + 1, 'campo': 'insercion', 'error': str(e)[:200]}
+                    for fila in filas[inicio:inicio + tamaño_lote]
+                )
+            if al_progresar:
+                al_progresar(min(inicio + tamaño_lote, total), total, 0)
+    finally:
+        invalidar_cache('metricas_procesadas', 'alertas')
+        registrar_escritura_metricas(df)
+    return pd.DataFrame(fallidas, columns=['fila', 'campo', 'error'])
+
+def verificar_paridad_n8n(payloads: List, tolerancia: float = 0.05) -> pd.DataFrame:
+    """Compara la puntuación local con lo que n8n escribió para las mismas lecturas.
+
+    Las lecturas deben haberse enviado antes por el webhook. Se cruzan por
+    operador y timestamp y se devuelve una fila por lectura local con los
+    valores de ambos lados y si coinciden.
+    """
+    df_local = construir_filas_metricas([payload for _, payload in payloads])
+    df_local['instante'] = pd.to_datetime(df_local['timestamp'], utc=True, format='ISO8601')
+    
+    registros = []
+    operadores = df_local['id_operador'].dropna().unique().tolist()
+    for inicio in range(0, len(operadores), 100):
+        for pagina in obtener_paginado(lambda: consulta('paridad_n8n')
+                                       .in_('id_operador', operadores[inicio:inicio + 100])
+                                       .gte('timestamp', df_local['instante'].min().isoformat())
+                                       .lte('timestamp', df_local['instante'].max().isoformat())
+                                       .order('id')):
+            registros.extend(pagina)
+    df_n8n = pd.DataFrame(registros, columns=CONSULTAS['paridad_n8n']['columnas'])
+    df_n8n['instante'] = pd.to_datetime(df_n8n['timestamp'], utc=True, format='ISO8601')
+    
+    # Un operador con varios dispositivos tiene varias lecturas en el mismo instante:
+    # dentro de cada (operador, instante) se emparejan por orden de índice
+    claves = ['id_operador', 'instante']
+    for df_lado in (df_local, df_n8n):
+        df_lado.sort_values(claves + ['indice_fatiga'], inplace=True)
+        df_lado['orden'] = df_lado.groupby(claves).cumcount()
+    df = df_local.merge(
+        df_n8n.drop(columns=['id', 'timestamp']),
+        on=claves + ['orden'], how='left', suffixes=('_local', '_n8n')
+    )
+    df['encontrada'] = df['indice_fatiga_n8n'].notna()
+    df['coincide'] = (
+        df['encontrada']
+        & ((df['indice_fatiga_local'] - df['indice_fatiga_n8n']).abs() <= tolerancia)
+        & (df['clasificacion_riesgo_local'] == df['clasificacion_riesgo_n8n'])
+        & (df['anomalia_detectada_local'] == df['anomalia_detectada_n8n'])
+    )
+    return df[['id_operador', 'timestamp', 'indice_fatiga_local', 'indice_fatiga_n8n',
+               'clasificacion_riesgo_local', 'clasificacion_riesgo_n8n',
+               'anomalia_detectada_local', 'anomalia_detectada_n8n', 'encontrada', 'coincide']]
+
+# ============================================
+# PANEL PRINCIPAL - GERENTE DE SEGURIDAD
+# ============================================
+
+@st.fragment
+def fragmento_generador_reportes():
+    """Generador de reportes PDF; sus controles solo vuelven a ejecutar esta sección"""
+    col_rep1, col_rep2, col_rep3 = st.columns([2, 2, 1])
+    
+    with col_rep1:
+        tipo_reporte = st.selectbox(
+            "Tipo de Reporte",
+            ["DIARIO", "SEMANAL", "MENSUAL", "PERSONALIZADO"]
+        )
+    
+    with col_rep2:
+        if tipo_reporte == "PERSONALIZADO":
+            fecha_inicio = st.date_input("Fecha Inicio", datetime.now() - timedelta(days=7))
+            fecha_fin = st.date_input("Fecha Fin", datetime.now())
+        elif tipo_reporte == "DIARIO":
+            fecha_inicio = datetime.now().replace(hour=0, minute=0, second=0)
+            fecha_fin = datetime.now()
+        elif tipo_reporte == "SEMANAL":
+            fecha_inicio = datetime.now() - timedelta(days=7)
+            fecha_fin = datetime.now()
+        else:  # MENSUAL
+            fecha_inicio = datetime.now() - timedelta(days=30)
+            fecha_fin = datetime.now()
+    
+    with col_rep3:
+        if st.button("🔄 Generar Reporte", type="primary"):
+            with st.spinner("Generando reporte PDF..."):
+                try:
+                    pdf_buffer, nombre_archivo_generado = generar_reporte_pdf(fecha_inicio, fecha_fin, tipo_reporte)
+                    st.success("✅ Reporte generado exitosamente")
+                    st.download_button(
+                        label="📥 Descargar Reporte PDF",
+                        data=pdf_buffer,
+                        file_name=nombre_archivo_generado,
+                        mime="application/pdf"
+                    )
+                except Exception as e:
+                    st.error(f"Error al generar reporte: {e}")
+
+def panel_gerente():
+    st.markdown('<p class="main-header">🛡️ Panel de Control - Gerente de Seguridad</p>', 
+                unsafe_allow_html=True)
+    
+    # KPIs principales
+    col1, col2, col3, col4 = st.columns(4)
+    
+    def cargar_tendencia():
+        try:
+            return cargar_tendencia_horaria(24), None
+        except Exception as e:
+            return pd.DataFrame(), e
     
-    df_operadores = cargar_operadores_activos()
-    df_alertas = cargar_alertas_activas()
+    datos = cargar_en_paralelo({
+        'operadores': cargar_operadores_activos,
+        'alertas': cargar_alertas_activas,
+        'tendencia': cargar_tendencia
+    })
+    df_operadores = datos['operadores']
+    df_alertas = datos['alertas']
+    df_rollup, error_tendencia = datos['tendencia']
+    if error_tendencia:
+        st.warning(f"No se pudo cargar la tendencia de fatiga: {error_tendencia}")
     
     with col1:
         total_operadores = len(df_operadores)
@@ -759,7 +3787,12 @@ def panel_gerente():
     with col3:
         if not df_operadores.empty and 'indice_fatiga_actual' in df_operadores.columns:
             indice_promedio = df_operadores['indice_fatiga_actual'].mean()
-            st.metric("Índice Fatiga Promedio", f"{indice_promedio:.1f}" if pd.notna(indice_promedio) else "N/A")
+            delta_24h = None
+            if not df_rollup.empty and pd.notna(indice_promedio):
+                promedio_24h = df_rollup['suma'].sum() / df_rollup['conteo'].sum()
+                delta_24h = f"{indice_promedio - promedio_24h:+.1f} vs 24h"
+            st.metric("Índice Fatiga Promedio", f"{indice_promedio:.1f}" if pd.notna(indice_promedio) else "N/A",
+                     delta=delta_24h, delta_color="inverse")
         else:
             st.metric("Índice Fatiga Promedio", "N/A")
     
@@ -793,23 +3826,7 @@ def panel_gerente():
                 riesgo_counts['orden'] = riesgo_counts['Nivel'].apply(lambda x: orden_riesgo.index(x) if x in orden_riesgo else 99)
                 riesgo_counts = riesgo_counts.sort_values('orden')
                 
-                colores_riesgo = {'BAJO': '#4CAF50', 'MEDIO': '#FFC107', 'ALTO': '#FF9800', 'CRITICO': '#F44336'}
-                
-                fig_dona = px.pie(
-                    riesgo_counts, 
-                    values='Cantidad', 
-                    names='Nivel',
-                    hole=0.5,
-                    color='Nivel',
-                    color_discrete_map=colores_riesgo
-                )
-                fig_dona.update_layout(
-                    height=350,
-                    margin=dict(t=30, b=30, l=30, r=30),
-                    legend=dict(orientation="h", yanchor="bottom", y=-0.2)
-                )
-                fig_dona.update_traces(textposition='inside', textinfo='percent+value')
-                st.plotly_chart(fig_dona, use_container_width=True)
+                mostrar_figura(crear_dona_riesgo(riesgo_counts))
             else:
                 st.info("📊 Sin datos de clasificación de riesgo. Envíe datos desde Ingesta.")
         else:
@@ -828,25 +3845,7 @@ def panel_gerente():
                 fatiga_turno = fatiga_turno.dropna()
                 
                 if not fatiga_turno.empty:
-                    fig_turno = px.bar(
-                        fatiga_turno,
-                        x='Turno',
-                        y='Índice Promedio',
-                        color='Turno',
-                        text='Índice Promedio',
-                        color_discrete_sequence=['#1f77b4', '#ff7f0e', '#2ca02c', '#9467bd']
-                    )
-                    fig_turno.update_traces(texttemplate='%{text:.1f}', textposition='outside')
-                    fig_turno.update_layout(
-                        height=350,
-                        margin=dict(t=30, b=30),
-                        showlegend=False,
-                        yaxis=dict(range=[0, 100], title="Índice de Fatiga")
-                    )
-                    # Agregar líneas de umbral
-                    fig_turno.add_hline(y=70, line_dash="dash", line_color="orange", annotation_text="Alto")
-                    fig_turno.add_hline(y=85, line_dash="dash", line_color="red", annotation_text="Crítico")
-                    st.plotly_chart(fig_turno, use_container_width=True)
+                    mostrar_figura(crear_barras_turno(fatiga_turno))
                 else:
                     st.info("📊 Sin datos de fatiga por turno")
             else:
@@ -869,28 +3868,7 @@ def panel_gerente():
                 df_top = df_con_fatiga.nlargest(5, 'indice_fatiga_actual')[['nombre_completo', 'indice_fatiga_actual', 'clasificacion_riesgo']].copy()
                 
                 if not df_top.empty:
-                    # Asignar colores según riesgo
-                    colores_riesgo = {'BAJO': '#4CAF50', 'MEDIO': '#FFC107', 'ALTO': '#FF9800', 'CRITICO': '#F44336'}
-                    df_top['Color'] = df_top['clasificacion_riesgo'].map(colores_riesgo).fillna('#808080')
-                    
-                    fig_top = go.Figure()
-                    fig_top.add_trace(go.Bar(
-                        y=df_top['nombre_completo'],
-                        x=df_top['indice_fatiga_actual'],
-                        orientation='h',
-                        marker_color=df_top['Color'],
-                        text=df_top['indice_fatiga_actual'].apply(lambda x: f"{x:.1f}"),
-                        textposition='outside'
-                    ))
-                    fig_top.update_layout(
-                        height=350,
-                        margin=dict(t=30, b=30, l=150),
-                        xaxis=dict(range=[0, 110], title="Índice de Fatiga"),
-                        yaxis=dict(autorange="reversed")
-                    )
-                    fig_top.add_vline(x=70, line_dash="dash", line_color="orange")
-                    fig_top.add_vline(x=85, line_dash="dash", line_color="red")
-                    st.plotly_chart(fig_top, use_container_width=True)
+                    mostrar_figura(crear_top_fatiga(df_top))
                 else:
                     st.info("📊 Sin datos de fatiga disponibles")
             else:
@@ -917,25 +3895,7 @@ def panel_gerente():
             }
             alertas_tipo['Tipo_Display'] = alertas_tipo['Tipo'].map(nombres_alertas).fillna(alertas_tipo['Tipo'])
             
-            fig_alertas = px.bar(
-                alertas_tipo,
-                y='Tipo_Display',
-                x='Cantidad',
-                orientation='h',
-                color='Cantidad',
-                color_continuous_scale='Reds',
-                text='Cantidad'
-            )
-            fig_alertas.update_traces(textposition='outside')
-            fig_alertas.update_layout(
-                height=350,
-                margin=dict(t=30, b=30, l=150),
-                showlegend=False,
-                coloraxis_showscale=False,
-                yaxis=dict(title=""),
-                xaxis=dict(title="Cantidad de Alertas")
-            )
-            st.plotly_chart(fig_alertas, use_container_width=True)
+            mostrar_figura(crear_alertas_por_tipo(alertas_tipo))
         else:
             st.success("✅ No hay alertas activas")
     
@@ -945,54 +3905,9 @@ def panel_gerente():
     st.subheader("📉 Tendencia de Fatiga Promedio (Últimas 24 horas)")
     
     try:
-        fecha_inicio_tendencia = (datetime.now() - timedelta(hours=24)).isoformat()
-        response_metricas = supabase.table('metricas_procesadas')\
-            .select('timestamp, indice_fatiga')\
-            .gte('timestamp', fecha_inicio_tendencia)\
-            .order('timestamp')\
-            .execute()
-        
-        if response_metricas.data:
-            df_tendencia = pd.DataFrame(response_metricas.data)
-            df_tendencia['timestamp'] = pd.to_datetime(df_tendencia['timestamp'])
-            
-            # Agrupar por hora
-            df_tendencia['hora'] = df_tendencia['timestamp'].dt.floor('H')
-            tendencia_hora = df_tendencia.groupby('hora')['indice_fatiga'].mean().reset_index()
-            
-            fig_tendencia = go.Figure()
-            
-            # Área de fondo para zonas de riesgo
-            fig_tendencia.add_hrect(y0=0, y1=40, fillcolor="rgba(76, 175, 80, 0.1)", line_width=0)
-            fig_tendencia.add_hrect(y0=40, y1=70, fillcolor="rgba(255, 193, 7, 0.1)", line_width=0)
-            fig_tendencia.add_hrect(y0=70, y1=85, fillcolor="rgba(255, 152, 0, 0.1)", line_width=0)
-            fig_tendencia.add_hrect(y0=85, y1=100, fillcolor="rgba(244, 67, 54, 0.1)", line_width=0)
-            
-            # Línea de tendencia
-            fig_tendencia.add_trace(go.Scatter(
-                x=tendencia_hora['hora'],
-                y=tendencia_hora['indice_fatiga'],
-                mode='lines+markers',
-                name='Índice Promedio',
-                line=dict(color='#1f77b4', width=3),
-                marker=dict(size=8),
-                fill='tozeroy',
-                fillcolor='rgba(31, 119, 180, 0.2)'
-            ))
-            
-            fig_tendencia.update_layout(
-                height=350,
-                margin=dict(t=30, b=30),
-                xaxis=dict(title="Hora", tickformat="%H:%M"),
-                yaxis=dict(range=[0, 100], title="Índice de Fatiga Promedio"),
-                hovermode='x unified'
-            )
-            
-            # Líneas de umbral
-            fig_tendencia.add_hline(y=70, line_dash="dash", line_color="orange", annotation_text="Umbral Alto")
-            fig_tendencia.add_hline(y=85, line_dash="dash", line_color="red", annotation_text="Umbral Crítico")
-            
-            st.plotly_chart(fig_tendencia, use_container_width=True)
+        if not df_rollup.empty:
+            tendencia_hora = resumir_tendencia(df_rollup)
+            mostrar_figura(crear_tendencia_fatiga(tendencia_hora, df_rollup))
         else:
             st.info("📊 No hay datos de métricas en las últimas 24 horas. Envíe datos desde la sección de Ingesta.")
     except Exception as e:
@@ -1003,8 +3918,7 @@ def panel_gerente():
     # ===== FILA 4: Mapa de la flota =====
     st.subheader("📍 Mapa de Estado de la Flota")
     if not df_operadores.empty:
-        fig_mapa = crear_mapa_flota(df_operadores)
-        st.plotly_chart(fig_mapa, use_container_width=True)
+        mostrar_figura(crear_mapa_flota(df_operadores))
         
         # Tabla de operadores
         st.subheader("👷 Estado Detallado de Operadores")
@@ -1042,60 +3956,19 @@ def panel_gerente():
     
     # Sección de generación de reportes
     st.subheader("📊 Generador de Reportes")
-    
-    col_rep1, col_rep2, col_rep3 = st.columns([2, 2, 1])
-    
-    with col_rep1:
-        tipo_reporte = st.selectbox(
-            "Tipo de Reporte",
-            ["DIARIO", "SEMANAL", "MENSUAL", "PERSONALIZADO"]
-        )
-    
-    with col_rep2:
-        if tipo_reporte == "PERSONALIZADO":
-            fecha_inicio = st.date_input("Fecha Inicio", datetime.now() - timedelta(days=7))
-            fecha_fin = st.date_input("Fecha Fin", datetime.now())
-        elif tipo_reporte == "DIARIO":
-            fecha_inicio = datetime.now().replace(hour=0, minute=0, second=0)
-            fecha_fin = datetime.now()
-        elif tipo_reporte == "SEMANAL":
-            fecha_inicio = datetime.now() - timedelta(days=7)
-            fecha_fin = datetime.now()
-        else:  # MENSUAL
-            fecha_inicio = datetime.now() - timedelta(days=30)
-            fecha_fin = datetime.now()
-    
-    with col_rep3:
-        if st.button("🔄 Generar Reporte", type="primary"):
-            with st.spinner("Generando reporte PDF..."):
-                try:
-                    pdf_buffer, nombre_archivo_generado = generar_reporte_pdf(fecha_inicio, fecha_fin, tipo_reporte)
-                    st.success("✅ Reporte generado exitosamente")
-                    st.download_button(
-                        label="📥 Descargar Reporte PDF",
-                        data=pdf_buffer,
-                        file_name=nombre_archivo_generado,
-                        mime="application/pdf"
-                    )
-                except Exception as e:
-                    st.error(f"Error al generar reporte: {e}")
+    fragmento_generador_reportes()
 
 # ============================================
 # PANEL SUPERVISOR DE TURNO - MEJORADO
 # ============================================
 
-def panel_supervisor():
-    st.markdown('<p class="main-header">👨‍💼 Vista de Supervisor de Turno</p>', 
-                unsafe_allow_html=True)
-    
-    # ===== SECCIÓN 1: RESUMEN GENERAL =====
-    st.subheader("📊 Resumen del Turno Actual")
-    
-    # Cargar datos
+@st.fragment(run_every=INTERVALO_REFRESCO_S)
+def fragmento_kpis_supervisor():
+    """KPIs del turno; se refrescan solos sin recargar el resto del panel"""
     df_operadores = cargar_operadores_activos()
     df_alertas = cargar_alertas_activas()
+    df_turnos = cargar_turnos_activos()
     
-    # KPIs del turno
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
@@ -1111,77 +3984,257 @@ def panel_supervisor():
         st.metric("⚠️ Alertas Críticas", alertas_criticas, delta_color="inverse")
     
     with col4:
-        # Cargar turnos en curso
-        try:
-            resp_turnos = supabase.table('turnos').select('id').eq('estado', 'EN_CURSO').execute()
-            turnos_activos = len(resp_turnos.data) if resp_turnos.data else 0
-        except:
-            turnos_activos = 0
+        turnos_activos = len(df_turnos)
         st.metric("🕐 Turnos en Curso", turnos_activos)
     
-    st.markdown("---")
+    st.caption(f"Actualizado {datetime.now().strftime('%H:%M:%S')} · cada {INTERVALO_REFRESCO_S} s")
+
+# Cola de alertas del supervisor
+ORDEN_NIVEL_ALERTA = {'CRITICO': 0, 'URGENTE': 1, 'ATENCION': 2, 'INFO': 3}
+ICONO_NIVEL_ALERTA = {'CRITICO': '🔴', 'URGENTE': '🟠', 'ATENCION': '🟡', 'INFO': '🔵'}
+CLASE_NIVEL_ALERTA = {'CRITICO': 'alert-critical', 'URGENTE': 'alert-high', 'ATENCION': 'alert-medium', 'INFO': 'alert-medium'}
+ALERTAS_POR_PAGINA = 25
+ACCIONES_ALERTA = [
+    ("✅ Reconocer", 'reconocer', ""),
+    ("🔧 Gestionar", 'gestionar', ""),
+    ("✔️ Resolver", 'resolver', "Resuelto por supervisor"),
+    ("🚫 Ignorar", 'ignorar', "")
+]
+
+@st.fragment(run_every=INTERVALO_REFRESCO_S)
+def fragmento_alertas_supervisor():
+    """Cola de alertas activas paginada en una sola grilla con selección y acciones por fila.
+
+    Solo se envía al navegador la página visible, así que el costo de
+    render no crece con la cantidad de alertas. Gestionar alertas solo
+    vuelve a ejecutar esta sección.
+    """
+    df_alertas = cargar_alertas_activas()
     
-    # ===== SECCIÓN 2: ALERTAS ACTIVAS =====
-    st.subheader("🚨 Alertas Activas")
+    if df_alertas.empty:
+        st.success("✅ No hay alertas activas en este momento")
+        return
+    
+    col_filtro, col_pagina = st.columns([3, 1])
+    with col_filtro:
+        niveles = st.multiselect(
+            "Nivel", list(ORDEN_NIVEL_ALERTA), default=list(ORDEN_NIVEL_ALERTA),
+            key="alertas_niveles", label_visibility="collapsed"
+        )
+    
+    # Crítico primero y, dentro de cada nivel, la más reciente primero
+    df_cola = df_alertas[df_alertas['nivel_alerta'].isin(niveles)]
+    df_cola = df_cola.assign(orden=df_cola['nivel_alerta'].map(ORDEN_NIVEL_ALERTA).fillna(len(ORDEN_NIVEL_ALERTA)))
+    df_cola = df_cola.sort_values(['orden', 'timestamp'], ascending=[True, False], kind='stable')
+    
+    total = len(df_cola)
+    total_paginas = max(1, -(-total // ALERTAS_POR_PAGINA))
+    if st.session_state.get('alertas_pagina', 1) > total_paginas:
+        st.session_state['alertas_pagina'] = total_paginas
+    with col_pagina:
+        pagina = st.number_input(
+            "Página", min_value=1, max_value=total_paginas, step=1,
+            key="alertas_pagina", label_visibility="collapsed"
+        )
+    
+    inicio = (pagina - 1) * ALERTAS_POR_PAGINA
+    df_pagina = df_cola.iloc[inicio:inicio + ALERTAS_POR_PAGINA]
+    columna_operador = df_pagina['operador_nombre'] if 'operador_nombre' in df_pagina.columns else pd.Series('N/A', index=df_pagina.index)
+    df_vista = pd.DataFrame({
+        'Nivel': df_pagina['nivel_alerta'].map(ICONO_NIVEL_ALERTA).fillna('⚪') + ' ' + df_pagina['nivel_alerta'],
+        'Alerta': df_pagina['titulo'],
+        'Operador': columna_operador,
+        'Índice': pd.to_numeric(df_pagina['indice_fatiga_actual'], errors='coerce'),
+        'Hora': pd.to_datetime(df_pagina['timestamp'], format='ISO8601').dt.strftime('%d/%m %H:%M')
+    })
+    
+    # La clave depende de las alertas visibles: si la página cambia (otra página,
+    # filtro o auto-refresco) la selección se descarta en vez de apuntar a otra fila
+    huella = hashlib.blake2b('|'.join(df_pagina['id']).encode(), digest_size=8).hexdigest()
+    evento = st.dataframe(
+        df_vista,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="multi-row",
+        key=f"alertas_tabla_{huella}",
+        column_config={
+            'Índice': st.column_config.NumberColumn(format="%.1f")
+        }
+    )
+    seleccion = df_pagina.iloc[evento.selection.rows]
+    st.caption(
+        f"Mostrando {inicio + 1 if total else 0}–{inicio + len(df_pagina)} de {total} alertas "
+        f"· página {pagina} de {total_paginas} · {len(seleccion)} seleccionada(s)"
+    )
+    
+    if len(seleccion) == 1:
+        alerta = seleccion.iloc[0]
+        st.markdown(
+            f"<div class='{CLASE_NIVEL_ALERTA.get(alerta['nivel_alerta'], 'alert-medium')}'>"
+            f"{alerta.get('descripcion') or 'Sin descripción'}</div>",
+            unsafe_allow_html=True
+        )
+    
+    columnas_acciones = st.columns(len(ACCIONES_ALERTA))
+    for columna, (etiqueta, accion, notas) in zip(columnas_acciones, ACCIONES_ALERTA):
+        with columna:
+            if st.button(etiqueta, key=f"alertas_{accion}", disabled=seleccion.empty, use_container_width=True):
+                gestionar_alerta(seleccion['id'].tolist(), accion, notas)
+
+ICONO_RIESGO = {'BAJO': '🟢', 'MEDIO': '🟡', 'ALTO': '🟠', 'CRITICO': '🔴'}
+
+def construir_tablero_operadores(df_operadores: pd.DataFrame, df_turnos: pd.DataFrame) -> pd.DataFrame:
+    """Tablero de estado de operadores: una fila por operador, todo calculado por columnas.
+
+    Cruza cada operador con su turno en curso y calcula las horas de turno
+    sin recorrer filas. Conserva 'id' para resolver la selección.
+    """
+    def columna(nombre, por_defecto=None):
+        if nombre in df_operadores.columns:
+            return df_operadores[nombre]
+        return pd.Series(por_defecto, index=df_operadores.index)
+    
+    tablero = pd.DataFrame({
+        'id': df_operadores['id'],
+        'Operador': columna('nombre_completo', 'N/A'),
+        'Código': columna('codigo_operador', 'N/A'),
+        'Fatiga': pd.to_numeric(columna('indice_fatiga_actual'), errors='coerce'),
+        'riesgo': columna('clasificacion_riesgo'),
+        'Alertas': pd.to_numeric(columna('alertas_activas', 0), errors='coerce').fillna(0).astype(int)
+    })
+    tablero['Fatiga'] = tablero['Fatiga'].where(tablero['Fatiga'] > 0)
+    tablero['Riesgo'] = (tablero['riesgo'].map(ICONO_RIESGO).fillna('⚪') + ' '
+                         + tablero['riesgo'].fillna('SIN DATOS'))
+    
+    if not df_turnos.empty:
+        turnos = df_turnos.drop_duplicates('id_operador').set_index('id_operador')
+        inicio = pd.to_datetime(tablero['id'].map(turnos['fecha_inicio']), utc=True, format='ISO8601')
+        tablero['Turno'] = tablero['id'].map(turnos['tipo_turno'])
+        tablero['Horas en turno'] = (pd.Timestamp.now(tz='UTC') - inicio).dt.total_seconds() / 3600
+    else:
+        tablero['Turno'] = None
+        tablero['Horas en turno'] = np.nan
+    tablero['Turno'] = tablero['Turno'].fillna('Sin turno')
     
-    if not df_alertas.empty:
-        # Ordenar por nivel de alerta (crítico primero)
-        orden_alertas = {'CRITICO': 0, 'URGENTE': 1, 'ATENCION': 2, 'INFO': 3}
-        df_alertas['orden'] = df_alertas['nivel_alerta'].map(orden_alertas)
-        df_alertas = df_alertas.sort_values('orden')
+    return tablero[['id', 'Operador', 'Código', 'Fatiga', 'Riesgo', 'Turno', 'Horas en turno', 'Alertas']]
+
+@st.fragment
+def fragmento_operadores_supervisor():
+    """Tablero de operadores en una sola grilla; seleccionar una fila abre su detalle.
+
+    Abrir o cerrar el detalle solo vuelve a ejecutar esta sección.
+    """
+    df_operadores = cargar_operadores_activos()
+    df_turnos = cargar_turnos_activos()
+    
+    if not df_operadores.empty:
+        tablero = construir_tablero_operadores(df_operadores, df_turnos)
+        
+        # Cerrar el detalle cambia la versión y con ella la grilla, que vuelve sin selección;
+        # la huella hace lo mismo si cambia el orden de los operadores al refrescar los datos
+        version = st.session_state.get('operadores_tabla_version', 0)
+        huella = hashlib.blake2b('|'.join(tablero['id']).encode(), digest_size=8).hexdigest()
+        evento = st.dataframe(
+            tablero.drop(columns='id'),
+            hide_index=True,
+            use_container_width=True,
+            height=min(600, 38 + 35 * len(tablero)),
+            on_select="rerun",
+            selection_mode="single-row",
+            key=f"operadores_tabla_{version}_{huella}",
+            column_config={
+                'Fatiga': st.column_config.ProgressColumn(format="%.1f", min_value=0, max_value=100),
+                'Horas en turno': st.column_config.NumberColumn(format="%.1f h"),
+                'Alertas': st.column_config.NumberColumn(format="%d")
+            }
+        )
+        st.caption(f"{len(tablero)} operadores · seleccione una fila para ver el detalle")
         
-        for idx, alerta in df_alertas.iterrows():
-            nivel_color = {
-                'CRITICO': 'alert-critical',
-                'URGENTE': 'alert-high',
-                'ATENCION': 'alert-medium',
-                'INFO': 'alert-medium'
-            }.get(alerta['nivel_alerta'], 'alert-medium')
+        filas = evento.selection.rows
+        st.session_state['ver_detalle'] = bool(filas)
+        if filas:
+            st.session_state['operador_seleccionado'] = tablero['id'].iloc[filas[0]]
+        
+        # Vista detallada de operador seleccionado
+        if st.session_state.get('ver_detalle', False):
+            st.markdown("---")
+            st.subheader("📈 Vista Detallada de Operador")
             
-            icono_alerta = {
-                'CRITICO': '🔴',
-                'URGENTE': '🟠',
-                'ATENCION': '🟡',
-                'INFO': '🔵'
-            }.get(alerta['nivel_alerta'], '⚪')
+            operador_id = st.session_state['operador_seleccionado']
+            operador_info = df_operadores[df_operadores['id'] == operador_id]
             
-            with st.expander(
-                f"{icono_alerta} [{alerta['nivel_alerta']}] {alerta['titulo']}", 
-                expanded=(alerta['nivel_alerta'] == 'CRITICO')
-            ):
-                st.markdown(f"<div class='{nivel_color}'>{alerta.get('descripcion', 'Sin descripción')}</div>", 
-                           unsafe_allow_html=True)
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    operador_display = alerta.get('operador_nombre', alerta.get('operador_codigo', 'N/A'))
-                    st.write(f"**Operador:** {operador_display}")
-                with col2:
-                    indice = alerta.get('indice_fatiga_actual')
-                    st.write(f"**Índice Fatiga:** {indice if indice else 'N/A'}")
-                with col3:
-                    st.write(f"**Hora:** {pd.to_datetime(alerta['timestamp']).strftime('%d/%m %H:%M')}")
-                
-                st.markdown("---")
-                col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
+            if not operador_info.empty:
+                operador_info = operador_info.iloc[0]
                 
-                with col_btn1:
-                    if st.button("✅ Reconocer", key=f"reconocer_{alerta['id']}"):
-                        gestionar_alerta(alerta['id'], 'reconocer')
+                col_close, col_title = st.columns([1, 10])
+                with col_close:
+                    if st.button("❌ Cerrar", key="operador_detalle_cerrar"):
+                        st.session_state['ver_detalle'] = False
+                        st.session_state['operadores_tabla_version'] = version + 1
+                        rerun_seccion()
+                with col_title:
+                    st.write(f"### {operador_info.get('nombre_completo', 'Operador')}")
                 
-                with col_btn2:
-                    if st.button("🔧 Gestionar", key=f"gestionar_{alerta['id']}"):
-                        gestionar_alerta(alerta['id'], 'gestionar')
+                # Gauge de fatiga actual
+                col_g1, col_g2 = st.columns(2)
                 
-                with col_btn3:
-                    if st.button("✔️ Resolver", key=f"resolver_{alerta['id']}"):
-                        gestionar_alerta(alerta['id'], 'resolver', "Resuelto por supervisor")
+                with col_g1:
+                    fig_gauge = crear_gauge_fatiga(
+                        operador_info.get('indice_fatiga_actual', 0) or 0,
+                        "Índice de Fatiga Actual"
+                    )
+                    mostrar_figura(fig_gauge)
                 
-                with col_btn4:
-                    if st.button("🚫 Ignorar", key=f"ignorar_{alerta['id']}"):
-                        gestionar_alerta(alerta['id'], 'ignorar')
+                with col_g2:
+                    st.write("**Información del Operador:**")
+                    st.write(f"- **Código:** {operador_info.get('codigo_operador', 'N/A')}")
+                    st.write(f"- **Turno Asignado:** {operador_info.get('turno_asignado', 'N/A')}")
+                    
+                    ultima_med = operador_info.get('ultima_medicion')
+                    if ultima_med:
+                        st.write(f"- **Última medición:** {pd.to_datetime(ultima_med).strftime('%d/%m/%Y %H:%M:%S')}")
+                    else:
+                        st.write("- **Última medición:** Sin datos")
+                    
+                    alertas_op = operador_info.get('alertas_activas', 0)
+                    st.write(f"- **Alertas activas:** {int(alertas_op) if alertas_op else 0}")
+
+                # Historial de las últimas 24 horas
+                df_metricas_op = cargar_metricas_operador(operador_id, 24)
+                if not df_metricas_op.empty:
+                    mostrar_figura(crear_serie_temporal_fatiga(df_metricas_op))
+                    with st.expander("📊 Métricas Fisiológicas", expanded=False):
+                        mostrar_figura(crear_dashboard_metricas(df_metricas_op))
+                else:
+                    st.info("📊 Sin métricas en las últimas 24 horas")
     else:
-        st.success("✅ No hay alertas activas en este momento")
+        st.info("No hay operadores activos en el sistema. Agregue operadores desde el panel de **📋 Mantenedores**.")
+
+def panel_supervisor():
+    st.markdown('<p class="main-header">👨‍💼 Vista de Supervisor de Turno</p>', 
+                unsafe_allow_html=True)
+    
+    # ===== SECCIÓN 1: RESUMEN GENERAL =====
+    st.subheader("📊 Resumen del Turno Actual")
+    
+    # Cargar datos en paralelo: las secciones siguientes los leen de la caché
+    datos = cargar_en_paralelo({
+        'operadores': cargar_operadores_activos,
+        'alertas': cargar_alertas_activas,
+        'turnos': cargar_turnos_activos,
+        'directorio': cargar_directorio_operadores
+    })
+    df_turnos = datos['turnos']
+    
+    # KPIs del turno
+    fragmento_kpis_supervisor()
+    
+    st.markdown("---")
+    
+    # ===== SECCIÓN 2: ALERTAS ACTIVAS =====
+    st.subheader("🚨 Alertas Activas")
+    fragmento_alertas_supervisor()
     
     st.markdown("---")
     
@@ -1192,131 +4245,21 @@ def panel_supervisor():
     tab_operadores, tab_crear_turno = st.tabs(["📋 Estado de Operadores", "➕ Iniciar Turno"])
     
     with tab_operadores:
-        if not df_operadores.empty:
-            # Cargar turnos activos para cada operador
-            try:
-                resp_turnos = supabase.table('turnos')\
-                    .select('id, id_operador, tipo_turno, fecha_inicio, maquinaria_asignada, ubicacion')\
-                    .eq('estado', 'EN_CURSO')\
-                    .execute()
-                
-                turnos_map = {}
-                if resp_turnos.data:
-                    for t in resp_turnos.data:
-                        turnos_map[t['id_operador']] = t
-            except:
-                turnos_map = {}
-            
-            for idx, operador in df_operadores.iterrows():
-                turno_actual = turnos_map.get(operador['id'])
-                
-                with st.container():
-                    col1, col2, col3, col4, col5 = st.columns([3, 2, 2, 2, 1])
-                    
-                    with col1:
-                        st.write(f"**{operador.get('nombre_completo', operador.get('nombre', 'N/A'))}**")
-                        st.caption(f"Código: {operador.get('codigo_operador', 'N/A')}")
-                    
-                    with col2:
-                        indice = operador.get('indice_fatiga_actual')
-                        if indice and indice > 0:
-                            st.metric("Fatiga", f"{indice:.1f}")
-                        else:
-                            st.metric("Fatiga", "Sin datos")
-                    
-                    with col3:
-                        riesgo = operador.get('clasificacion_riesgo', 'SIN DATOS')
-                        color_class = {
-                            'BAJO': 'status-ok',
-                            'MEDIO': 'status-warning',
-                            'ALTO': 'status-danger',
-                            'CRITICO': 'status-danger'
-                        }.get(riesgo, '')
-                        st.markdown(f"<p class='{color_class}'><b>{riesgo}</b></p>", unsafe_allow_html=True)
-                    
-                    with col4:
-                        if turno_actual:
-                            horas = (datetime.now(timezone.utc) - pd.to_datetime(turno_actual['fecha_inicio'])).total_seconds() / 3600
-                            st.write(f"🕐 **En turno**")
-                            st.caption(f"{turno_actual['tipo_turno']} - {horas:.1f}h")
-                        else:
-                            st.write("⚪ **Sin turno**")
-                    
-                    with col5:
-                        if st.button("📊", key=f"detalle_{operador['id']}", help="Ver detalle"):
-                            st.session_state['operador_seleccionado'] = operador['id']
-                            st.session_state['ver_detalle'] = True
-                            st.rerun()
-                    
-                    st.markdown("---")
-            
-            # Vista detallada de operador seleccionado
-            if st.session_state.get('ver_detalle', False):
-                st.markdown("---")
-                st.subheader("📈 Vista Detallada de Operador")
-                
-                operador_id = st.session_state['operador_seleccionado']
-                operador_info = df_operadores[df_operadores['id'] == operador_id]
-                
-                if not operador_info.empty:
-                    operador_info = operador_info.iloc[0]
-                    
-                    col_close, col_title = st.columns([1, 10])
-                    with col_close:
-                        if st.button("❌ Cerrar"):
-                            st.session_state['ver_detalle'] = False
-                            st.rerun()
-                    with col_title:
-                        st.write(f"### {operador_info.get('nombre_completo', 'Operador')}")
-                    
-                    # Gauge de fatiga actual
-                    col_g1, col_g2 = st.columns(2)
-                    
-                    with col_g1:
-                        fig_gauge = crear_gauge_fatiga(
-                            operador_info.get('indice_fatiga_actual', 0) or 0,
-                            "Índice de Fatiga Actual"
-                        )
-                        st.plotly_chart(fig_gauge, use_container_width=True)
-                    
-                    with col_g2:
-                        st.write("**Información del Operador:**")
-                        st.write(f"- **Código:** {operador_info.get('codigo_operador', 'N/A')}")
-                        st.write(f"- **Turno Asignado:** {operador_info.get('turno_asignado', 'N/A')}")
-                        
-                        ultima_med = operador_info.get('ultima_medicion')
-                        if ultima_med:
-                            st.write(f"- **Última medición:** {pd.to_datetime(ultima_med).strftime('%d/%m/%Y %H:%M:%S')}")
-                        else:
-                            st.write("- **Última medición:** Sin datos")
-                        
-                        alertas_op = operador_info.get('alertas_activas', 0)
-                        st.write(f"- **Alertas activas:** {int(alertas_op) if alertas_op else 0}")
-        else:
-            st.info("No hay operadores activos en el sistema. Agregue operadores desde el panel de **📋 Mantenedores**.")
+        fragmento_operadores_supervisor()
     
     with tab_crear_turno:
         st.subheader("➕ Iniciar Nuevo Turno")
         st.write("Cree un turno para un operador que aún no tiene turno activo.")
         
         try:
-            # Cargar operadores sin turno activo
-            resp_ops = supabase.table('operadores')\
-                .select('id, codigo_operador, nombre, apellido')\
-                .eq('estado', 'ACTIVO')\
-                .execute()
-            
-            resp_turnos = supabase.table('turnos')\
-                .select('id_operador')\
-                .eq('estado', 'EN_CURSO')\
-                .execute()
-            
-            operadores_con_turno = [t['id_operador'] for t in resp_turnos.data] if resp_turnos.data else []
+            # Operadores sin turno activo
+            ops_activos = operadores_activos(datos['directorio'])
+            operadores_con_turno = set(df_turnos['id_operador']) if not df_turnos.empty else set()
             
             operadores_sin_turno = [
-                op for op in resp_ops.data 
+                op for op in ops_activos
                 if op['id'] not in operadores_con_turno
-            ] if resp_ops.data else []
+            ]
             
             if operadores_sin_turno:
                 with st.form("form_crear_turno"):
@@ -1349,12 +4292,12 @@ def panel_supervisor():
                             
                             supabase.table('turnos').insert(nuevo_turno).execute()
                             st.success(f"✅ Turno iniciado para {operador_turno}")
-                            st.cache_data.clear()
+                            invalidar_cache('turnos')
                             st.rerun()
                         except Exception as e:
                             st.error(f"❌ Error al crear turno: {e}")
             else:
-                if resp_ops.data:
+                if ops_activos:
                     st.success("✅ Todos los operadores ya tienen un turno activo")
                 else:
                     st.warning("⚠️ No hay operadores activos. Cree operadores desde el panel de **📋 Mantenedores**.")
@@ -1391,17 +4334,7 @@ def panel_mantenedores():
         
         try:
             # Cargar operadores con filtros
-            query = supabase.table('operadores').select('*')
-            
-            if filtro_estado != "TODOS":
-                query = query.eq('estado', filtro_estado)
-            if filtro_turno != "TODOS":
-                query = query.eq('turno_asignado', filtro_turno)
-            if filtro_experiencia != "TODOS":
-                query = query.eq('nivel_experiencia', filtro_experiencia)
-            
-            response = query.order('created_at', desc=True).execute()
-            df_operadores = pd.DataFrame(response.data) if response.data else pd.DataFrame()
+            df_operadores = cargar_operadores(filtro_estado, filtro_turno, filtro_experiencia)
             
             # Filtrar por búsqueda de texto
             if buscar_nombre and not df_operadores.empty:
@@ -1536,7 +4469,7 @@ def panel_mantenedores():
                                 
                                 supabase.table('operadores').insert(nuevo_operador).execute()
                                 st.success("✅ Operador creado exitosamente")
-                                st.cache_data.clear()
+                                invalidar_cache('operadores')
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"❌ Error al crear operador: {e}")
@@ -1612,7 +4545,7 @@ def panel_mantenedores():
                                     
                                     supabase.table('operadores').update(update_data).eq('id', op_id).execute()
                                     st.success("✅ Operador actualizado exitosamente")
-                                    st.cache_data.clear()
+                                    invalidar_cache('operadores')
                                     st.rerun()
                                 except Exception as e:
                                     st.error(f"❌ Error al actualizar: {e}")
@@ -1651,7 +4584,7 @@ def panel_mantenedores():
                                     try:
                                         supabase.table('operadores').update({'estado': nuevo_estado}).eq('id', op_id).execute()
                                         st.success(f"✅ Estado cambiado a {nuevo_estado}")
-                                        st.cache_data.clear()
+                                        invalidar_cache('operadores')
                                         st.rerun()
                                     except Exception as e:
                                         st.error(f"❌ Error: {e}")
@@ -1677,15 +4610,7 @@ def panel_mantenedores():
             buscar_disp = st.text_input("🔍 Buscar por ID/Marca/Modelo", key="buscar_disp")
         
         try:
-            query = supabase.table('dispositivos').select('*, operadores(nombre, apellido, codigo_operador)')
-            
-            if filtro_tipo_disp != "TODOS":
-                query = query.eq('tipo_dispositivo', filtro_tipo_disp)
-            if filtro_estado_disp != "TODOS":
-                query = query.eq('estado', filtro_estado_disp)
-            
-            response = query.order('created_at', desc=True).execute()
-            df_dispositivos = pd.DataFrame(response.data) if response.data else pd.DataFrame()
+            df_dispositivos = cargar_dispositivos(filtro_tipo_disp, filtro_estado_disp)
             
             # Filtrar por búsqueda
             if buscar_disp and not df_dispositivos.empty:
@@ -1783,11 +4708,11 @@ def panel_mantenedores():
                         nivel_bateria = st.slider("Nivel de Batería (%)", min_value=0, max_value=100, value=100)
                         
                         # Operador a asignar
-                        resp_ops = supabase.table('operadores').select('id, nombre, apellido, codigo_operador').eq('estado', 'ACTIVO').execute()
-                        if resp_ops.data:
+                        ops_directorio = operadores_activos()
+                        if ops_directorio:
                             ops_disponibles = {
                                 f"{op['codigo_operador']} - {op['nombre']} {op['apellido']}": op['id']
-                                for op in resp_ops.data
+                                for op in ops_directorio
                             }
                             operador_asignar = st.selectbox("Asignar a Operador", ["Sin asignar"] + list(ops_disponibles.keys()))
                         else:
@@ -1817,7 +4742,7 @@ def panel_mantenedores():
                                 
                                 supabase.table('dispositivos').insert(nuevo_disp).execute()
                                 st.success("✅ Dispositivo registrado exitosamente")
-                                st.cache_data.clear()
+                                invalidar_cache('dispositivos')
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"❌ Error al registrar dispositivo: {e}")
@@ -1867,7 +4792,7 @@ def panel_mantenedores():
                                     
                                     supabase.table('dispositivos').update(update_data).eq('id', disp_id).execute()
                                     st.success("✅ Dispositivo actualizado")
-                                    st.cache_data.clear()
+                                    invalidar_cache('dispositivos')
                                     st.rerun()
                                 except Exception as e:
                                     st.error(f"❌ Error: {e}")
@@ -1897,16 +4822,16 @@ def panel_mantenedores():
                         else:
                             st.info("📌 Dispositivo no asignado")
                         
-                        # Cargar operadores disponibles
-                        resp_ops = supabase.table('operadores').select('id, nombre, apellido, codigo_operador').eq('estado', 'ACTIVO').execute()
+                        # Operadores disponibles
+                        ops_directorio = operadores_activos()
                         
                         col1, col2 = st.columns(2)
                         
                         with col1:
-                            if resp_ops.data:
+                            if ops_directorio:
                                 ops_map = {
                                     f"{op['codigo_operador']} - {op['nombre']} {op['apellido']}": op['id']
-                                    for op in resp_ops.data
+                                    for op in ops_directorio
                                 }
                                 nuevo_operador = st.selectbox("Asignar a:", ["Sin asignar"] + list(ops_map.keys()))
                                 
@@ -1924,7 +4849,7 @@ def panel_mantenedores():
                                                 'fecha_asignacion': datetime.now().isoformat()
                                             }).eq('id', disp_id).execute()
                                             st.success(f"✅ Dispositivo asignado a {nuevo_operador}")
-                                        st.cache_data.clear()
+                                        invalidar_cache('dispositivos')
                                         st.rerun()
                                     except Exception as e:
                                         st.error(f"❌ Error: {e}")
@@ -1938,7 +4863,7 @@ def panel_mantenedores():
                                             'fecha_asignacion': None
                                         }).eq('id', disp_id).execute()
                                         st.success("✅ Asignación removida")
-                                        st.cache_data.clear()
+                                        invalidar_cache('dispositivos')
                                         st.rerun()
                                     except Exception as e:
                                         st.error(f"❌ Error: {e}")
@@ -1958,15 +4883,14 @@ def panel_configuracion():
                 unsafe_allow_html=True)
     
     # Tabs para Configuración e Ingesta
-    tab_config, tab_ingesta = st.tabs(["⚙️ Parámetros del Sistema", "📤 Ingesta de Datos"])
+    tab_config, tab_ingesta, tab_masiva, tab_simulador = st.tabs(["⚙️ Parámetros del Sistema", "📤 Ingesta de Datos", "📦 Ingesta Masiva", "🛰️ Simulador de Flota"])
     
     # TAB 1: Configuración del Sistema
     with tab_config:
         st.subheader("Configuración del Sistema")
         
         try:
-            response = supabase.table('configuracion_sistema').select('*').execute()
-            df_config = pd.DataFrame(response.data) if response.data else pd.DataFrame()
+            df_config = cargar_configuracion_sistema()
             
             if not df_config.empty:
                 st.write("**Parámetros Configurables:**")
@@ -2016,7 +4940,7 @@ def panel_configuracion():
                                         'valor': str(nuevo_valor)
                                     }).eq('id', config['id']).execute()
                                     st.success("✅ Guardado")
-                                    st.cache_data.clear()
+                                    invalidar_cache('configuracion_sistema')
                                 except Exception as e:
                                     st.error(f"❌ Error: {e}")
                         
@@ -2026,32 +4950,165 @@ def panel_configuracion():
                 
         except Exception as e:
             st.error(f"Error al cargar configuración: {e}")
-            
+
+        with st.expander("🎯 Análisis de Umbrales de Riesgo"):
+            st.caption(
+                "Reclasifica el histórico con umbrales propuestos y muestra cuántas lecturas "
+                "cambiarían de nivel. No modifica los datos guardados."
+            )
+            col_u1, col_u2, col_u3, col_u4 = st.columns(4)
+            with col_u1:
+                umbral_medio = st.number_input("MEDIO desde", 0, 100, UMBRALES_RIESGO[0], key="umbral_medio")
+            with col_u2:
+                umbral_alto = st.number_input("ALTO desde", 0, 100, UMBRALES_RIESGO[1], key="umbral_alto")
+            with col_u3:
+                umbral_critico = st.number_input("CRITICO desde", 0, 100, UMBRALES_RIESGO[2], key="umbral_critico")
+            with col_u4:
+                dias_umbrales = st.number_input("Días de histórico", 1, 365, 30, key="umbral_dias")
+            recalcular_indice = st.checkbox(
+                "Recalcular también el índice con el motor local (aproximación)",
+                help="Reconstruye el índice solo con las columnas guardadas en metricas_procesadas (HRV, SpO2, "
+                     "frecuencia cardíaca, estrés, sueño, horas de turno), así que difiere del índice de n8n. "
+                     "Se compara contra ese mismo índice con los umbrales actuales, no contra la clasificación guardada.",
+                key="umbral_recalcular"
+            )
+
+            if st.button("🔍 Analizar", key="umbral_analizar"):
+                umbrales = [umbral_medio, umbral_alto, umbral_critico]
+                if not umbral_medio < umbral_alto < umbral_critico:
+                    st.error("Los umbrales deben ser crecientes: MEDIO < ALTO < CRITICO")
+                else:
+                    try:
+                        with st.spinner("Cargando métricas..."):
+                            df_recalculo = cargar_metricas_recalculo(int(dias_umbrales))
+                        if df_recalculo.empty:
+                            st.info("No hay métricas en el período")
+                        else:
+                            transicion = comparar_umbrales(df_recalculo, umbrales, recalcular_indice)
+                            total = int(transicion.values.sum())
+                            cambian = total - int(np.trace(transicion.values))
+                            col_r1, col_r2 = st.columns(2)
+                            with col_r1:
+                                st.metric("Lecturas analizadas", f"{total:,}")
+                            with col_r2:
+                                st.metric("Cambian de nivel", f"{cambian:,}",
+                                          f"{cambian / total:.1%}" if total else None, delta_color="off")
+                            if recalcular_indice:
+                                st.caption(
+                                    "⚠️ Aproximación: índice reconstruido con el motor local desde las columnas guardadas; "
+                                    "«Actual» es ese índice con los umbrales vigentes, no la clasificación guardada."
+                                )
+                            st.write("**Actual (filas) → Propuesta (columnas):**")
+                            st.dataframe(transicion, use_container_width=True)
+                    except Exception as e:
+                        st.error(f"Error al analizar umbrales: {e}")
+
     # TAB 2: Ingesta Manual de Datos
     with tab_ingesta:
         st.subheader("📤 Ingesta de Datos de Fatiga")
         st.write("Envíe datos de dispositivos al sistema de procesamiento n8n.")
         
+        spool = obtener_spool()
+        with st.expander(f"📮 Spool de reenvío ({spool.metricas['pendientes']:,} pendientes)",
+                         expanded=spool.metricas['pendientes'] > 0):
+            col_sp1, col_sp2, col_sp3, col_sp4 = st.columns(4)
+            with col_sp1:
+                st.metric("Pendientes", f"{spool.metricas['pendientes']:,}")
+                st.caption(f"Estado: {spool.metricas['estado']}")
+            with col_sp2:
+                st.metric("Entregadas", f"{spool.metricas['entregadas']:,}")
+                st.caption(f"Última entrega: {spool.metricas['ultima_entrega'] or '-'}")
+            with col_sp3:
+                st.metric("Rechazadas (4xx)", f"{spool.metricas['rechazadas']:,}")
+                st.caption(f"Vencidas: {spool.metricas['expiradas']:,} · Descartadas: {spool.metricas['descartadas']:,}")
+            with col_sp4:
+                st.metric("En disco", f"{spool.tamaño_bytes() / 1024 / 1024:,.1f} MB")
+                antiguedad = spool.antiguedad_s()
+                st.caption(f"Más antigua: {antiguedad / 60:,.0f} min" if antiguedad is not None else "Más antigua: -")
+            if spool.metricas['ultimo_error']:
+                st.caption(f"Último error: {spool.metricas['ultimo_error']}")
+            if st.button("🔄 Drenar ahora", key="spool_drenar"):
+                spool.drenar_ahora()
+                st.rerun()
+
+        metricas_ingesta = obtener_metricas_ingesta()
+        instantanea = metricas_ingesta.instantanea()
+        with st.expander(f"📈 Diagnóstico del webhook ({instantanea['peticiones']:,} peticiones)"):
+            latencia = instantanea['latencia_ms']
+            rendimiento = instantanea['rendimiento']
+
+            def formato_ms(valor):
+                return f"{valor:,.0f} ms" if valor is not None else "-"
+
+            col_dg1, col_dg2, col_dg3, col_dg4 = st.columns(4)
+            with col_dg1:
+                st.metric("Latencia p50", formato_ms(latencia['p50']))
+                st.caption(f"Máxima: {formato_ms(latencia['max'] if latencia['n'] else None)}")
+            with col_dg2:
+                st.metric("Latencia p95", formato_ms(latencia['p95']))
+                st.caption(f"p99: {formato_ms(latencia['p99'])}")
+            with col_dg3:
+                st.metric("Espera en cola p95", formato_ms(instantanea['espera_cola_ms']['p95']))
+                ocupacion = instantanea['ocupacion_trabajadores']
+                st.caption(f"Ocupación de trabajadores: {ocupacion:.0%}" if ocupacion is not None else "Ocupación de trabajadores: -")
+            with col_dg4:
+                st.metric("Lecturas/s", f"{rendimiento['lecturas_s']:,.1f}")
+                st.caption(f"{rendimiento['peticiones_s']:,.1f} peticiones/s · "
+                           f"{rendimiento['bytes_s'] / 1024:,.1f} KB/s (últimos {rendimiento['ventana_s']} s)")
+
+            st.info(instantanea['diagnostico'])
+
+            if latencia['n']:
+                col_hist, col_estados = st.columns([3, 1])
+                with col_hist:
+                    df_buckets = pd.DataFrame(latencia['buckets'])
+                    df_buckets['rango'] = df_buckets['hasta'].map(
+                        lambda hasta: f"≤ {hasta:,.0f} ms" if pd.notna(hasta) else f"> {LIMITES_LATENCIA_MS[-1]:,.0f} ms"
+                    )
+                    fig_latencia = px.bar(df_buckets, x='rango', y='n', title="Latencia por petición",
+                                          labels={'rango': 'Latencia', 'n': 'Peticiones'})
+                    fig_latencia.update_layout(height=280, margin=dict(l=20, r=20, t=40, b=20))
+                    st.plotly_chart(fig_latencia, use_container_width=True)
+                with col_estados:
+                    st.write("**Códigos de estado:**")
+                    st.dataframe(
+                        pd.DataFrame(list(instantanea['estados'].items()), columns=['Estado', 'Peticiones']),
+                        hide_index=True, use_container_width=True
+                    )
+                    tamaño = instantanea['tamaño_bytes']
+                    st.caption(f"Cuerpo medio: {tamaño['media'] / 1024:,.1f} KB · p95: {tamaño['p95'] / 1024:,.1f} KB")
+                    st.caption(f"Reintentos: {instantanea['reintentos']:,}")
+
+            col_exp, col_reinicio = st.columns(2)
+            with col_exp:
+                st.download_button(
+                    "📥 Exportar instantánea (JSON)",
+                    data=json.dumps(instantanea, ensure_ascii=False, indent=2),
+                    file_name=f"diagnostico_webhook_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json",
+                    key="diagnostico_exportar"
+                )
+            with col_reinicio:
+                if st.button("🧹 Reiniciar métricas", key="diagnostico_reiniciar"):
+                    metricas_ingesta.reiniciar()
+                    st.rerun()
+
         st.markdown("---")
         
         # ===== PASO 1: Seleccionar Operador =====
         st.markdown("### 1️⃣ Seleccionar Operador")
         
         try:
-            # Cargar operadores activos con dispositivos
-            resp_operadores = supabase.table('operadores')\
-                .select('id, codigo_operador, nombre, apellido')\
-                .eq('estado', 'ACTIVO')\
-                .order('nombre')\
-                .execute()
+            # Operadores activos desde el directorio
+            ops_directorio = operadores_activos()
             
-            if resp_operadores.data:
+            if ops_directorio:
                 operadores_map = {
                     f"{op['nombre']} {op['apellido']} ({op['codigo_operador']})": {
                         'id': op['id'],
                         'codigo': op['codigo_operador']
                     }
-                    for op in resp_operadores.data
+                    for op in ops_directorio
                 }
                 
                 operador_seleccionado = st.selectbox(
@@ -2120,14 +5177,16 @@ def panel_configuracion():
                             # ===== PASO 3: Datos del Dispositivo =====
                             st.markdown("### 3️⃣ Datos del Dispositivo")
                             
-                            # Fecha y hora
-                            col_dt1, col_dt2 = st.columns(2)
+                            # Fecha y hora (time_input llega al minuto; los segundos van aparte)
+                            col_dt1, col_dt2, col_dt3 = st.columns([2, 2, 1])
                             with col_dt1:
                                 ingesta_date = st.date_input("📅 Fecha", value="today", key="ingesta_date")
                             with col_dt2:
                                 ingesta_time = st.time_input("🕐 Hora", value="now", key="ingesta_time")
+                            with col_dt3:
+                                ingesta_segundo = st.number_input("Segundos", 0, 59, 0, key="ingesta_segundo")
                             
-                            timestamp = datetime.combine(ingesta_date, ingesta_time)
+                            timestamp = datetime.combine(ingesta_date, ingesta_time.replace(second=int(ingesta_segundo)))
                             
                             st.markdown("---")
                             
@@ -2156,6 +5215,11 @@ def panel_configuracion():
                             # Obtener valores (simulados o por defecto)
                             datos = st.session_state.datos_simulados or {}
                             
+                            # Identidad de la lectura en edición: se mantiene entre reenvíos del
+                            # formulario y se renueva después de un envío aceptado
+                            if 'ingesta_nonce' not in st.session_state:
+                                st.session_state.ingesta_nonce = uuid.uuid4().hex
+                            
                             # Formulario de datos según tipo de dispositivo
                             with st.form("form_ingesta_datos"):
                                 data_payload = {}
@@ -2354,24 +5418,58 @@ def panel_configuracion():
                                         "timestamp": timestamp.isoformat(),
                                         **data_payload
                                     }
+                                    # Repetir el envío de la misma lectura (doble clic, o volver a enviar
+                                    # tras un envío aceptado) reutiliza su clave y el caché lo descarta
+                                    ultimo_envio = st.session_state.get('ingesta_ultimo_envio')
+                                    if ultimo_envio and ultimo_envio['lectura'] == full_payload:
+                                        full_payload['event_id'] = ultimo_envio['event_id']
+                                    else:
+                                        con_clave_evento(full_payload, st.session_state.ingesta_nonce)
+                                    
+                                    def aceptar_envio():
+                                        st.session_state.ingesta_ultimo_envio = {
+                                            'lectura': {k: v for k, v in full_payload.items() if k != 'event_id'},
+                                            'event_id': full_payload['event_id']
+                                        }
+                                        del st.session_state['ingesta_nonce']
                                     
                                     # Mostrar payload
                                     with st.expander("📋 Ver Payload JSON", expanded=False):
                                         st.json(full_payload)
                                     
-                                    try:
-                                        response = requests.post(N8N_WEBHOOK_URL, json=full_payload)
-                                        
-                                        if response.status_code == 200:
-                                            st.success(f"✅ Datos enviados exitosamente a n8n")
-                                            st.balloons()
-                                            # Limpiar datos simulados después de enviar
-                                            st.session_state.datos_simulados = None
-                                        else:
-                                            st.error(f"❌ Error al enviar. Código: {response.status_code}")
-                                            st.code(response.text)
-                                    except requests.exceptions.RequestException as e:
-                                        st.error(f"❌ Error de conexión: {e}")
+                                    cache_claves = obtener_cache_claves()
+                                    if not cache_claves.registrar(full_payload['event_id']):
+                                        st.info("ℹ️ Esta lectura (mismo dispositivo, operador y fecha/hora) ya fue enviada; no se reenvía.")
+                                    else:
+                                        try:
+                                            response = obtener_pool_webhook().post(
+                                                N8N_WEBHOOK_URL, json=full_payload,
+                                                headers={'Idempotency-Key': full_payload['event_id']}
+                                            )
+                                            obtener_metricas_ingesta().registrar_peticion(
+                                                response.elapsed.total_seconds() * 1000,
+                                                len(response.request.content), response.status_code
+                                            )
+                                            
+                                            if response.is_success:
+                                                st.success(f"✅ Datos enviados exitosamente a n8n")
+                                                st.balloons()
+                                                # Limpiar datos simulados después de enviar
+                                                st.session_state.datos_simulados = None
+                                                aceptar_envio()
+                                            elif not error_definitivo(f"HTTP {response.status_code}"):
+                                                obtener_spool().agregar([full_payload])
+                                                aceptar_envio()
+                                                st.warning(f"⚠️ n8n respondió {response.status_code}. La lectura quedó en el spool y se reenviará automáticamente.")
+                                            else:
+                                                # Rechazada: se puede corregir y volver a enviar
+                                                cache_claves.olvidar(full_payload['event_id'])
+                                                st.error(f"❌ Error al enviar. Código: {response.status_code}")
+                                                st.code(response.text)
+                                        except httpx.HTTPError as e:
+                                            obtener_spool().agregar([full_payload])
+                                            aceptar_envio()
+                                            st.warning(f"⚠️ Error de conexión: {e}. La lectura quedó en el spool y se reenviará automáticamente.")
                     else:
                         st.warning("⚠️ Este operador no tiene dispositivos asignados. Asígnele un dispositivo en el panel de **📋 Mantenedores**.")
             else:
@@ -2379,6 +5477,350 @@ def panel_configuracion():
                 
         except Exception as e:
             st.error(f"Error al cargar datos: {e}")
+    
+    # TAB 3: Ingesta Masiva desde Archivo
+    with tab_masiva:
+        st.subheader("📦 Ingesta Masiva desde Archivo")
+        st.write("Cargue un archivo con lecturas de varios operadores y dispositivos para enviarlas a n8n por lotes.")
+        
+        with st.expander("📋 Formato del archivo", expanded=False):
+            st.markdown(
+                "Columnas obligatorias: `" + "`, `".join(COLUMNAS_LECTURA) + "`. "
+                "Los datos del dispositivo van en columnas con notación de punto, por ejemplo "
+                "`sleep.duration_hours` o `posture.head_nods`. En JSONL también se aceptan "
+                "los objetos anidados tal como los envía el formulario manual."
+            )
+            for tipo, esquema in ESQUEMAS_PAYLOAD.items():
+                st.write(f"**{tipo}:** " + ", ".join(f"`{campo}`" for campo in esquema))
+        
+        archivo = st.file_uploader(
+            "📁 Archivo de lecturas",
+            type=['csv', 'jsonl', 'ndjson', 'parquet'],
+            key="ingesta_masiva_archivo"
+        )
+        
+        if archivo is not None:
+            try:
+                df_lecturas, df_validas, df_errores = leer_y_validar_archivo(
+                    archivo.name, archivo.getvalue(), cargar_directorio_operadores()
+                )
+                
+                col_m1, col_m2, col_m3 = st.columns(3)
+                with col_m1:
+                    st.metric("Filas en archivo", f"{len(df_lecturas):,}")
+                with col_m2:
+                    st.metric("Filas válidas", f"{len(df_validas):,}")
+                with col_m3:
+                    st.metric("Filas con errores", f"{df_errores['fila'].nunique():,}")
+                
+                if not df_errores.empty:
+                    with st.expander("⚠️ Errores de validación", expanded=False):
+                        st.dataframe(df_errores, use_container_width=True, height=300)
+                
+                ruta_ingesta = st.radio(
+                    "Ruta de ingesta", ["Webhook n8n", "Inserción directa"], horizontal=True,
+                    key="ingesta_masiva_ruta",
+                    help="La inserción directa puntúa las lecturas en la app y las escribe en metricas_procesadas por lotes"
+                )
+                lecturas_por_peticion, compresion = 1, None
+                paridad = paridad_vigente()
+                directa_bloqueada = ruta_ingesta == "Inserción directa" and paridad is None
+                if directa_bloqueada:
+                    st.info(
+                        "🔒 La inserción directa se habilita cuando la verificación de paridad con n8n pasa. "
+                        "Envíe primero un archivo por el webhook y use «🔬 Paridad con n8n»."
+                    )
+                elif ruta_ingesta == "Inserción directa":
+                    st.caption(
+                        f"Paridad con n8n verificada el {paridad['momento']:%d/%m/%Y %H:%M} sobre {paridad['lecturas']:,} "
+                        f"lecturas; vale {PARIDAD_VIGENCIA_HORAS} h con la configuración actual del motor"
+                    )
+                if ruta_ingesta == "Webhook n8n":
+                    concurrencia = st.slider(
+                        "Peticiones simultáneas", 1, 128, value=INGESTA_CONCURRENCIA,
+                        key="ingesta_masiva_concurrencia",
+                        help="Máximo de lecturas en vuelo hacia n8n"
+                    )
+                    lotes = st.checkbox(
+                        "Enviar en lotes comprimidos", key="ingesta_masiva_lotes", disabled=not N8N_WEBHOOK_LOTES_URL,
+                        help="Varias lecturas por petición en formato columnar comprimido; el webhook de lotes debe decodificarlo"
+                             + ("" if N8N_WEBHOOK_LOTES_URL else ". Requiere configurar N8N_WEBHOOK_LOTES_URL")
+                    )
+                    if lotes and N8N_WEBHOOK_LOTES_URL:
+                        col_l1, col_l2 = st.columns(2)
+                        with col_l1:
+                            lecturas_por_peticion = st.number_input("Lecturas por lote", 2, 10000, LECTURAS_POR_LOTE, key="ingesta_masiva_tamaño_lote")
+                        with col_l2:
+                            compresion = st.selectbox("Compresión", COMPRESIONES_LOTE, key="ingesta_masiva_compresion")
+                
+                if not df_validas.empty and st.button("🚀 Enviar Lecturas", type="primary", key="ingesta_masiva_enviar",
+                                                      disabled=directa_bloqueada):
+                    payloads, duplicadas = filtrar_duplicadas(construir_payloads(df_validas))
+                    if duplicadas:
+                        st.info(f"🔁 {len(duplicadas):,} lecturas omitidas por duplicadas (repetidas en el archivo o ya enviadas)")
+                    barra = st.progress(0.0, text="Enviando lecturas...")
+                    inicio_envio = datetime.now()
+                    
+                    def al_progresar(enviadas, total, en_cola):
+                        segundos = max((datetime.now() - inicio_envio).total_seconds(), 1e-6)
+                        barra.progress(
+                            enviadas / total,
+                            text=f"{enviadas:,}/{total:,} lecturas · {enviadas / segundos:,.0f} lecturas/s · {en_cola:,} en cola"
+                        )
+                    
+                    if ruta_ingesta == "Webhook n8n":
+                        df_fallidas = enviar_lecturas_webhook(
+                            payloads, al_progresar, concurrencia=concurrencia,
+                            lecturas_por_peticion=int(lecturas_por_peticion), compresion=compresion
+                        )
+                        # Las que fallaron por red o por el servidor quedan en el spool
+                        reintentables = set(df_fallidas.loc[~df_fallidas['error'].map(error_definitivo), 'fila'])
+                        if reintentables:
+                            obtener_spool().agregar([payload for fila, payload in payloads if fila + 1 in reintentables])
+                            st.info(f"📮 {len(reintentables):,} lecturas quedaron en el spool y se reenviarán automáticamente")
+                        no_reintentables = set(df_fallidas['fila']) - reintentables
+                    else:
+                        df_fallidas = ingerir_directo(payloads, al_progresar)
+                        no_reintentables = set(df_fallidas['fila'])
+                    # Lo que no se entregó ni quedó en el spool puede corregirse y reenviarse
+                    cache_claves = obtener_cache_claves()
+                    for fila, payload in payloads:
+                        if fila + 1 in no_reintentables:
+                            cache_claves.olvidar(payload['event_id'])
+                    segundos = max((datetime.now() - inicio_envio).total_seconds(), 1e-6)
+                    
+                    col_r1, col_r2, col_r3 = st.columns(3)
+                    with col_r1:
+                        st.metric("Enviadas", f"{len(payloads) - len(df_fallidas):,}")
+                    with col_r2:
+                        st.metric("Fallidas", f"{len(df_fallidas):,}")
+                    with col_r3:
+                        st.metric("Throughput", f"{len(payloads) / segundos:,.0f} lecturas/s")
+                    
+                    df_reporte = pd.concat([df_errores, df_fallidas], ignore_index=True).sort_values('fila', kind='stable')
+                    if df_reporte.empty:
+                        st.success(f"✅ {len(payloads):,} lecturas enviadas en {segundos:.1f} s")
+                    else:
+                        st.warning(f"⚠️ {df_reporte['fila'].nunique():,} filas no se enviaron")
+                        st.download_button(
+                            label="📥 Descargar Reporte de Errores (CSV)",
+                            data=df_reporte.to_csv(index=False).encode('utf-8'),
+                            file_name=f"errores_ingesta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                            mime="text/csv"
+                        )
+                
+                if not df_validas.empty:
+                    with st.expander("🔬 Paridad con n8n", expanded=False):
+                        st.write(
+                            "Compara la puntuación local con las métricas que n8n escribió para estas mismas "
+                            "lecturas. Envíe primero el archivo por el webhook."
+                        )
+                        if st.button("Verificar paridad", key="ingesta_masiva_paridad"):
+                            df_paridad = verificar_paridad_n8n(construir_payloads(df_validas))
+                            encontradas = int(df_paridad['encontrada'].sum())
+                            coinciden = int(df_paridad['coincide'].sum())
+                            col_p1, col_p2, col_p3 = st.columns(3)
+                            with col_p1:
+                                st.metric("Lecturas en n8n", f"{encontradas:,}/{len(df_paridad):,}")
+                            with col_p2:
+                                st.metric("Coinciden", f"{coinciden:,}")
+                            with col_p3:
+                                st.metric("Difieren", f"{encontradas - coinciden:,}")
+                            paso, motivo = registrar_paridad_n8n(df_paridad)
+                            if paso:
+                                st.success("✅ La puntuación local coincide con n8n; la inserción directa queda habilitada")
+                            else:
+                                st.warning(f"⚠️ La inserción directa sigue bloqueada: {motivo}")
+                            if encontradas > coinciden:
+                                st.dataframe(
+                                    df_paridad[df_paridad['encontrada'] & ~df_paridad['coincide']],
+                                    use_container_width=True, height=300
+                                )
+            except Exception as e:
+                st.error(f"Error al procesar archivo: {e}")
+    
+    with tab_simulador:
+        st.subheader("🛰️ Simulador de Flota")
+        st.write("Genera lecturas continuas de una flota simulada para pruebas de carga y de larga duración.")
+        
+        col_s1, col_s2, col_s3 = st.columns(3)
+        with col_s1:
+            n_operadores = st.number_input("Operadores", min_value=1, max_value=20000, value=100, step=50, key="sim_operadores")
+            usar_reales = st.checkbox("Usar códigos de operadores reales", value=False, key="sim_reales",
+                                      help="Los primeros operadores toman los códigos del directorio; el resto usa SIM-xxxxx")
+        with col_s2:
+            frecuencia_hz = st.number_input("Frecuencia de muestreo (Hz)", min_value=0.01, max_value=10.0, value=1.0, step=0.5, key="sim_frecuencia")
+            aceleracion = st.number_input("Aceleración del reloj (x)", min_value=1.0, max_value=3600.0, value=1.0, step=10.0, key="sim_aceleracion",
+                                          help="Segundos simulados por segundo real; 600x recorre un turno de 10 h en 1 minuto")
+        with col_s3:
+            duracion_s = st.number_input("Duración (s)", min_value=1, max_value=3600, value=60, step=10, key="sim_duracion")
+            destino = st.radio("Destino", ["Webhook n8n", "Stub local", "Archivo JSONL"], index=1, key="sim_destino",
+                               help="El stub local recibe y cuenta las peticiones sin reenviarlas; el webhook de n8n es producción")
+        
+        st.write("**Mezcla de dispositivos** (porcentaje de operadores que porta cada uno)")
+        col_d1, col_d2, col_d3 = st.columns(3)
+        with col_d1:
+            pct_smartwatch = st.slider("⌚ Smartwatch", 0, 100, 100, key="sim_pct_smartwatch")
+        with col_d2:
+            pct_banda = st.slider("🎗️ Banda Antifatiga", 0, 100, 100, key="sim_pct_banda")
+        with col_d3:
+            pct_telematica = st.slider("🚜 Telemática", 0, 100, 100, key="sim_pct_telematica")
+        
+        col_c1, col_c2 = st.columns(2)
+        with col_c1:
+            concurrencia_sim = st.slider("Peticiones simultáneas por proceso", 1, 128, value=INGESTA_CONCURRENCIA, key="sim_concurrencia")
+            # Hacia n8n los sobres solo van a un webhook de lotes configurado
+            sin_webhook_lotes = destino == "Webhook n8n" and not N8N_WEBHOOK_LOTES_URL
+            lotes_sim = st.checkbox(
+                "Enviar en lotes comprimidos", key="sim_lotes", disabled=sin_webhook_lotes,
+                help="Cada tick viaja en sobres columnares comprimidos en vez de una petición por lectura"
+                     + (". Requiere configurar N8N_WEBHOOK_LOTES_URL" if sin_webhook_lotes else "")
+            ) and not sin_webhook_lotes
+            lecturas_por_peticion_sim = st.number_input("Lecturas por lote", 2, 10000, LECTURAS_POR_LOTE, key="sim_tamaño_lote") if lotes_sim else 1
+            compresion_sim = st.selectbox("Compresión", COMPRESIONES_LOTE, key="sim_compresion") if lotes_sim else None
+        with col_c2:
+            procesos_sim = st.number_input("Procesos", min_value=1, max_value=max(os.cpu_count() or 1, 1), value=1, key="sim_procesos",
+                                           help="Reparte los dispositivos entre procesos para superar el límite de un solo proceso")
+        
+        mezcla = {'SMARTWATCH': pct_smartwatch / 100, 'BANDA_ANTIFATIGA': pct_banda / 100, 'TELEMATICA': pct_telematica / 100}
+        dispositivos_estimados = round(n_operadores * sum(mezcla.values()))
+        st.caption(f"≈ {dispositivos_estimados:,} dispositivos · {dispositivos_estimados * frecuencia_hz:,.0f} lecturas/s objetivo")
+        
+        confirmado = True
+        if destino == "Webhook n8n":
+            st.warning(
+                f"⚠️ El webhook de n8n es producción ({N8N_WEBHOOK_URL}): las lecturas simuladas se guardan como "
+                "métricas reales y pueden generar alertas"
+                + (", a nombre de operadores reales." if usar_reales else ".")
+            )
+            confirmado = st.checkbox("Confirmo que quiero enviar la simulación al webhook de producción",
+                                     value=False, key="sim_confirmar_webhook")
+        
+        if dispositivos_estimados > 0 and st.button("▶️ Iniciar Simulación", type="primary", key="sim_iniciar",
+                                                    disabled=not confirmado):
+            try:
+                codigos = [op['codigo_operador'] for op in operadores_activos()] if usar_reales else []
+                simulador = SimuladorFlota(int(n_operadores), mezcla, frecuencia_hz, aceleracion, codigos=codigos)
+                
+                ruta_archivo = None
+                if destino == "Webhook n8n":
+                    clave_destino, url = 'webhook', N8N_WEBHOOK_LOTES_URL if lotes_sim else N8N_WEBHOOK_URL
+                elif destino == "Stub local":
+                    clave_destino, url = 'stub', obtener_stub_local()['url']
+                else:
+                    clave_destino, url = 'archivo', None
+                    os.makedirs(SIMULADOR_DIRECTORIO, exist_ok=True)
+                    ruta_archivo = os.path.join(SIMULADOR_DIRECTORIO, f"flota_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+                
+                barra = st.progress(0.0, text="Simulando...")
+                
+                def al_progresar(estadisticas):
+                    avance = min(estadisticas['ticks'] / max(duracion_s * frecuencia_hz, 1), 1.0)
+                    barra.progress(
+                        avance,
+                        text=(f"{estadisticas['generadas']:,} lecturas · {estadisticas['lecturas_por_s']:,.0f} lecturas/s · "
+                              f"atraso {estadisticas['atraso_s']:.1f} s · {estadisticas['en_cola']:,} en cola")
+                    )
+                
+                resultado = ejecutar_simulacion(
+                    simulador, clave_destino, float(duracion_s), url=url, ruta_archivo=ruta_archivo,
+                    concurrencia=concurrencia_sim, procesos=int(procesos_sim), al_progresar=al_progresar,
+                    lecturas_por_peticion=int(lecturas_por_peticion_sim), compresion=compresion_sim
+                )
+                barra.progress(1.0, text="Simulación terminada")
+                
+                col_r1, col_r2, col_r3, col_r4 = st.columns(4)
+                with col_r1:
+                    st.metric("Generadas", f"{resultado['generadas']:,}")
+                with col_r2:
+                    st.metric("Fallidas", f"{resultado['fallidas']:,}")
+                with col_r3:
+                    st.metric("Throughput", f"{resultado['lecturas_por_s']:,.0f} lecturas/s")
+                with col_r4:
+                    st.metric("Atraso máximo", f"{resultado['atraso_max_s']:.1f} s")
+                
+                if resultado['atraso_max_s'] > 1.0 / frecuencia_hz:
+                    st.warning("⚠️ El destino no sostuvo el ritmo objetivo: los ticks se atrasaron respecto del reloj")
+                if resultado['ultimo_error']:
+                    st.error(f"Último error: {resultado['ultimo_error']}")
+                if ruta_archivo:
+                    st.success(f"✅ Lecturas guardadas en `{ruta_archivo}` (se pueden cargar en Ingesta Masiva)")
+            except Exception as e:
+                st.error(f"Error en la simulación: {e}")
+        
+        st.markdown("---")
+        st.subheader("🧪 Histórico Sintético")
+        st.write("Genera de una vez turnos, métricas y alertas de varios días para poblar la base o para pruebas offline.")
+        
+        col_h1, col_h2, col_h3 = st.columns(3)
+        with col_h1:
+            dias_historico = st.number_input("Días", min_value=1, max_value=365, value=30, key="hist_dias")
+            intervalo_historico = st.number_input("Intervalo entre métricas (s)", min_value=1, max_value=3600, value=60, key="hist_intervalo")
+        with col_h2:
+            semilla_historico = st.number_input("Semilla", min_value=0, value=0, step=1, key="hist_semilla")
+            destino_historico = st.radio("Destino", ["Parquet", "CSV", "Insertar en Supabase"], key="hist_destino")
+        with col_h3:
+            operadores_sinteticos = st.number_input(
+                "Operadores sintéticos", min_value=0, max_value=100000, value=0, step=100, key="hist_operadores",
+                help=("0 = tantos como operadores activos. En archivos, 0 usa los ids de los operadores activos; "
+                      f"Insertar en Supabase siempre usa operadores sintéticos {PREFIJO_OPERADOR_SINTETICO}xxxxx (inactivos), "
+                      "nunca los reales.")
+            )
+        
+        insertar_historico = destino_historico == "Insertar en Supabase"
+        muestras_turno = int(DURACION_TURNO_SIMULADO * 3600 // intervalo_historico)
+        n_operadores_hist = int(operadores_sinteticos) or len(operadores_activos())
+        st.caption(f"≈ {n_operadores_hist * dias_historico * muestras_turno:,} métricas para {n_operadores_hist:,} operadores")
+        
+        confirmado_historico = True
+        if insertar_historico:
+            st.warning(
+                f"⚠️ Se escribirán datos sintéticos en las tablas de Supabase: turnos, métricas y alertas de "
+                f"{n_operadores_hist:,} operadores {PREFIJO_OPERADOR_SINTETICO}xxxxx (se crean inactivos si no existen). "
+                "Solo turnos terminados y alertas ya gestionadas: nada aparece como turno o alerta en curso."
+            )
+            confirmado_historico = st.checkbox("Confirmo que quiero insertar el histórico sintético en Supabase",
+                                               value=False, key="hist_confirmar_insercion")
+        
+        if n_operadores_hist and st.button("🧪 Generar Histórico", type="primary", key="hist_generar",
+                                           disabled=not confirmado_historico):
+            try:
+                if insertar_historico:
+                    ids_historico = asegurar_operadores_sinteticos(n_operadores_hist)
+                elif operadores_sinteticos:
+                    ids_historico = [str(uuid.UUID(int=i + 1)) for i in range(n_operadores_hist)]
+                else:
+                    ids_historico = [op['id'] for op in operadores_activos()]
+                
+                inicio_generacion = datetime.now()
+                with st.spinner("Generando datos..."):
+                    tablas = generar_dataset_sintetico(
+                        ids_historico, int(dias_historico), int(intervalo_historico), int(semilla_historico),
+                        cerrado=insertar_historico
+                    )
+                segundos = (datetime.now() - inicio_generacion).total_seconds()
+                
+                columnas_hist = st.columns(len(tablas))
+                for columna, (nombre, df) in zip(columnas_hist, tablas.items()):
+                    with columna:
+                        st.metric(nombre, f"{len(df):,} filas")
+                st.caption(f"Generado en {segundos:.1f} s")
+                
+                if insertar_historico:
+                    barra = st.progress(0.0, text="Insertando...")
+                    
+                    def al_progresar(tabla, insertadas, total):
+                        barra.progress(insertadas / total, text=f"{tabla}: {insertadas:,}/{total:,} filas")
+                    
+                    insertar_dataset(tablas, al_progresar)
+                    st.success("✅ Histórico insertado en Supabase")
+                else:
+                    directorio = os.path.join(SIMULADOR_DIRECTORIO, f"historico_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+                    with st.spinner("Escribiendo archivos..."):
+                        rutas = exportar_dataset(tablas, destino_historico.lower(), directorio)
+                    st.success("✅ Archivos generados: " + ", ".join(f"`{ruta}`" for ruta in rutas))
+            except Exception as e:
+                st.error(f"Error al generar histórico: {e}")
 
 # ============================================
 # NAVEGACIÓN PRINCIPAL
@@ -2406,7 +5848,10 @@ def main():
         
         # Botón de actualización
         if st.button("🔄 Actualizar Datos"):
-            st.cache_data.clear()
+            # Todas las tablas: cualquiera puede cambiar fuera de la app (ingesta
+            # n8n, otras instancias, ediciones directas en Supabase). Las
+            # escrituras de la propia app siguen invalidando solo su tabla.
+            invalidar_cache(*DEPENDENCIAS_CACHE)
             st.rerun()
         
         st.markdown("---")